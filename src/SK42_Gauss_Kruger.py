@@ -19,6 +19,14 @@ class Projector(object):
     # Параметры зоны Гаусса-Крюгера # Parameters of the Gauss-Kruger zone
     F = np.float64(1.0)             # Масштабный коэффициент # Scale factor
     Lat0 = np.float64(0.0)          # Начальная параллель (в радианах) # Initial parallel (in radians)
+    N0 = np.float64(0.0)            # Условное северное смещение для начальной параллели # Conditional north offset for the initial parallel
+    E0 = np.float64(500000.0)       # Условное восточное смещение для центрального меридиана (без номера зоны) # Conditional eastern offset for the central meridian (less the zone number)
+
+    # coefficients of the series of the meridian arc M, the same for every point and zone
+    M1n = 1+n+5.0/4.0* math.pow(n,2) +5.0/4.0* math.pow(n,3)
+    M2n = 3*n+3* math.pow(n,2) +21.0/8.0* math.pow(n,3)
+    M3n = 15.0/8.0* math.pow(n,2) +15.0/8.0* math.pow(n,3)
+    M4n = 35.0/24.0* math.pow(n,3)
 
     @classmethod
     def SK42_Gauss_Kruger(cls, SK42_LatDegrees, SK42_LongDegrees):
@@ -42,10 +50,10 @@ class Projector(object):
         v = cls.a * cls.F * math.pow(1-cls.e2* math.pow(sinLat,2),-0.5)
         p = cls.a*cls.F*(1-cls.e2) * math.pow(1-cls.e2*math.pow(sinLat,2),-1.5)
         n2 = v/p-1
-        M1 = (1+cls.n+5.0/4.0* math.pow(cls.n,2) +5.0/4.0* math.pow(cls.n,3)) * (Lat-cls.Lat0)
-        M2 = (3*cls.n+3* math.pow(cls.n,2) +21.0/8.0* math.pow(cls.n,3)) * math.sin(Lat - cls.Lat0) * math.cos(Lat + cls.Lat0)
-        M3 = (15.0/8.0* math.pow(cls.n,2) +15.0/8.0* math.pow(cls.n,3))*math.sin(2 * (Lat - cls.Lat0))*math.cos(2 * (Lat + cls.Lat0))
-        M4 = 35.0/24.0* math.pow(cls.n,3) *math.sin(3 * (Lat - cls.Lat0)) * math.cos(3 * (Lat + cls.Lat0))
+        M1 = cls.M1n * (Lat-cls.Lat0)
+        M2 = cls.M2n * math.sin(Lat - cls.Lat0) * math.cos(Lat + cls.Lat0)
+        M3 = cls.M3n*math.sin(2 * (Lat - cls.Lat0))*math.cos(2 * (Lat + cls.Lat0))
+        M4 = cls.M4n *math.sin(3 * (Lat - cls.Lat0)) * math.cos(3 * (Lat + cls.Lat0))
         M = cls.b*cls.F*(M1-M2+M3-M4)
         I = M+N0
         II = v/2 * sinLat * cosLat
@@ -64,3 +72,107 @@ class Projector(object):
         return(zone, N, E)
 
     # end def SK42_Gauss_Kruger
+
+    # Проекция массивов точек # Projection of arrays of points
+    #
+    # as SK42_Gauss_Kruger, for scalars or NumPy arrays of latitudes and longitudes (degrees)
+    #     each point is projected in its own zone, all at once
+    # returns (zone, N, E), arrays (ints and floats) if either argument is an array
+    @classmethod
+    def SK42_Gauss_Kruger_Array(cls, SK42_LatDegrees, SK42_LongDegrees):
+        scalar = np.ndim(SK42_LatDegrees) == 0 and np.ndim(SK42_LongDegrees) == 0
+        SK42_LatDegrees, SK42_LongDegrees = np.broadcast_arrays(np.asarray(SK42_LatDegrees, dtype=np.float64),
+                                                                np.asarray(SK42_LongDegrees, dtype=np.float64))
+        SK42_LongDegrees = np.where(SK42_LongDegrees < 0, 360 + SK42_LongDegrees, SK42_LongDegrees)
+        zone = (SK42_LongDegrees/6.0 + 1).astype(np.int64)
+        Lon0 = cls.centralMeridian(zone)
+
+        Lat = SK42_LatDegrees*math.pi/180.0
+        Lon = SK42_LongDegrees*math.pi/180.0
+
+        sinLat = np.sin(Lat)
+        cosLat = np.cos(Lat)
+        tan2 = np.tan(Lat)**2
+        v, p, n2 = cls.radii(sinLat)
+
+        I = cls.meridianArc(Lat)+cls.N0
+        II = v/2 * sinLat * cosLat
+        III = v/24 * sinLat * cosLat**3 * (5-tan2+9*n2)
+        IIIA = v/720 * sinLat * cosLat**5 * (61-58*tan2+tan2**2)
+        IV = v * cosLat
+        V = v/6 * cosLat**3 * (v/p-tan2)
+        VI = v/120 * cosLat**5 * (5-18*tan2+tan2**2+14*n2-58*tan2*n2)
+
+        dLon = Lon-Lon0
+        N = I+II*dLon**2+III*dLon**4+IIIA*dLon**6
+        E = cls.E0+IV*dLon+V*dLon**3+VI*dLon**5
+
+        if scalar:
+            return int(zone), float(N), float(E)
+        return zone, N, E
+
+    # Обратная проекция # Inverse projection
+    #
+    # from Gauss-Kruger zone, northing and easting (as returned by SK42_Gauss_Kruger)
+    #     to SK42 latitude and longitude (degrees, longitude within -180 to 180)
+    #     scalars or NumPy arrays, each point in its own zone
+    # the latitude of the foot point is found by iteration, to within 0.01mm of northing
+    @classmethod
+    def Gauss_Kruger_SK42(cls, zone, N, E):
+        scalar = all(np.ndim(value) == 0 for value in (zone, N, E))
+        zone, N, E = np.broadcast_arrays(np.asarray(zone), np.asarray(N, dtype=np.float64), np.asarray(E, dtype=np.float64))
+        Lon0 = cls.centralMeridian(zone)
+
+        # широта основания # latitude of the foot point
+        Lat = (N-cls.N0)/(cls.a*cls.F) + cls.Lat0
+        for i in range(100):
+            residual = N-cls.N0-cls.meridianArc(Lat)
+            if not np.any(np.abs(residual) >= 1e-5):
+                break
+            Lat = Lat + residual/(cls.a*cls.F)
+
+        sinLat = np.sin(Lat)
+        secLat = 1/np.cos(Lat)
+        tanLat = np.tan(Lat)
+        tan2 = tanLat**2
+        v, p, n2 = cls.radii(sinLat)
+
+        VII = tanLat/(2*p*v)
+        VIII = tanLat/(24*p*v**3) * (5+3*tan2+n2-9*tan2*n2)
+        IX = tanLat/(720*p*v**5) * (61+90*tan2+45*tan2**2)
+        X = secLat/v
+        XI = secLat/(6*v**3) * (v/p+2*tan2)
+        XII = secLat/(120*v**5) * (5+28*tan2+24*tan2**2)
+        XIIA = secLat/(5040*v**7) * (61+662*tan2+1320*tan2**2+720*tan2**3)
+
+        dE = E-cls.E0
+        Lat = Lat-VII*dE**2+VIII*dE**4-IX*dE**6
+        Lon = Lon0+X*dE-XI*dE**3+XII*dE**5-XIIA*dE**7
+
+        LatDegrees = Lat*180.0/math.pi
+        LongDegrees = np.mod(Lon*180.0/math.pi + 180.0, 360.0) - 180.0
+        if scalar:
+            return float(LatDegrees), float(LongDegrees)
+        return LatDegrees, LongDegrees
+
+    # Центральный меридиан зоны (в радианах) # Central meridian of a zone (in radians)
+    @classmethod
+    def centralMeridian(cls, zone):
+        return (zone*6-3)*math.pi/180
+
+    # Длина дуги меридиана # Length of the meridian arc, from the initial parallel to Lat (radians)
+    @classmethod
+    def meridianArc(cls, Lat):
+        M1 = cls.M1n * (Lat-cls.Lat0)
+        M2 = cls.M2n * np.sin(Lat - cls.Lat0) * np.cos(Lat + cls.Lat0)
+        M3 = cls.M3n * np.sin(2 * (Lat - cls.Lat0)) * np.cos(2 * (Lat + cls.Lat0))
+        M4 = cls.M4n * np.sin(3 * (Lat - cls.Lat0)) * np.cos(3 * (Lat + cls.Lat0))
+        return cls.b*cls.F*(M1-M2+M3-M4)
+
+    # Радиусы кривизны # Radii of curvature (prime vertical v, meridian p) and n2 = v/p-1
+    @classmethod
+    def radii(cls, sinLat):
+        w = 1-cls.e2*sinLat**2
+        v = cls.a * cls.F / np.sqrt(w)
+        p = cls.a*cls.F*(1-cls.e2) / (w*np.sqrt(w))
+        return v, p, v/p-1
@@ -62,6 +62,42 @@ class Translator(object):
     # Differential scale difference
     ms = np.float64(0)
 
+    #
+    # convert from WGS-84 to SK-42, latitude, longitude and altitude at once
+    # each may be a NumPy array (of many points), the sines and cosines of
+    #     each point are computed once for all three
+    # the altitude is shifted by dH at the WGS-84 point, rather than at the SK-42
+    #     point as with SK42_WGS84_Alt, a difference of millimeters
+    # @param Bd latitude
+    # @param Ld longitude
+    # @param H altitude
+    # @return (latitude, longitude, altitude) in SK-42, floats or arrays
+    #
+    @classmethod
+    def WGS84_SK42(cls, Bd, Ld, H):
+        scalar = all(np.ndim(value) == 0 for value in (Bd, Ld, H))
+        Bd, Ld, H = (np.asarray(value, dtype=np.float64) for value in (Bd, Ld, H))
+        B = Bd * (math.pi / 180)
+        L = Ld * (math.pi / 180)
+        sinB, cosB = np.sin(B), np.cos(B)
+        sinL, cosL = np.sin(L), np.cos(L)
+        sin2B = sinB * sinB
+        W = 1 - cls.e2 * sin2B
+        N = cls.a / np.sqrt(W)
+        M = cls.a * (1 - cls.e2) / (W * np.sqrt(W))
+        cos2B = 1 + cls.e2 * (1 - 2 * sin2B) # 1 + e2 * cos(2B)
+        shift = cls.dx * cosL + cls.dy * sinL
+        dB = (cls.ro / (M + H) * (N / cls.a * cls.e2 * sinB * cosB * cls.da + (N ** 2 / cls.a ** 2 + 1) * N * sinB * cosB * cls.de2 / 2 - shift * sinB + cls.dz * cosB)
+              - cls.wx * sinL * cos2B + cls.wy * cosL * cos2B - cls.ro * cls.ms * cls.e2 * sinB * cosB)
+        dL = (cls.ro / ((N + H) * cosB) * (-cls.dx * sinL + cls.dy * cosL)
+              + sinB / cosB * (1 - cls.e2) * (cls.wx * cosL + cls.wy * sinL) - cls.wz)
+        dH = (-cls.a / N * cls.da + N * sin2B * cls.de2 / 2 + shift * cosB + cls.dz * sinB
+              - N * cls.e2 * sinB * cosB * (cls.wx / cls.ro * sinL - cls.wy / cls.ro * cosL) + (cls.a ** 2 / N + H) * cls.ms)
+        lat, lon, alt = Bd - dB / 3600, Ld - dL / 3600, H - dH
+        if scalar:
+            return float(lat), float(lon), float(alt)
+        return lat, lon, alt
+
     @classmethod
     def WGS84_SK42_Lat(cls, Bd, Ld, H):
         return Bd - cls.dB(Bd, Ld, H) / 3600
@@ -8,4 +8,60 @@ version = "OpenAthena v0.1.30-pre-alpha\nLGPL 2.1 + LICENSE ADDENDUM, Some right
 # vector length for each step of getTarget terrain match search (altering may effect accuracy)
 # default: 1.0
 increment = 1.0
+# default search engine used by getTarget.resolveTarget, one of getTarget.ENGINES
+# "decimal" is the original decimal.Decimal search, "float" is a much faster float64 equivalent
+# "adaptive" steps by the DEM post spacing (or more) and bisects the terrain crossing
+# "dda" walks the DEM cells the line passes over and intersects it exactly with each cell's bilinear surface
+# "overview" is "dda" over decimated overviews of the DEM, coarse to fine, and only near the crossing at full resolution
+# default: "decimal"
+engine = "decimal"
+# interpolation kernel for DEM elevations between datapoints, one of parseGeoTIFF.KERNELS
+# "idw" is the original inverse distance weighting, "nearest" takes the nearest datapoint,
+# "bilinear" is continuous and cheap, "bicubic" is smooth but costs about 4x bilinear
+# default: "idw"
+kernel = "idw"
+# GeoTIFF DEMs larger than this many bytes (uncompressed) are not loaded into memory,
+#     instead they are memory-mapped, or decoded a tile at a time as they are used (see lazyDEM.py)
+# default: 1024 * 1024 * 1024 (1 GiB)
+dem_in_memory_limit = 1024 * 1024 * 1024
+# byte budget of the cache of decoded tiles of a lazily read DEM
+# default: 256 * 1024 * 1024 (256 MiB)
+dem_cache_bytes = 256 * 1024 * 1024
+# maximum terrain slope (rise over run) assumed by the "adaptive" engine when widening its steps
+#     far above the terrain. lower values take wider steps, but may step over steeper terrain
+# default: 1.0 (45 degrees)
+max_terrain_slope = 1.0
+# tolerance (horizontal meters) to which the "adaptive" engine bisects the terrain crossing
+# default: 0.1
+bisect_tolerance = 0.1
+# cells (of the level above) either side of the crossing found on a coarser overview
+#     which the "overview" engine searches on the next finer level. wider windows are
+#     slower, but less likely to miss narrow terrain features lost in the coarser overviews
+# default: 4
+overview_window = 4
+# SQLite database of the results of drone images already processed (see resultCache.py),
+#     images unchanged since are answered from it instead of being processed again
+#     e.g. "~/.openathena/results.sqlite3", None to disable
+# default: None
+result_cache = None
+# seconds between scans of the image directory of find_me_mode.py, where it can't be
+#     watched for new images with inotify (i.e. other than Linux), see imageWatcher.py
+# default: 1.0
+watch_poll_interval = 1.0
+# EGM96 geoid grid, to convert altitudes between EGM96 (above mean sea level) and WGS84
+#     (above the ellipsoid) offline, see geoid.py. Either NGA's WW15MGH.DAC or PROJ's
+#     egm96_15.gtx, relative to the src directory. None to use the grid installed by
+#     prepare_geoid.py, if any. Without a grid, altitudes are converted by PROJ instead
+# default: None
+geoid_grid = None
+# vertical datum of the heights of GeoTIFF DEMs, "EGM96" (above mean sea level, e.g. SRTM,
+#     Copernicus, ALOS) or "WGS84" (above the ellipsoid)
+# default: "EGM96"
+dem_vertical_datum = "EGM96"
+# vertical datum in which targets are resolved, "WGS84" or "EGM96", or None to use DEM
+#     heights unconverted. DEMs are converted to it once, when loaded (or by prepare_dem.py,
+#     into the DEM's sidecar), and aircraft altitudes are converted to it, so the line of
+#     sight and the terrain are compared in the same datum
+# default: None
+vertical_datum = None
 STALE_PERIOD = 180
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+demCatalog.py
+
+This file indexes a directory of GeoTIFF Digital Elevation Model tiles
+    (e.g. SRTM or Copernicus 1 degree tiles), and presents them as one
+    seamless 2D array of elevation data
+
+A line of sight may cross from one tile to the next (or start in one and end
+    in another) without any special handling, as every engine of
+    getTarget.resolveTarget only sees the one mosaic of all tiles
+"""
+import glob
+import math
+import os
+import sys
+
+import numpy as np
+from geotiff import GeoTiff
+
+import demSidecar
+import lazyDEM
+
+"""a seamless mosaic of many GeoTIFF DEM tiles, read lazily
+
+    The mosaic is a 2D array on the finest grid of its tiles, covering the
+    bounding box of all of them. It supports the same indexing as
+    lazyDEM.LazyDEM, and can be used anywhere elevation data is expected.
+    Each datapoint of the mosaic is the nearest datapoint of the first tile
+    (by filename) which covers it, so tiles on the same grid (the usual case)
+    are reproduced exactly, and tiles which overlap by a row/column (e.g. SRTM)
+    line up seamlessly. A void of a tile (its GDAL nodata value, or NaN) is
+    filled by the next tile which covers it, if any. Datapoints no tile covers
+    are NaN, and treated as out of bounds by getAltFromLatLon and the engines
+    of getTarget.resolveTarget
+
+    Tiles are found with a grid hash of their bounding boxes (see tilesIn),
+    and read lazily (see lazyDEM.openLazyDEM) with one LRU cache of decoded
+    tiles shared by all of them, so only the parts of the tiles used are in memory
+
+Parameters
+----------
+filenames: list of string
+    filenames of the GeoTIFF DEM tiles, a tile which can't be read is skipped with a warning
+cacheBytes: int
+    optional, byte budget of the shared tile cache, defaults to config.dem_cache_bytes
+"""
+class DEMCatalog(object):
+
+    ndim = 2
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, filenames, cacheBytes=None):
+        self.cache = lazyDEM.TileCache(cacheBytes)
+        self.tiles = []
+        # GDAL nodata value of each tile, or None
+        self.nodata = []
+        for filename in sorted(filenames):
+            try:
+                geoFile = GeoTiff(filename)
+            except Exception as e:
+                print(f'WARNING: skipping DEM tile \'{filename}\': {e}', file=sys.stderr)
+                continue
+            elevationData = lazyDEM.openLazyDEM(geoFile, filename, cache=self.cache)
+            nrows, ncols = elevationData.shape
+            x0 = geoFile.tifTrans.get_x(0,0)
+            dx = geoFile.tifTrans.get_x(1,0) - x0
+            y0 = geoFile.tifTrans.get_y(0,0)
+            dy = geoFile.tifTrans.get_y(0,1) - y0
+            xParams = (x0, x0 + dx * ncols, dx, ncols)
+            yParams = (y0, y0 + dy * nrows, dy, nrows)
+            self.tiles.append((filename, elevationData, xParams, yParams))
+            self.nodata.append(demSidecar.readNodata(filename))
+        if not self.tiles:
+            raise ValueError('no readable GeoTIFF DEM tiles')
+
+        # the mosaic grid, the finest of the tiles over the bounding box of all of them
+        dx = min(abs(xParams[2]) for filename, elevationData, xParams, yParams in self.tiles)
+        dy = -min(abs(yParams[2]) for filename, elevationData, xParams, yParams in self.tiles)
+        x0 = min(xParams[0] for filename, elevationData, xParams, yParams in self.tiles)
+        x1 = max(xParams[1] for filename, elevationData, xParams, yParams in self.tiles)
+        y0 = max(yParams[0] for filename, elevationData, xParams, yParams in self.tiles)
+        y1 = min(yParams[1] for filename, elevationData, xParams, yParams in self.tiles)
+        ncols = int(round((x1 - x0) / dx))
+        nrows = int(round((y1 - y0) / dy))
+        self.xParams = (x0, x0 + dx * ncols, dx, ncols)
+        self.yParams = (y0, y0 + dy * nrows, dy, nrows)
+        self.geoTransform = (x0, dx, 0, y0, 0, dy)
+        self.shape = (nrows, ncols)
+        self.size = nrows * ncols
+        self.nbytes = self.size * self.dtype.itemsize
+
+        # (south, west, north, east) of the area each tile covers, to half a datapoint past its outer datapoints
+        self.bounds = []
+        for filename, elevationData, xParams, yParams in self.tiles:
+            west, east = sorted((xParams[0] - 0.5 * xParams[2], xParams[0] + (xParams[3] - 0.5) * xParams[2]))
+            south, north = sorted((yParams[0] - 0.5 * yParams[2], yParams[0] + (yParams[3] - 0.5) * yParams[2]))
+            self.bounds.append((south, west, north, east))
+
+        # grid hash of the tiles' bounding boxes, cells as large as the largest tile
+        self.cellSize = max(max(east - west, north - south) for south, west, north, east in self.bounds)
+        self.index = {}
+        for i, bounds in enumerate(self.bounds):
+            for cell in self.cellsIn(*bounds):
+                self.index.setdefault(cell, []).append(i)
+
+    """create a DEMCatalog of all GeoTIFF (.tif, .tiff) files in a directory"""
+    @classmethod
+    def fromDirectory(cls, directory, cacheBytes=None):
+        filenames = [filename for filename in glob.glob(os.path.join(directory, '*'))
+                     if filename.split('.')[-1].lower() in ("tif", "tiff")]
+        return cls(filenames, cacheBytes)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        elevation = self[:, :]
+        return elevation if dtype is None else elevation.astype(dtype)
+
+    # the grid hash cells overlapping a bounding box
+    def cellsIn(self, south, west, north, east):
+        return [(row, col) for row in range(math.floor(south / self.cellSize), math.floor(north / self.cellSize) + 1)
+                           for col in range(math.floor(west / self.cellSize), math.floor(east / self.cellSize) + 1)]
+
+    """indices into self.tiles of the tiles whose bounding box overlaps the
+        given one, in order of priority (by filename)
+    """
+    def tilesIn(self, south, west, north, east):
+        candidates = set()
+        for cell in self.cellsIn(south, west, north, east):
+            candidates.update(self.index.get(cell, ()))
+        return sorted(i for i in candidates
+                      if self.bounds[i][0] <= north and south <= self.bounds[i][2]
+                      and self.bounds[i][1] <= east and west <= self.bounds[i][3])
+
+    """filename of the tile used for the elevation at a latitude and longitude, or None"""
+    def tileAt(self, lat, lon):
+        for i in self.tilesIn(lat, lon, lat, lon):
+            filename, elevationData, xParams, yParams = self.tiles[i]
+            col, row = (lon - xParams[0]) / xParams[2], (lat - yParams[0]) / yParams[2]
+            if -0.5 < col < xParams[3] - 0.5 and -0.5 < row < yParams[3] - 0.5:
+                return filename
+        return None
+
+    # nearest datapoint index of a tile for positions along one axis, and which of them it covers
+    def tileIndex(self, positions, params):
+        index = (positions - params[0]) / params[2]
+        covered = (index > -0.5) & (index < params[3] - 0.5)
+        return np.floor(np.where(covered, index, 0.0) + 0.5).astype(np.intp), covered
+
+    # which of the values read from a tile are voids
+    def voids(self, values, i):
+        void = np.isnan(values)
+        if self.nodata[i] is not None:
+            void |= values == self.nodata[i]
+        return void
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2:
+            raise IndexError(f'DEMCatalog is 2D, got {len(key)} indices')
+        row, col = key
+        if isinstance(row, (slice, int, np.integer)) and isinstance(col, (slice, int, np.integer)):
+            return self.window(row, col)
+        return self.gather(row, col)
+
+    # values at (broadcast) integer arrays of rows and columns of the mosaic
+    def gather(self, row, col):
+        row, col = np.broadcast_arrays(np.asarray(row), np.asarray(col))
+        if row.dtype.kind not in "iu" or col.dtype.kind not in "iu":
+            raise IndexError('DEMCatalog only supports integer and slice indices')
+        if row.size and (row.min() < -self.shape[0] or row.max() >= self.shape[0]
+                         or col.min() < -self.shape[1] or col.max() >= self.shape[1]):
+            raise IndexError(f'index out of bounds for DEMCatalog of shape {self.shape}')
+        lat = self.yParams[0] + np.mod(row, self.shape[0]) * self.yParams[2]
+        lon = self.xParams[0] + np.mod(col, self.shape[1]) * self.xParams[2]
+        result = np.full(lat.shape, np.nan, dtype=self.dtype)
+        if lat.size == 0:
+            return result
+        missing = np.ones(lat.shape, dtype=bool)
+        for i in self.tilesIn(lat.min(), lon.min(), lat.max(), lon.max()):
+            filename, elevationData, xParams, yParams = self.tiles[i]
+            tileRow, rowCovered = self.tileIndex(lat, yParams)
+            tileCol, colCovered = self.tileIndex(lon, xParams)
+            use = missing & rowCovered & colCovered
+            if use.any():
+                values = np.asarray(elevationData[tileRow[use], tileCol[use]], dtype=self.dtype)
+                filled = ~self.voids(values, i)
+                use[use] = filled
+                result[use] = values[filled]
+                missing &= ~use
+                if not missing.any():
+                    break
+        return result
+
+    # a window of rows and columns of the mosaic, each an int or a slice
+    def window(self, row, col):
+        rows = np.arange(*row.indices(self.shape[0])) if isinstance(row, slice) else np.array([row % self.shape[0]])
+        cols = np.arange(*col.indices(self.shape[1])) if isinstance(col, slice) else np.array([col % self.shape[1]])
+        if not isinstance(row, slice) and not -self.shape[0] <= row < self.shape[0]:
+            raise IndexError(f'index {row} is out of bounds for axis 0 with size {self.shape[0]}')
+        if not isinstance(col, slice) and not -self.shape[1] <= col < self.shape[1]:
+            raise IndexError(f'index {col} is out of bounds for axis 1 with size {self.shape[1]}')
+        lat = self.yParams[0] + rows * self.yParams[2]
+        lon = self.xParams[0] + cols * self.xParams[2]
+        result = np.full((rows.size, cols.size), np.nan, dtype=self.dtype)
+        if result.size:
+            missing = np.ones(result.shape, dtype=bool)
+            for i in self.tilesIn(lat.min(), lon.min(), lat.max(), lon.max()):
+                filename, elevationData, xParams, yParams = self.tiles[i]
+                tileRow, rowCovered = self.tileIndex(lat, yParams)
+                tileCol, colCovered = self.tileIndex(lon, xParams)
+                if not rowCovered.any() or not colCovered.any():
+                    continue
+                # rows/columns are read as one window of the tile, then picked from it
+                tileRow, tileCol = tileRow[rowCovered], tileCol[colCovered]
+                r0, c0 = tileRow.min(), tileCol.min()
+                block = np.asarray(elevationData[r0:tileRow.max() + 1, c0:tileCol.max() + 1])
+                block = block[np.ix_(tileRow - r0, tileCol - c0)].astype(self.dtype, copy=False)
+                void = self.voids(block, i)
+                area = np.ix_(rowCovered, colCovered)
+                use = missing[area] & ~void
+                result[area] = np.where(use, block, result[area])
+                missing[area] &= void
+                if not missing.any():
+                    break
+        if not isinstance(col, slice):
+            result = result[:, 0]
+        if not isinstance(row, slice):
+            result = result[0]
+        return result
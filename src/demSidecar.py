@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+demSidecar.py
+
+This file reads and writes the preprocessed sidecar of a GeoTIFF DEM
+    (or of a directory of DEM tiles, see demCatalog.py), made by prepare_dem.py
+
+The sidecar is a directory next to the DEM, named like the DEM plus
+    SIDECAR_SUFFIX (e.g. Rome-30m-DEM.tif.ATHENA-DEM). It holds:
+    header.json, the geotransform, shape, dtype, nodata value and vertical
+        datums of the DEM (converted to, and from), the size and modification
+        time of its source file(s),
+        and an index of the acceleration structures below
+    elevation.npy, the elevation data as a raw little-endian NumPy array,
+        already converted to config.vertical_datum, if any
+        (see parseGeoTIFF.normalizeVerticalDatum)
+    pyramid-<bound>-<level>.npy, the levels of the max-elevation pyramids
+        (see parseGeoTIFF.buildMaxPyramid)
+    overview-<level>.npy, the decimated overviews of the elevation data
+        (see parseGeoTIFF.buildOverviews), from level 1 on
+
+Every .npy file is memory-mapped when loaded (np.load(mmap_mode='r')), so
+    loading a DEM from its sidecar takes no time, regardless of its size.
+    A sidecar is only used while it is fresh, i.e. its source file(s) have not
+    changed since it was made, and it was made for the current config.vertical_datum
+"""
+import glob
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import tifffile
+
+import config # OpenAthena global variables
+
+SIDECAR_SUFFIX = ".ATHENA-DEM"
+# increment whenever the layout of the sidecar changes, older sidecars are then ignored
+SIDECAR_VERSION = 2
+
+"""path of the sidecar of a GeoTIFF DEM file or directory of DEM tiles"""
+def sidecarPath(geofilename):
+    return os.path.normpath(geofilename) + SIDECAR_SUFFIX
+
+"""identifies the current contents of a GeoTIFF DEM file or directory of DEM tiles
+    returns a list of [filename, size, modification time (ns)] of each source file
+"""
+def sourceFingerprint(geofilename):
+    if os.path.isdir(geofilename):
+        filenames = sorted(filename for filename in glob.glob(os.path.join(geofilename, '*'))
+                           if filename.split('.')[-1].lower() in ("tif", "tiff"))
+    else:
+        filenames = [geofilename]
+    fingerprint = []
+    for filename in filenames:
+        stat = os.stat(filename)
+        fingerprint.append([os.path.basename(filename), stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+"""the GDAL nodata value of a GeoTIFF DEM file, or None if it has none"""
+def readNodata(geofilename):
+    if os.path.isdir(geofilename):
+        return None
+    with tifffile.TiffFile(geofilename) as tif:
+        tag = tif.pages[0].tags.get(42113) # GDAL_NODATA
+        if tag is None:
+            return None
+        try:
+            return float(str(tag.value).strip('\x00 '))
+        except ValueError:
+            return None
+
+"""name of the bound used by the max-elevation pyramid of an interpolation kernel
+    see parseGeoTIFF.buildMaxPyramid, every kernel but "bicubic" shares one
+"""
+def pyramidBound(kernel):
+    return "bicubic" if kernel == "bicubic" else "corners"
+
+"""write the sidecar of a GeoTIFF DEM file or directory of DEM tiles
+
+    the sidecar is written to a temporary directory first, and then moved
+    into place, replacing any old sidecar
+
+    elevationData is taken to be converted to config.vertical_datum, as loaded
+    by parseGeoTIFF.getGeoFileFromString
+
+Parameters
+----------
+geofilename: string
+    filename of the GeoTIFF DEM, or directory of DEM tiles
+elevationData: 2D array
+    elevation data of the DEM, may be read lazily (see lazyDEM.py),
+    it is copied a band of rows at a time
+geoTransform: tuple
+    (x0, dx, dxdy, y0, dydx, dy) of the DEM, see parseGeoTIFF.getGeoFileFromString
+pyramids: dict
+    optional, {kernel: pyramid} of max-elevation pyramids to include
+overviews: list of 2D array
+    optional, overviews to include, see parseGeoTIFF.buildOverviews
+fingerprint: list
+    optional, see sourceFingerprint, defaults to the current one. Should be
+    taken before elevationData is read, in case the DEM changes meanwhile
+bandRows: int
+    optional, number of rows copied at a time
+"""
+def writeSidecar(geofilename, elevationData, geoTransform, pyramids=None, fingerprint=None, bandRows=None, overviews=None):
+    if fingerprint is None:
+        fingerprint = sourceFingerprint(geofilename)
+    path = sidecarPath(geofilename)
+    tmpPath = f'{path}.tmp-{os.getpid()}'
+    if os.path.exists(tmpPath):
+        shutil.rmtree(tmpPath)
+    os.makedirs(tmpPath)
+
+    nrows, ncols = elevationData.shape
+    if bandRows is None:
+        bandRows = max(1, (1 << 24) // ncols)
+    dtype = np.dtype(elevationData.dtype).newbyteorder('<')
+    elevation = np.lib.format.open_memmap(os.path.join(tmpPath, "elevation.npy"), mode='w+', dtype=dtype, shape=(nrows, ncols))
+    for r0 in range(0, nrows, bandRows):
+        elevation[r0:r0 + bandRows] = elevationData[r0:r0 + bandRows]
+    elevation.flush()
+    del elevation
+
+    header = {
+        "version": SIDECAR_VERSION,
+        "source": fingerprint,
+        "geoTransform": [float(value) for value in geoTransform],
+        "shape": [nrows, ncols],
+        "dtype": dtype.str,
+        "nodata": readNodata(geofilename),
+        "verticalDatum": config.vertical_datum,
+        "demVerticalDatum": config.dem_vertical_datum,
+        "pyramids": {},
+        "overviews": [],
+    }
+    for kernel, pyramid in (pyramids or {}).items():
+        bound = pyramidBound(kernel)
+        levels = []
+        for i, level in enumerate(pyramid):
+            filename = f'pyramid-{bound}-{i}.npy'
+            np.save(os.path.join(tmpPath, filename), np.asarray(level, dtype='<f4'))
+            levels.append(filename)
+        header["pyramids"][bound] = levels
+    # level 0 is the elevation data itself
+    for i, level in enumerate((overviews or [])[1:], 1):
+        filename = f'overview-{i}.npy'
+        np.save(os.path.join(tmpPath, filename), np.asarray(level, dtype='<f4'))
+        header["overviews"].append(filename)
+    with open(os.path.join(tmpPath, "header.json"), 'w') as f:
+        json.dump(header, f, indent=1)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmpPath, path)
+    return path
+
+"""the header of the sidecar of a GeoTIFF DEM file or directory of DEM tiles
+    returns None if there is no sidecar, or it is not fresh (with a warning)
+"""
+def readHeader(geofilename):
+    path = sidecarPath(geofilename)
+    try:
+        with open(os.path.join(path, "header.json")) as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    try:
+        fresh = header.get("version") == SIDECAR_VERSION and header.get("source") == sourceFingerprint(geofilename)
+    except OSError:
+        fresh = False
+    if not fresh:
+        print(f'WARNING: ignoring out of date DEM sidecar \'{path}\', run prepare_dem.py to update it', file=sys.stderr)
+        return None
+    # (None, unconverted, in sidecars older than the option)
+    if str(header.get("verticalDatum")).upper() != str(config.vertical_datum).upper():
+        print(f'WARNING: ignoring DEM sidecar \'{path}\' made for vertical_datum {header.get("verticalDatum")}, '
+              f'run prepare_dem.py to update it', file=sys.stderr)
+        return None
+    # the heights were converted from it, (unconverted if vertical_datum is None)
+    if config.vertical_datum is not None and \
+            str(header.get("demVerticalDatum")).upper() != str(config.dem_vertical_datum).upper():
+        print(f'WARNING: ignoring DEM sidecar \'{path}\' made for dem_vertical_datum {header.get("demVerticalDatum")}, '
+              f'run prepare_dem.py to update it', file=sys.stderr)
+        return None
+    return header
+
+"""load a GeoTIFF DEM file or directory of DEM tiles from its sidecar
+
+    returns (elevationData, geoTransform) like parseGeoTIFF.getGeoFileFromString,
+    where elevationData is memory-mapped, or None if there is no fresh sidecar.
+    The max-elevation pyramids and overviews of the sidecar are found by
+    loadPyramid and loadOverviews
+"""
+def loadSidecar(geofilename):
+    header = readHeader(geofilename)
+    if header is None:
+        return None
+    path = sidecarPath(geofilename)
+    try:
+        elevationData = np.load(os.path.join(path, "elevation.npy"), mmap_mode='r')
+    except (OSError, ValueError) as e:
+        print(f'WARNING: ignoring unreadable DEM sidecar \'{path}\': {e}', file=sys.stderr)
+        return None
+    # remembered for loadPyramid and loadOverviews, (views of elevationData don't keep it)
+    elevationData.sidecar = (path, header)
+    return elevationData, tuple(header["geoTransform"])
+
+"""the max-elevation pyramid of a sidecar's elevation data for an interpolation kernel,
+    memory-mapped, or None if elevationData didn't come from a sidecar, or it has none
+"""
+def loadPyramid(elevationData, kernel):
+    path, header = getattr(elevationData, "sidecar", (None, None))
+    if path is None:
+        return None
+    levels = header["pyramids"].get(pyramidBound(kernel))
+    if levels is None:
+        return None
+    try:
+        return [np.load(os.path.join(path, filename), mmap_mode='r') for filename in levels]
+    except (OSError, ValueError):
+        return None
+
+"""the overviews (see parseGeoTIFF.buildOverviews) of a sidecar's elevation data,
+    memory-mapped, or None if elevationData didn't come from a sidecar, or it has none
+"""
+def loadOverviews(elevationData):
+    path, header = getattr(elevationData, "sidecar", (None, None))
+    if path is None or not header["overviews"]:
+        return None
+    try:
+        return [elevationData] + [np.load(os.path.join(path, filename), mmap_mode='r') for filename in header["overviews"]]
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+dronePose.py
+
+This file finds the camera pose (position and orientation) of a drone image
+    from its XMP and EXIF metadata
+
+Each supported drone is an entry of the table XMP_SCHEMAS, naming the XMP tags
+    which hold each value of the pose. The XMP is scanned once, collecting the
+    value of every tag (attribute or element), from which the pose is taken by
+    the schema of the drone's make, model and metadata format
+
+To add a drone, add its schema to XMP_SCHEMAS, see below
+"""
+import os
+import re
+import sys
+from collections import namedtuple
+
+"""the camera pose of a drone image
+
+y, x: float
+    latitude and longitude of the camera, in decimal degrees
+z: float
+    altitude of the camera, in meters above the vertical datum
+azimuth: float
+    azimuth of the camera, in degrees clockwise from true north
+theta: float
+    angle of depression of the camera, in degrees below the horizon
+datum: string
+    vertical datum of z, "EGM96" (height above mean sea level)
+    or "WGS84" (height above the ellipsoid)
+"""
+Pose = namedtuple("Pose", ["y", "x", "z", "azimuth", "theta", "datum"])
+
+"""the XMP schema of each supported drone, searched in order
+
+make: string
+    EXIF make of the drone, upper case
+models: tuple of string
+    EXIF models supported (upper case), or None for every model of the make
+about: string
+    first word of the rdf:about of the XMP (upper case) for this schema,
+    or None for any. Tells apart metadata formats of the same make
+y, x, z: tuple of string
+    XMP tags of latitude, longitude and altitude, the first found is used,
+    or None to use the EXIF GPS tags instead
+azimuth, theta: tuple of string
+    XMP tags of the camera's yaw and pitch, the first found is used. A tag
+    "parent/name" is the tag name within the element parent
+pitch: string
+    "abs" if theta is the magnitude of the pitch (0 is level, -90 is down), or
+    "complement" if it is 90 minus the pitch (0 is down, 90 is level)
+datum: string
+    vertical datum of z, "EGM96" or "WGS84"
+wgs84Markers: tuple of string
+    if a tag name or value contains any of these (lower case), z is WGS84 instead
+warning: string
+    optional, printed for each image of this schema
+"""
+XMP_SCHEMAS = [
+    {"make": "DJI", "models": None, "about": None,
+     "y": ("drone-dji:GpsLatitude",),
+     "x": ("drone-dji:GpsLongitude",),
+     "z": ("drone-dji:AbsoluteAltitude",),
+     # Gimbal values are absolute, not relative to the Flight values
+     # https://developer.dji.com/iframe/mobile-sdk-doc/android/reference/dji/sdk/Gimbal/DJIGimbal.html
+     "azimuth": ("drone-dji:GimbalYawDegree",),
+     "theta": ("drone-dji:GimbalPitchDegree",),
+     "pitch": "abs", "datum": "EGM96",
+     # RTK altitude is WGS84
+     "wgs84Markers": ("rtkflag",)},
+
+    # More info:
+    #     https://support.skydio.com/hc/en-us/articles/4417425974683-Skydio-camera-and-metadata-overview
+    {"make": "SKYDIO", "models": None, "about": None,
+     "y": ("drone-skydio:Latitude",),
+     "x": ("drone-skydio:Longitude",),
+     "z": ("drone-skydio:AbsoluteAltitude",),
+     # Skydio has multiple frame of reference tags with same children
+     #     (i.e. "Yaw", "Pitch", etc.)
+     "azimuth": ("drone-skydio:CameraOrientationNED/drone-skydio:Yaw",),
+     "theta": ("drone-skydio:CameraOrientationNED/drone-skydio:Pitch",),
+     "pitch": "abs", "datum": "EGM96", "wgs84Markers": ()},
+
+    # Newer Autel firmware versions use similar XMP tags as DJI,
+    #     drone:tag instead of drone-dji:tag
+    {"make": "AUTEL ROBOTICS", "models": None, "about": "DJI",
+     "y": ("drone:GpsLatitude",),
+     # typo in Autel robotics metadata, 'Longtitude' instead of 'Longitude'
+     #     include without typo in case it is fixed in later firmware
+     "x": ("drone:GpsLongtitude", "drone:GpsLongitude"),
+     "z": ("drone:AbsoluteAltitude",),
+     "azimuth": ("drone:GimbalYawDegree",),
+     "theta": ("drone:GimbalPitchDegree",),
+     "pitch": "abs", "datum": "WGS84", "wgs84Markers": (),
+     "warning": "autel"},
+
+    # Older Autel firmware versions use proprietary Autel Robotics XMP tags
+    {"make": "AUTEL ROBOTICS", "models": None, "about": "AUTEL",
+     "y": None, "x": None, "z": None,
+     # I've noticed this can be inaccurate sometimes
+     #     poor calibration of magnetometer for compass heading?
+     "azimuth": ("Camera:Yaw",),
+     # Camera pitch 0 is down, 90 is forward towards horizon
+     "theta": ("Camera:Pitch",),
+     "pitch": "complement", "datum": "EGM96", "wgs84Markers": (),
+     "warning": "autel"},
+
+    # https://developer.parrot.com/docs/pdraw/photo-metadata.html
+    #
+    # There are many different Parrot drones out there, each with different specs
+    #     for instance, the Parrot Disco fixed-wing doesn't have a camera gimbal.
+    #     Each and every drone model will have to be tested for compatibility
+    {"make": "PARROT", "models": ("ANAFI",), "about": None,
+     "y": None, "x": None, "z": None,
+     "azimuth": ("drone-parrot:CameraYawDegree",),
+     "theta": ("drone-parrot:CameraPitchDegree",),
+     "pitch": "abs", "datum": "EGM96",
+     # the Anafi Ai reports WGS84 altitude
+     "wgs84Markers": ("anafiai",)},
+]
+
+WARNINGS = {
+    "autel": ("USER WARNING: in-accuracies have been observed from Autels'\n"
+              "    reported altitude, azimuth, and theta. This may result in bad target res.\n\n"
+              "    PROCEED WITH CAUTION "),
+}
+
+# the start or end of an element, an attribute, or the end of a tag and the text after it
+XMP_TOKEN = re.compile(r"""
+    <(/?)([\w.-]+:[\w.-]+)
+  | ([\w.-]+:[\w.-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')
+  | (/?)>([^<]*)
+""", re.VERBOSE)
+
+"""scan XMP text once for the value of every tag
+    returns a dict {tag: value} of the first value of each tag name, and of
+    each tag within its parent element as "parent/name". A tag is either an
+    attribute (drone-dji:GpsLatitude="...") or an element holding text
+    (<drone-parrot:CameraYawDegree>...</drone-parrot:CameraYawDegree>)
+
+    the XMP need not be well-formed XML (e.g. errant newline sequences)
+
+Parameters
+----------
+xmp_str: String
+    a string containing the contents of XMP metadata
+"""
+def scanXMP(xmp_str):
+    fields = {}
+    # names of the open elements
+    stack = []
+    closing = False
+    for match in XMP_TOKEN.finditer(xmp_str):
+        end, element, attribute, double, single, selfClosing, text = match.groups()
+        if element is not None:
+            closing = bool(end)
+            if not closing:
+                stack.append(element)
+            elif element in stack:
+                del stack[len(stack) - 1 - stack[::-1].index(element):]
+        elif attribute is not None:
+            recordField(fields, stack[-1] if stack else None, attribute, double if double is not None else single)
+        else:
+            if stack and not closing:
+                if selfClosing:
+                    stack.pop()
+                elif text.strip():
+                    recordField(fields, stack[-2] if len(stack) > 1 else None, stack[-1], text.strip())
+            closing = False
+    return fields
+
+def recordField(fields, parent, name, value):
+    fields.setdefault(name, value)
+    if parent is not None:
+        fields.setdefault(parent + "/" + name, value)
+
+"""the schemas of XMP_SCHEMAS for a drone's make and model, or [] if it isn't supported
+
+Parameters
+----------
+make, model: string
+    EXIF make and model of the drone, upper case
+"""
+def schemasFor(make, model):
+    return [schema for schema in XMP_SCHEMAS
+            if schema["make"] == make and (schema["models"] is None or model in schema["models"])]
+
+"""takes a xmp metadata string and exifData dictionary of a drone image,
+returns its Pose by the first of schemas matching its metadata format,
+or None (with an error printed) if it can't be found
+
+Parameters
+----------
+schemas: list of dict
+    schemas of the drone's make and model, see schemasFor
+xmp_str: String
+    a string containing the contents of XMP metadata of the drone image
+exifData: Dict
+    a dictionary containing the EXIF metadata of the drone image,
+    expressed as key:value pairs
+"""
+def parsePose(schemas, xmp_str, exifData):
+    fields = scanXMP(xmp_str)
+    about = (fields.get("rdf:about") or "").replace('"', '').split()
+    about = about[0].upper() if about else ""
+    schema = next((s for s in schemas if s["about"] is None or about.startswith(s["about"])), None)
+    if schema is None:
+        print(f"ERROR: unexpected metadata format: '{about}'", file=sys.stderr)
+        return None
+
+    if schema.get("warning") is not None:
+        printWarning(WARNINGS[schema["warning"]])
+
+    if schema["y"] is None:
+        coords = exifGetYXZ(exifData)
+        if coords is None:
+            return None
+        y, x, z = coords
+    else:
+        y, x, z = (firstField(fields, schema[key]) for key in ("y", "x", "z"))
+    azimuth, theta = (firstField(fields, schema[key]) for key in ("azimuth", "theta"))
+
+    try:
+        y, x, z = float(y), float(x), float(z)
+        azimuth, theta = float(azimuth), float(theta)
+    except (ValueError, TypeError):
+        errstr = f"ERROR: parsing {schema['make']} image failed"
+        errstr += f" with values y: {y} x: {x} z: {z} azimuth: {azimuth} theta: {theta}"
+        print(errstr, file=sys.stderr)
+        return None
+
+    theta = abs(theta)
+    if schema["pitch"] == "complement":
+        theta = 90.0 - theta
+        if theta < 0:
+            return None
+    elif azimuth == 0.0 and theta == 0.0:
+        print(f'ERROR: camera orientation invalid. Your model drone may be incompatible with this software', file=sys.stderr)
+        return None
+
+    datum = schema["datum"]
+    if schema["wgs84Markers"] and any(marker in key.lower() or marker in value.lower()
+                                      for key, value in fields.items() for marker in schema["wgs84Markers"]):
+        datum = "WGS84"
+    return Pose(y, x, z, azimuth, theta, datum)
+
+# the value of the first of tags found, or None
+def firstField(fields, tags):
+    for tag in tags:
+        if fields.get(tag) is not None:
+            return fields[tag]
+    return None
+
+def printWarning(message):
+    warnStr = ""
+    if os.name != 'nt':
+        warnStr += '\033[1;31;m' #ANSI escape sequence, bold and red
+    warnStr += message
+    if os.name != 'nt':
+        warnStr +="\033[0;0m" #ANSI escape sequence, reset terminal to normal colors
+    print(warnStr)
+
+"""takes a python dictionary generated from EXIF data
+return a tuple (y, x, z) of latitude, longitude, and altitude
+in decimal form
+
+Parameters
+----------
+exifData: dict {key : value}
+    a Python dictionary object containing key : value pairs of EXIF tags and their
+    corresponding values
+
+"""
+def exifGetYXZ(exifData):
+    GPSInfo = exifData['GPSInfo']
+    # e.g. N or S
+    latDir = GPSInfo[1].strip().upper()
+    latDeg = GPSInfo[2][0]
+    latMin = GPSInfo[2][1]
+    latSec = GPSInfo[2][2]
+
+    y = latDeg
+    y += (latMin / 60.0)
+    y += (latSec / 3600.0)
+    if latDir == "S":
+        y = y * -1.0
+
+
+    # e.g. E or W
+    lonDir = GPSInfo[3].strip().upper()
+    lonDeg = GPSInfo[4][0]
+    lonMin = GPSInfo[4][1]
+    lonSec = GPSInfo[4][2]
+
+    x = lonDeg
+    x += (lonMin / 60.0)
+    x += (lonSec / 3600.0)
+    if lonDir == "W":
+        x = x * -1.0
+
+    altDir = GPSInfo[5] # GPSInfo.GPSAltitudeRef 0 if positive elevation, 1 if negative
+    z = GPSInfo[6]
+    if altDir == 1:
+        z *= -1.0
+
+    try:
+        y = float(y)
+        x = float(x)
+        z = float(z)
+    except ValueError:
+        print("ERROR: failed to extract GPS data from EXIF values", file=sys.stderr)
+        return None
+    except TypeError:
+        print("ERROR: failed to extract GPS data from EXIF values", file=sys.stderr)
+        return None
+
+    return (y, x, z)
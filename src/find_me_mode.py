@@ -15,6 +15,7 @@ import sys
 import os
 import time
 import datetime
+import heapq
 import math
 from math import sin, asin, cos, atan2, sqrt
 import numpy as np
@@ -25,23 +26,29 @@ from geotiff import GeoTiff
 
 # https://pypi.org/project/mgrs/
 import mgrs # Military Grid ref converter
+import mgrsEncoder
 
 # import tkinter
 
 from PIL import Image
-from PIL import ExifTags
 # from PIL import ImageTk
 
 import config # OpenAthena global variables
+import geoid
 
 import parseImage
-from parseGeoTIFF import getAltFromLatLon, binarySearchNearest, getGeoFileFromUser, getGeoFileFromString
+import resultCache
+import targetPipeline
+from parseGeoTIFF import getAltFromLatLon, binarySearchNearest, getGeoFileFromUser, getGeoFileFromString, buildMaxPyramid, buildOverviews
 from getTarget import *
 
 def find_me_mode():
     images = []
 
     elevationData = None
+    pyramid = overviews = None
+    # results of images already processed, see resultCache.py
+    cache = None
     x0, dx, dxdy, y0, dydx, dy = [None] * 6
     x1 = y1 = None
     nrows = ncols = None
@@ -56,11 +63,13 @@ def find_me_mode():
     alt = None
     mag = 0.0
     directory = None
+    # number of worker processes resolving new images, see targetPipeline.py
+    jobs = 1
 
     # jpl.nasa.gov/edu/news/2016/3/16/how-many-decimals-of-pi-do-we-really-need
     decimal.getcontext().prec = 30
 
-    defaultstr = "usage: find_me_mode.py <dem.tif> [--lat latitude] [--lon longitude] [--mgrs MGRS] \n\t[--alt altitude] [--mag degrees] [--dir directory] [--version]\n\n"
+    defaultstr = "usage: find_me_mode.py <dem.tif> [--lat latitude] [--lon longitude] [--mgrs MGRS] \n\t[--alt altitude] [--mag degrees] [--dir directory] [--jobs N] [--version]\n\n"
     if len(sys.argv) == 1:
         sys.exit(defaultstr + "Try 'find_me_mode.py --help' for more information")
     for i in range(len(sys.argv)):
@@ -74,7 +83,8 @@ def find_me_mode():
             helpstr += "A single fixed location may be specified either using a conventional WGS84 Latitude/Longitude pair or a NATO MGRS (with altitude recommended but optional).\n\n"
             helpstr += "If desired, Magnetic Declination can be optionally specified (using the --mag flag) so that the target bearing will be output in magnetic heading (instead of true heading), e.g. for use with a handheld analog compass. This is not necessary for most digital compasses (e.g. a smartphone)\n\n"
             helpstr += "This mode is only intended for short range distances, otherwise will be inaccurate (curvature of the earth, etc.)\n\n"
-            helpstr += "On startup, find_me_mode.py will scan the specified directory (current working directory by default) for compatible drone images. It will present the newest created photo first, and perform this scan again and provide the most recent, un-viewed image each time the SPACEBAR key is pressed"
+            helpstr += "On startup, find_me_mode.py will scan the specified directory (current working directory by default) for compatible drone images. It will present the newest created photo first, and perform this scan again and provide the most recent, un-viewed image each time the SPACEBAR key is pressed\n\n"
+            helpstr += "New images are resolved in the background by N worker processes (--jobs N, default 1), newest first"
             sys.exit(helpstr)
 
         elif segment.lower() == "--lat":
@@ -132,6 +142,13 @@ def find_me_mode():
             except ValueError:
                 errstr = f"FATAL ERROR: expected WGS84 altitude, got: {alt}"
                 sys.exit(errstr)
+        elif segment.lower() == "--jobs":
+            try:
+                jobs = int(sys.argv[i + 1])
+            except (IndexError, ValueError):
+                jobs = 0
+            if jobs < 1:
+                sys.exit("FATAL ERROR: expected a number of processes (1 or more) after '--jobs'")
         elif segment.lower() == "--dir":
             if i + 1 >= len(sys.argv):
                 sys.exit("FATAL ERROR: expected path after '--dir'")
@@ -147,7 +164,9 @@ def find_me_mode():
                 errstr = f"FATAL ERROR: path {directory} could not be processed"
                 sys.exit(errstr)
 
-        elif segment.split('.')[-1].lower() in ["tif", "dt0", "dt1", "dt2", "dt3", "dt4", "dt5"]:
+        elif (segment.split('.')[-1].lower() in ["tif", "dt0", "dt1", "dt2", "dt3", "dt4", "dt5"]
+              or (os.path.isdir(segment) and sys.argv[i - 1].lower() != "--dir")):
+            # a directory of GeoTIFF DEM tiles is read as one seamless DEM, see demCatalog.py
             ext = segment.split('.')[-1].lower()
             if ext in ["dt0", "dt1", "dt2", "dt3", "dt4", "dt5"]:
                 print(f'FILE FORMAT ERROR: DTED format ".{ext}" not supported. Please use a GeoTIFF ".tif" file!')
@@ -156,6 +175,11 @@ def find_me_mode():
             else:
                 geofilename = segment
                 elevationData, (x0, dx, dxdy, y0, dydx, dy) = getGeoFileFromString(geofilename)
+                # max-elevation pyramid, lets resolveTarget skip over terrain the line of sight can't reach (not used by the "decimal" engine)
+                pyramid = buildMaxPyramid(elevationData) if config.engine != "decimal" else None
+                # decimated overviews, for the coarse-to-fine "overview" engine
+                overviews = buildOverviews(elevationData) if config.engine == "overview" else None
+                cache = resultCache.ResultCache.fromConfig(geofilename)
                 nrows, ncols = elevationData.shape
                 x1 = x0 + dx * ncols
                 y1 = y0 + dy * nrows
@@ -219,136 +243,43 @@ def find_me_mode():
     if directory is None:
         directory = os.getcwd()
 
-    # used as a priority stack, newest dateTime popped first
+    # heap of (captureKey, image path, dateTime, target), newest image popped first
     targets_queued = []
-    files_queued = []
-    files_prosecuted = []
+    # paths of the images already shown
+    files_prosecuted = set()
+
+    # resolves the images already in the directory, then each new image once it is fully written,
+    #     in the background and newest first
+    pipeline = targetPipeline.TargetPipeline(directory, elevationData, xParams, yParams, pyramid, overviews, cache, jobs).start()
 
     Nadjust = decimal.Decimal(0.0)
     Eadjust = decimal.Decimal(0.0)
 
     # rootTk = tkinter.Tk()
 
-    while True: # only break if list is empty after file walk
-        files_queued = []
-        for aTuple in targets_queued:
-            files_queued.append(aTuple[1])
-
-        for root, dirs, files in os.walk(directory):
-            for aFile in files:
-                ext = aFile.split('.')[-1].lower()
-                if ext != 'jpg': # and ext != 'dng': # DNG raws not supported at this time
-                    continue
-                elif aFile in files_prosecuted or aFile in files_queued:
-                    continue
-                else:
-                    if not os.path.exists(aFile):
-                        continue
-                    #from stackoverflow.com/a/14637315
-                    #    if XMP in image is spread in multiple pieces, this
-                    #    approach will fail to extract data in all
-                    #    but the first XMP piece of image
-                    fd = open(aFile, 'rb') #read as binary
-                    d = str(fd.read()) # ...but convert to string
-                    xmp_start = d.find('<x:xmpmeta')
-                    xmp_end = d.find('</x:xmpmeta')
-                    xmp_str = d[xmp_start:xmp_end+12]
-                    fd.close()
-
-                    exifData = {}
-                    img = Image.open(aFile)
-                    exifDataRaw = img._getexif()
-                    if exifDataRaw is None or (xmp_start == xmp_end):
-                        print(f'{aFile} - no usable metadata detected, skipping...')
-                        files_prosecuted.append(aFile)
-                        continue
-                    for tag, value in exifDataRaw.items():
-                        decodedTag = ExifTags.TAGS.get(tag, tag)
-                        exifData[decodedTag] = value
-                    make = exifData["Make"].upper()
-                    make = make.strip()
-                    dateTime = exifData["DateTime"]
-                    model = exifData["Model"].upper()
-                    model = model.strip()
-                    if make[-1] == "\0":
-                        # fix nul terminated string bug
-                        make = make.rstrip("\0")
-
-
-                    print(aFile)
-
-                    if make == "DJI":
-                        sensData = parseImage.handleDJI(xmp_str)
-                        if sensData is not None:
-                            y, x, z, azimuth, theta = sensData
-                            target = resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams)
-                        else:
-                            print(f'ERROR with {aFile}, couldn\'t find sensor data', file=sys.stderr)
-                            print(f'skipping {aFile}', file=sys.stderr)
-                            files_prosecuted.append(aFile)
-                            continue
-                    elif make == "SKYDIO":
-                        sensData = parseImage.handleSKYDIO(xmp_str)
-                        if sensData is not None:
-                            y, x, z, azimuth, theta = sensData
-                            target = resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams)
-                        else:
-                            print(f'ERROR with {aFile}, couldn\'t find sensor data', file=sys.stderr)
-                            print(f'skipping {aFile}', file=sys.stderr)
-                            files_prosecuted.append(aFile)
-                            continue
-                    elif make == "AUTEL ROBOTICS":
-                        sensData = parseImage.handleAUTEL(xmp_str, exifData)
-                        if sensData is not None:
-                            y, x, z, azimuth, theta = sensData
-                            target = resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams)
-                        else:
-                            print(f'ERROR with {aFile}, couldn\'t find sensor data', file=sys.stderr)
-                            print(f'skipping {aFile}', file=sys.stderr)
-                            files_prosecuted.append(aFile)
-                            continue
-                    elif make == "PARROT":
-                        # will whitelist more models as they are tested
-                        if model == "ANAFI":
-                            sensData = parseImage.handlePARROT(xmp_str, exifData)
-                            if sensData is not None:
-                                y, x, z, azimuth, theta = sensData
-                                target = resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams)
-                            else:
-                                print(f'ERROR with {aFile}, couldn\'t find sensor data', file=sys.stderr)
-                                print(f'skipping {aFile}', file=sys.stderr)
-                                files_prosecuted.append(aFile)
-                                continue
-                        else:
-                            # for instance, the parrot disco fixed-wing doesn't
-                            #     have a camera gimbal
-                            print(f'ERROR with {aFile}, Parrot {model} is not supported', file=sys.stderr)
-                            print(f'skipping {aFile}', file=sys.stderr)
-                            files_prosecuted.append(aFile)
-                            continue
-
-                    else:
-                        print(f'ERROR with {aFile}, make {make} not compatible with this program!', file=sys.stderr)
-                        print(f'skipping {aFile}', file=sys.stderr)
-                        continue
-
-                    if target is not None:
-                        item = (dateTime, aFile, target)
-                        targets_queued.append(item)
-                    else:
-                        files_prosecuted.append(aFile)
-        #} end file walk for loop
+    while True: # only break if queue is empty once every image taken in is resolved
+        # wait for the next target only if there is none to show yet
+        for resolved in pipeline.results(wait=not targets_queued):
+            sys.stdout.write(resolved.out)
+            sys.stderr.write(resolved.err)
+            if resolved.result is None or resolved.result.target is None or resolved.path in files_prosecuted:
+                continue
+            heapq.heappush(targets_queued, (resolved.captureKey, resolved.path, resolved.result.dateTime, resolved.result.target))
+        #} end resolved images for loop
 
         if not targets_queued:
+            pipeline.stop()
             break # break out of 'while True' loop if no more targets
         else:
-            targets_queued.sort() # first tuple item is dateTime, so is sorted lexigraphic (and chronologic) order
-            this = targets_queued.pop() # get newest image available after each walk
-            dateTime, imgName = this[0], this[1]
+            # get newest image available
+            key, imgPath, dateTime, target = heapq.heappop(targets_queued)
+            imgName = os.path.relpath(imgPath, directory)
 
 
 
-            literalY, literalX, literalZ = this[2][1], this[2][2], this[2][3]
+            literalY, literalX, literalZ = target[1], target[2], target[3]
+            # altitude of the user is WGS84
+            literalZ = geoid.changeDatum(literalY, literalX, literalZ, parseImage.targetDatum(), "WGS84")
             literalY, literalX, literalZ = decimal.Decimal(literalY), decimal.Decimal(literalX), decimal.Decimal(literalZ)
             brng = haversine_bearing(decimal.Decimal(lon), decimal.Decimal(lat), literalX, literalY)
 
@@ -375,7 +306,7 @@ def find_me_mode():
                 tarY = inverse_haversine((literalY, literalX), Nadjust, 0.0, literalZ)[0]
                 tarX = inverse_haversine((literalY, literalX), Eadjust, math.pi / 2, literalZ)[1]
 
-                tarMGRS = m.toMGRS(tarY, tarX)
+                tarMGRS = mgrsEncoder.encodeOne(tarY, tarX).mgrs
                 print("NATO MGRS🗺️ : " + tarMGRS + " Alt: " + str(int(round(literalZ))) + "m")
 
                 print("")
@@ -520,9 +451,10 @@ def find_me_mode():
                     # label.pack()
                     # rootTk.mainloop()
 
-            files_prosecuted.append(this[1])
+            files_prosecuted.add(imgPath)
 
     #} end while True loop
+
 def clear():
     os.system('cls' if os.name == 'nt' else 'clear')
 
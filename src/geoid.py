@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+geoid.py
+
+This file converts altitudes between the EGM96 geoid (height above mean sea level)
+    and the WGS84 ellipsoid (height above ellipsoid, HAE)
+
+Altitudes are converted with an EGM96 geoid grid, read offline: the grid
+    installed by prepare_geoid.py, or the one of config.geoid_grid. The grid
+    file is memory-mapped once per process, and the geoid
+    height of each point is bilinearly interpolated from it with NumPy. The
+    grid may be NGA's WW15MGH.DAC (15 minute grid, heights in centimeters) or
+    PROJ's egm96_15.gtx. Every conversion accepts NumPy arrays, so the altitudes
+    of many points (or of a whole DEM, see convertDEM) are converted in one call
+
+Without a grid file, altitudes are converted by PROJ, which
+    needs its own copy of the geoid grid. Each pyproj Transformer is built once
+    per process and shared by every thread (pyproj >= 3.1 Transformers are
+    thread-safe)
+"""
+import os
+import sys
+import threading
+
+import numpy as np
+from pyproj import CRS, Transformer # Python interface to PROJ (cartographic projections and coordinate transformations library)
+
+import config # OpenAthena global variables
+
+# WGS84 + EGM96 height
+EPSG_EGM96 = 9707
+# WGS84 3D, height above ellipsoid
+EPSG_WGS84 = 4979
+# {vertical datum: EPSG code}
+DATUMS = {"EGM96": EPSG_EGM96, "WGS84": EPSG_WGS84}
+
+# {(from EPSG code, to EPSG code): Transformer}
+transformers = {}
+transformersLock = threading.Lock()
+
+# {path of the grid file: GeoidGrid, or None if it can't be read}
+grids = {}
+gridsLock = threading.Lock()
+
+# directory in which prepare_geoid.py installs the grid, and relative to which
+#     config.geoid_grid is found
+GRID_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# names of the installed grid, by format
+GRID_NAMES = ("WW15MGH.DAC", "egm96_15.gtx")
+
+# NGA's test points of the EGM96 15 minute grid (latitude, longitude, geoid height in meters),
+#     a grid is rejected by verifyGrid if it's further than TEST_TOLERANCE from any of them
+TEST_POINTS = ((38.6281550, 269.7791550, -31.628),
+               (-14.6212170, 305.0211140, -2.969),
+               (46.8743190, 102.4487290, -43.575),
+               (-23.6174460, 133.8747120, 15.871),
+               (38.6254730, 359.9995000, 50.066),
+               (-0.4667440, 0.0023000, 17.329))
+# meters, allowing for bilinear interpolation instead of NGA's
+TEST_TOLERANCE = 1.0
+
+# shape of NGA's WW15MGH.DAC, rows from 90N to 90S, columns from 0E eastward
+DAC_SHAPE = (721, 1440)
+# header of a .gtx grid: south latitude, west longitude, latitude and longitude
+#     spacing (degrees), rows and columns, big-endian
+GTX_HEADER = np.dtype([("lat0", ">f8"), ("lon0", ">f8"), ("dlat", ">f8"), ("dlon", ">f8"),
+                       ("nrows", ">i4"), ("ncols", ">i4")])
+
+"""a global geoid grid, memory-mapped from its file
+
+Parameters
+----------
+data: array
+    geoid heights, data[i, j] is the height at latitude lat0 + i * dlat
+    and longitude lon0 + j * dlon
+lat0, lon0, dlat, dlon: float
+    latitude and longitude of data[0, 0], and spacing of the rows and columns,
+    in degrees. dlat is negative if the rows are north to south
+scale: float
+    meters per unit of data
+"""
+class GeoidGrid(object):
+
+    def __init__(self, data, lat0, lon0, dlat, dlon, scale=1.0):
+        self.data = data
+        self.lat0, self.lon0, self.dlat, self.dlon = lat0, lon0, dlat, dlon
+        self.scale = scale
+        # columns in 360 degrees of longitude, beyond which the grid wraps around
+        self.wrap = int(round(360.0 / dlon))
+        nrows, ncols = data.shape
+        if ncols < self.wrap or abs(dlat) * (nrows - 1) < 180.0 - 1e-9:
+            raise ValueError("the geoid grid does not cover the globe")
+
+    """read a geoid grid file, WW15MGH.DAC or .gtx
+
+    Parameters
+    ----------
+    path: string
+        filename of the grid
+    """
+    @classmethod
+    def fromFile(cls, path):
+        if path.lower().endswith(".gtx"):
+            header = np.fromfile(path, dtype=GTX_HEADER, count=1)
+            if header.size == 0:
+                raise ValueError("truncated .gtx header")
+            lat0, lon0, dlat, dlon, nrows, ncols = header[0].tolist()
+            if os.path.getsize(path) != GTX_HEADER.itemsize + nrows * ncols * 4:
+                raise ValueError(f"size doesn't match a .gtx grid of {nrows}x{ncols}")
+            data = np.memmap(path, dtype=">f4", mode="r", offset=GTX_HEADER.itemsize, shape=(nrows, ncols))
+            return cls(data, lat0, lon0, dlat, dlon)
+        if os.path.getsize(path) != DAC_SHAPE[0] * DAC_SHAPE[1] * 2:
+            raise ValueError("size doesn't match WW15MGH.DAC")
+        data = np.memmap(path, dtype=">i2", mode="r", shape=DAC_SHAPE)
+        return cls(data, 90.0, 0.0, -0.25, 0.25, scale=0.01)
+
+    """the geoid height (meters above the WGS84 ellipsoid) at each point,
+    bilinearly interpolated, NaN where latitude or longitude is NaN
+
+    Parameters
+    ----------
+    latitude, longitude: array
+        float64 arrays of the same shape, in decimal degrees
+    """
+    def undulation(self, latitude, longitude):
+        nrows = self.data.shape[0]
+        bad = ~(np.isfinite(latitude) & np.isfinite(longitude))
+        if bad.any():
+            latitude, longitude = np.where(bad, 0.0, latitude), np.where(bad, 0.0, longitude)
+        rows = np.clip((latitude - self.lat0) / self.dlat, 0, nrows - 1)
+        i0 = np.minimum(rows.astype(np.intp), nrows - 2)
+        fy = rows - i0
+        cols = np.mod(longitude - self.lon0, 360.0) / self.dlon
+        j0 = cols.astype(np.intp)
+        fx = cols - j0
+        j0 %= self.wrap
+        j1 = (j0 + 1) % self.wrap
+        data = self.data
+        north = data[i0, j0] * (1.0 - fx) + data[i0, j1] * fx
+        south = data[i0 + 1, j0] * (1.0 - fx) + data[i0 + 1, j1] * fx
+        heights = (north * (1.0 - fy) + south * fy) * self.scale
+        return np.where(bad, np.nan, heights)
+
+"""the GeoidGrid of config.geoid_grid, or if None the one installed by prepare_geoid.py,
+read once per process. None if there's none installed, or (with a warning printed once)
+if the grid can't be read
+"""
+def getGrid():
+    key = config.geoid_grid
+    if key in grids:
+        return grids[key]
+    with gridsLock:
+        if key not in grids:
+            grids[key] = readGrid(key)
+        return grids[key]
+
+"""read the GeoidGrid of config.geoid_grid (see getGrid), None if it can't be read
+
+Parameters
+----------
+name: string or None
+    filename of the grid, relative to GRID_DIRECTORY. If None, the installed grid,
+    without a warning if there's none
+"""
+def readGrid(name):
+    if name:
+        path = os.path.join(GRID_DIRECTORY, os.path.expanduser(name))
+    else:
+        path = installedGrid()
+        if path is None:
+            return None
+    try:
+        return GeoidGrid.fromFile(path)
+    except (OSError, ValueError) as e:
+        print(f'WARNING: geoid grid \'{path}\' not used, converting altitudes with PROJ instead: {e}', file=sys.stderr)
+        return None
+
+"""filename of the grid installed by prepare_geoid.py, None if there's none"""
+def installedGrid():
+    for name in GRID_NAMES:
+        path = os.path.join(GRID_DIRECTORY, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+"""raises ValueError if a grid doesn't give EGM96 geoid heights,
+i.e. if it doesn't match TEST_POINTS
+
+Parameters
+----------
+grid: GeoidGrid
+    the grid to verify
+"""
+def verifyGrid(grid):
+    latitude, longitude, expected = (np.array(column, dtype=np.float64) for column in zip(*TEST_POINTS))
+    heights = grid.undulation(latitude, longitude)
+    errors = np.abs(heights - expected)
+    if not np.all(errors <= TEST_TOLERANCE):
+        worst = int(np.argmax(np.where(np.isnan(errors), np.inf, errors)))
+        raise ValueError(f"not an EGM96 grid, geoid height {heights[worst]:.3f}m at "
+                         f"({latitude[worst]}, {longitude[worst]}) instead of {expected[worst]}m")
+
+"""the pyproj Transformer between two CRS, built once per process
+
+Parameters
+----------
+fromEPSG, toEPSG: int
+    EPSG codes of the CRS to transform from and to
+"""
+def getTransformer(fromEPSG, toEPSG):
+    key = (fromEPSG, toEPSG)
+    transformer = transformers.get(key)
+    if transformer is None:
+        with transformersLock:
+            transformer = transformers.get(key)
+            if transformer is None:
+                transformer = Transformer.from_crs(crs_from=CRS.from_epsg(fromEPSG), crs_to=CRS.from_epsg(toEPSG))
+                transformers[key] = transformer
+    return transformer
+
+"""converts EGM96 height (above mean sea level) to WGS84 height above ellipsoid
+returns a float, or an array of the broadcast shape of the arguments if any is an array
+
+Parameters
+----------
+latitude, longitude: float or array
+    WGS84 latitude and longitude, in decimal degrees
+height: float or array
+    EGM96 height, in meters
+"""
+def egmToWGS(latitude, longitude, height):
+    return convertHeight(EPSG_EGM96, EPSG_WGS84, latitude, longitude, height)
+
+"""converts WGS84 height above ellipsoid to EGM96 height (above mean sea level)
+returns a float, or an array of the broadcast shape of the arguments if any is an array
+
+Parameters
+----------
+latitude, longitude: float or array
+    WGS84 latitude and longitude, in decimal degrees
+height: float or array
+    WGS84 height above ellipsoid, in meters
+"""
+def wgsToEGM(latitude, longitude, height):
+    return convertHeight(EPSG_WGS84, EPSG_EGM96, latitude, longitude, height)
+
+"""converts heights from one vertical datum to another, "EGM96" or "WGS84"
+returns them unchanged if the datums are the same, otherwise as egmToWGS or wgsToEGM
+
+Parameters
+----------
+latitude, longitude, height: float or array
+    see egmToWGS
+fromDatum, toDatum: string
+    vertical datums of height, and to convert it to
+"""
+def changeDatum(latitude, longitude, height, fromDatum, toDatum):
+    if datumEPSG(fromDatum) == datumEPSG(toDatum):
+        return height
+    return convertHeight(datumEPSG(fromDatum), datumEPSG(toDatum), latitude, longitude, height)
+
+"""converts the heights of a whole DEM from EGM96 to WGS84 height above ellipsoid
+returns a new float array, NaN (no data) stays NaN
+
+Parameters
+----------
+elevationData: array
+    the DEM, see parseGeoTIFF.getGeoFileFromString, may be read lazily
+    (see lazyDEM.py), it is converted a band of rows at a time
+xParams, yParams: tuple
+    (x0, x1, dx, ncols) and (y0, y1, dy, nrows) of the DEM
+out: array
+    optional, float array of the same shape to write the heights to
+    (e.g. a memory-mapped file), instead of a new array
+nodata: float
+    optional, nodata value of the DEM, left unchanged
+bandRows: int
+    optional, rows converted at once
+"""
+def demToWGS(elevationData, xParams, yParams, out=None, nodata=None, bandRows=256):
+    return convertDEM(elevationData, xParams, yParams, "EGM96", "WGS84", out, nodata, bandRows)
+
+"""converts the heights of a whole DEM from WGS84 height above ellipsoid to EGM96
+returns a new float array, NaN (no data) stays NaN
+
+Parameters
+----------
+elevationData, xParams, yParams, out, nodata, bandRows:
+    see demToWGS
+"""
+def demToEGM(elevationData, xParams, yParams, out=None, nodata=None, bandRows=256):
+    return convertDEM(elevationData, xParams, yParams, "WGS84", "EGM96", out, nodata, bandRows)
+
+"""converts the heights of a whole DEM from one vertical datum to another, see changeDatum
+returns a new float array (or out), NaN (no data) stays NaN
+
+Parameters
+----------
+elevationData, xParams, yParams, out, nodata, bandRows:
+    see demToWGS
+fromDatum, toDatum: string
+    vertical datums of the DEM, and to convert it to
+"""
+def convertDEM(elevationData, xParams, yParams, fromDatum, toDatum, out=None, nodata=None, bandRows=256):
+    x0, x1, dx, ncols = xParams
+    y0, y1, dy, nrows = yParams
+    if out is None:
+        out = np.empty(elevationData.shape, dtype=np.result_type(elevationData.dtype, np.float32))
+    longitude = x0 + dx * np.arange(ncols, dtype=np.float64)
+    for row in range(0, nrows, bandRows):
+        band = np.asarray(elevationData[row:row + bandRows], dtype=np.float64)
+        latitude = y0 + dy * np.arange(row, row + band.shape[0], dtype=np.float64)
+        latitude, bandLongitude = np.broadcast_arrays(latitude[:, np.newaxis], longitude[np.newaxis, :])
+        converted = changeDatum(latitude, bandLongitude, band, fromDatum, toDatum)
+        if nodata is not None:
+            converted = np.where(band == nodata, band, converted)
+        out[row:row + bandRows] = converted
+    return out
+
+# EPSG code of a vertical datum, "EGM96" or "WGS84"
+def datumEPSG(datum):
+    epsg = DATUMS.get(str(datum).upper())
+    if epsg is None:
+        raise ValueError(f'unknown vertical datum \'{datum}\', expected one of {", ".join(DATUMS)}')
+    return epsg
+
+# with the geoid grid if available, by PROJ otherwise
+def convertHeight(fromEPSG, toEPSG, latitude, longitude, height):
+    grid = getGrid()
+    if grid is None:
+        return transformHeight(fromEPSG, toEPSG, latitude, longitude, height)
+    scalar, (latitude, longitude, height) = asArrays(latitude, longitude, height)
+    sign = 1.0 if toEPSG == EPSG_WGS84 else -1.0
+    newHeight = height + sign * grid.undulation(latitude, longitude)
+    if scalar:
+        return float(newHeight)
+    return newHeight
+
+def transformHeight(fromEPSG, toEPSG, latitude, longitude, height):
+    scalar, (latitude, longitude, height) = asArrays(latitude, longitude, height)
+    newLatitude, newLongitude, newHeight = getTransformer(fromEPSG, toEPSG).transform(latitude, longitude, height)
+    if scalar:
+        return float(newHeight)
+    return np.asarray(newHeight, dtype=np.float64)
+
+# whether all are scalars, and float64 (e.g. of Decimal) copies broadcast together,
+#     which PROJ may transform in place
+def asArrays(*values):
+    scalar = all(np.ndim(value) == 0 for value in values)
+    arrays = np.broadcast_arrays(*(np.asarray(value, dtype=np.float64) for value in values))
+    return scalar, [np.array(array) for array in arrays]
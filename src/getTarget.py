@@ -14,7 +14,7 @@ import time
 import matplotlib.pyplot as plt
 # from osgeo import gdal # Lots of good GeoINT stuff
 from geotiff import GeoTiff # alternative to gdal for parsing GeoTiff .tif files
-import mgrs # Military Grid ref converter
+import mgrsEncoder # Military Grid ref converter
 import math
 from math import sin, asin, cos, atan2, sqrt
 import numpy as np
@@ -28,6 +28,23 @@ import parseGeoTIFF
 
 from cursor_on_target import create_and_send_cot
 
+# names of the search engines that resolveTarget may use
+ENGINES = ("decimal", "float", "adaptive", "dda", "overview")
+
+# status codes of each line of sight resolved by resolveTargetBatch
+STATUS_OK = 0 # target resolved
+STATUS_OUT_OF_BOUNDS = 1 # aircraft, or line of sight, outside of the GeoTIFF dataset
+STATUS_UNDERGROUND = 2 # aircraft below terrain, bad sensor or elevation data
+STATUS_INVALID = 3 # NaN or infinite sensor data
+
+# one result of resolveTargetBatch, same fields as the tuple returned by resolveTarget
+TARGET_DTYPE = np.dtype([("status", np.int8),
+                         ("finalDist", np.float64),
+                         ("y", np.float64),
+                         ("x", np.float64),
+                         ("z", np.float64),
+                         ("terrainAlt", np.float64)])
+
 """get the pos of current subject of UAS camera
        data entry is done manually
        implementation in resolveTarget function
@@ -43,11 +60,12 @@ def getTarget():
     elif ("--help" in sys.argv or "-h" in sys.argv or
         "-H" in sys.argv or "H" in sys.argv or "help" in sys.argv):
         #
-        outstr = "usage: getTarget.py [Rome-30m-DEM.tif]\n\ngetTarget.py may take a GeoTIFF DEM (.tif) and manual sensor metadata as input,\nprovides a target match location as output (if possible)"
+        outstr = "usage: getTarget.py [Rome-30m-DEM.tif | DEM-tile-directory]\n\ngetTarget.py may take a GeoTIFF DEM (.tif) and manual sensor metadata as input,\nprovides a target match location as output (if possible)"
         sys.exit(outstr)
     elif 1 < len(sys.argv) and len(sys.argv) < 3:
         ext = sys.argv[1].split('.')[-1].lower()
-        if ext != "tif":
+        # (a directory of GeoTIFF DEM tiles is read as one seamless DEM, see demCatalog.py)
+        if ext != "tif" and not os.path.isdir(sys.argv[1]):
             if ext in ["dt0", "dt1", "dt2", "dt3", "dt4", "dt5"]:
                 print(f'FILE FORMAT ERROR: DTED format ".{ext}" not supported. Please use a GeoTIFF ".tif" file!')
             outstr = f'FATAL ERROR: got argument: {sys.argv[1]}, expected GeoTIFF ".tif" DEM!'
@@ -63,6 +81,10 @@ def getTarget():
     print(elevationData)
 
     nrows, ncols = elevationData.shape
+    # max-elevation pyramid, lets resolveTarget skip over terrain the line of sight can't reach (not used by the "decimal" engine)
+    pyramid = parseGeoTIFF.buildMaxPyramid(elevationData) if config.engine != "decimal" else None
+    # decimated overviews, for the coarse-to-fine "overview" engine
+    overviews = parseGeoTIFF.buildOverviews(elevationData) if config.engine == "overview" else None
 
     x1 = x0 + dx * ncols
     y1 = y0 + dy * nrows
@@ -92,7 +114,7 @@ def getTarget():
         print(f"\nWarning: using value: {abs(theta)}\n")
 
     # most of the complex logic is done here
-    target = resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams)
+    target = resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams, pyramid=pyramid, overviews=overviews)
 
     if target is None:
         print(f'\n ERROR: bad calculation!\n')
@@ -111,20 +133,14 @@ def getTarget():
         print(f'Google Maps: https://maps.google.com/?q={round(tarY,6)},{round(tarX,6)}\n')
         # en.wikipedia.org/wiki/Military_Grid_Reference_System
         # via github.com/hobuinc/mgrs
-        m = mgrs.MGRS()
-        targetMGRS = m.toMGRS(tarY, tarX)
-        targetMGRS10m = m.toMGRS(tarY,tarX, MGRSPrecision=4)
-        targetMGRS100m = m.toMGRS(tarY, tarX, MGRSPrecision=3)
-        gzdEndIndex = 2
-        while(targetMGRS[gzdEndIndex].isalpha()):
-            gzdEndIndex += 1
+        targetMGRS = mgrsEncoder.encodeOne(tarY, tarX)
         # ANSI escape sequences \033[ for underlining: stackabuse.com/how-to-print-colored-text-in-python
         if os.name != 'nt':
-            print(f'NATO MGRS: {targetMGRS[0:gzdEndIndex]}\033[4m{targetMGRS[gzdEndIndex:]}\033[0;0m EGM96 Alt: \033[4m{math.ceil(tarZ)}\033[0;0m')
+            print(f'NATO MGRS: {targetMGRS.gridZone}{targetMGRS.square}\033[4m{targetMGRS.digits}\033[0;0m EGM96 Alt: \033[4m{math.ceil(tarZ)}\033[0;0m')
         else:
-            print(f'NATO MGRS: {targetMGRS} EGM96 Alt: {math.ceil(tarZ)}')
-        print(f'MGRS 10m: {targetMGRS10m}')
-        print(f'MGRS 100m: {targetMGRS100m}\n')
+            print(f'NATO MGRS: {targetMGRS.mgrs} EGM96 Alt: {math.ceil(tarZ)}')
+        print(f'MGRS 10m: {targetMGRS.mgrs10m}')
+        print(f'MGRS 100m: {targetMGRS.mgrs100m}\n')
 
         # targetSK42Lat = converter.WGS84_SK42_Lat(float(tarY), float(tarX), float(tarZ))
         # targetSK42Lon = converter.WGS84_SK42_Long(float(tarY), float(tarX), float(tarZ))
@@ -208,9 +224,49 @@ yParams: tuple
     y1 is minimum lat. of dataset
     dy is the lat. change per datapoint increment +y
     nrows is the number of datapoints per column of the dataset
+engine: string
+    optional, which search engine to use, one of ENGINES
+    "decimal" is the original decimal.Decimal ray march
+    "float" is a float64 NumPy ray march, see resolveTargetFloat
+    "adaptive" is a coarse-to-fine float64 search, see resolveTargetFloat
+    "dda" is an exact DEM cell traversal, see resolveTargetFloat
+    "overview" is a coarse-to-fine "dda" over the DEM's overviews, see resolveTargetFloat
+    defaults to config.engine
+pyramid: list of 2D array
+    optional, max-elevation pyramid of elevationData from parseGeoTIFF.buildMaxPyramid
+    if given, the float engines skip over the parts of the line that are
+    provably above all terrain (see skipAboveTerrain). Ignored by the "decimal" engine
+    must be built with the same interpolation kernel
+kernel: string
+    optional, interpolation kernel of the terrain, one of parseGeoTIFF.KERNELS
+    see parseGeoTIFF.getAltFromLatLonArray for their cost and accuracy
+    the "dda" engine always intersects the bilinear surface, and only uses
+    the kernel for the terrain directly below the aircraft
+    defaults to config.kernel
+overviews: list of 2D array
+    optional, overviews of elevationData from parseGeoTIFF.buildOverviews,
+    used by the "overview" engine, which builds them if not given
 
 """
-def resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams):
+def resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams, engine=None, pyramid=None, kernel=None, overviews=None):
+    if engine is None:
+        engine = config.engine
+    if kernel is None:
+        kernel = config.kernel
+    if engine not in ENGINES:
+        print(f'ERROR: unknown resolveTarget engine "{engine}", expected one of {ENGINES}', file=sys.stderr)
+        return None
+    elif kernel not in parseGeoTIFF.KERNELS:
+        print(f'ERROR: unknown interpolation kernel "{kernel}", expected one of {parseGeoTIFF.KERNELS}', file=sys.stderr)
+        return None
+    elif engine != "decimal":
+        target = resolveTargetFloat(y, x, z, azimuth, theta, elevationData, xParams, yParams, engine, pyramid, kernel, overviews)
+        if target is not None and target[3] is not None:
+            finalDist, curY, curX, curZ, terrainAlt = target
+            # send CoT message after resolving target location
+            create_and_send_cot(curX, curY, curZ, finalDist)
+        return target
+
     # jpl.nasa.gov/edu/news/2016/3/16/how-many-decimals-of-pi-do-we-really-need
     decimal.getcontext().prec = 30
     y = decimal.Decimal(y)
@@ -227,9 +283,10 @@ def resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams):
     #     if so, skip iterative search b/c target is directly
     #     below us:
     if math.isclose((math.pi / 2), theta):
-        terrainAlt = parseGeoTIFF.getAltFromLatLon(y, x, xParams, yParams, elevationData)
+        terrainAlt = parseGeoTIFF.getAltFromLatLon(y, x, xParams, yParams, elevationData, kernel)
         if terrainAlt is None:
             return None
+        terrainAlt = decimal.Decimal(terrainAlt)
         finalDist = z - terrainAlt
         if finalDist < 0:
             print(f'\n ERROR: bad calculation!\n')
@@ -289,7 +346,7 @@ def resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams):
     curY = decimal.Decimal(y)
     curX = decimal.Decimal(x)
     curZ = decimal.Decimal(z)
-    groundAlt = parseGeoTIFF.getAltFromLatLon(curY, curX, xParams, yParams, elevationData)
+    groundAlt = parseGeoTIFF.getAltFromLatLon(curY, curX, xParams, yParams, elevationData, kernel)
     if groundAlt is None:
         print(f'ERROR: resolveTarget ran out of bounds at {round(curY,4)}, {round(curX,4)}, {round(curZ,1)}m', file=sys.stderr)
         print('ERROR: Please ensure target location is within GeoTIFF dataset bounds', file=sys.stderr)
@@ -297,14 +354,14 @@ def resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams):
     elif (curZ < float(groundAlt)):
         print(f'ERROR: resolveTarget failed, bad sensor or elevation data.\nInitial drone altitude: {round(curZ)}m, terrain altitude: {groundAlt}m\nThis image is unusable.', file=sys.stderr)
         return None
-    altDiff = curZ - groundAlt
+    altDiff = curZ - decimal.Decimal(groundAlt)
     while altDiff > threshold:
-        groundAlt = parseGeoTIFF.getAltFromLatLon(curY, curX, xParams, yParams, elevationData)
+        groundAlt = parseGeoTIFF.getAltFromLatLon(curY, curX, xParams, yParams, elevationData, kernel)
         if groundAlt is None:
             print(f'ERROR: resolveTarget ran out of bounds at {round(curY,4)}, {round(curX,4)}, {round(curZ,1)}m', file=sys.stderr)
             print('ERROR: Please ensure target location is within GeoTIFF dataset bounds', file=sys.stderr)
             return None
-        altDiff = curZ - groundAlt
+        altDiff = curZ - decimal.Decimal(groundAlt)
 
         avgAlt = curZ
         # deltaz should always be negative
@@ -330,13 +387,839 @@ def resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams):
     # simple pythagorean theorem
     # may be inaccurate for very very large horizontal distances
     finalDist = sqrt(finalHorizDist ** 2 + finalVertDist ** 2)
-    terrainAlt = parseGeoTIFF.getAltFromLatLon(curY, curX, xParams, yParams, elevationData)
+    terrainAlt = decimal.Decimal(parseGeoTIFF.getAltFromLatLon(curY, curX, xParams, yParams, elevationData, kernel))
 
     # send CoT message after resolving target location
     create_and_send_cot(curX, curY, curZ, finalDist)
 
     return((finalDist, curY, curX, curZ, terrainAlt))
 
+"""float64 counterpart of resolveTarget's "decimal" engine,
+given sensor data, returns a tuple (distance, y, x, z, terrainAlt) of floats
+
+The constructed line is searched by one of the following engines:
+
+"float" follows the same search as the decimal engine (see marchFixed)
+
+Tolerance against the decimal engine (default config.increment):
+    both engines stop on the same step, unless a step's altitude
+    difference lands within ~1e-6m of the threshold, in which case they may
+    differ by one step (config.increment meters along the line).
+    On the same step, the returned lat/lon, distance and altitudes
+    agree within 2mm per km of range (e.g. < 0.01m at 6km)
+
+"adaptive" takes steps of at least the DEM post spacing and bisects
+the crossing of the line below the terrain (see marchAdaptive)
+
+"dda" walks the DEM cells crossed by the line and solves its exact
+crossing with a bilinear terrain surface (see marchDDA)
+
+"overview" does the same, but searches the DEM's overviews coarse to fine,
+and the full resolution DEM only near the crossing (see marchOverview)
+
+Tolerance against the decimal engine:
+    the decimal engine stops once the line is within post_spacing/8 above the
+    terrain, plus one more step. The adaptive engine instead returns the
+    crossing itself (within config.bisect_tolerance), so its range is
+    usually *longer*, by up to about (post_spacing/8) / sin(theta) meters,
+    e.g. about 10m for a 20 deg shot over a 30m DEM.
+    It takes one to two orders of magnitude fewer terrain lookups
+
+Tolerance of the dda engine:
+    exact (to float64 rounding) for its bilinear terrain surface. The
+    decimal, float and adaptive engines instead use the surface of the chosen
+    interpolation kernel. The default, the inverse distance weighted surface
+    of parseGeoTIFF.getAltFromLatLon, differs from the bilinear surface by up
+    to a few meters within a cell on steep terrain, so compared to the adaptive
+    engine, expect differences on the order of (surface difference) / tan(theta)
+    meters of range. With kernel "bilinear", all engines share the same surface
+
+Parameters
+----------
+same as resolveTarget
+engine: string
+    one of "float", "adaptive", "dda" or "overview"
+pyramid: list of 2D array
+    optional, see resolveTarget
+kernel: string
+    optional, see resolveTarget
+overviews: list of 2D array
+    optional, see resolveTarget
+"""
+def resolveTargetFloat(y, x, z, azimuth, theta, elevationData, xParams, yParams, engine="float", pyramid=None, kernel=None, overviews=None):
+    y, x, z = float(y), float(x), float(z)
+    # convert azimuth and theta from degrees to radians
+    azimuth, theta = math.radians(float(azimuth)), math.radians(float(theta))
+    azimuth = normalize(azimuth) # 0 <= azimuth < 2pi
+    theta = abs(theta) # pitch is technically neg., but we use pos.
+
+    # check if angle is exactly (1e-09) straight downwards,
+    #     if so, skip iterative search b/c target is directly
+    #     below us:
+    if math.isclose((math.pi / 2), theta):
+        terrainAlt = float(parseGeoTIFF.getAltFromLatLonArray(y, x, xParams, yParams, elevationData, kernel))
+        if math.isnan(terrainAlt):
+            return None
+        finalDist = z - terrainAlt
+        if finalDist < 0:
+            print(f'\n ERROR: bad calculation!\n')
+            return None
+        print(f'\nWARNING: theta is exactly 90 deg, just using GPS lat/lon\n')
+        return((finalDist, y, x, None, terrainAlt))
+
+    # camera is facing backwards, see resolveTarget
+    if theta > (math.pi / 2):
+        azimuth = normalize(azimuth + math.pi)
+        theta = math.pi - theta
+        print(f'\nWARNING: theta > 90 deg, if target is not behind the aircraft then something is wrong')
+
+    groundAlt = float(parseGeoTIFF.getAltFromLatLonArray(y, x, xParams, yParams, elevationData, kernel))
+    if math.isnan(groundAlt):
+        print(f'ERROR: resolveTarget ran out of bounds at {round(y,4)}, {round(x,4)}, {round(z,1)}m', file=sys.stderr)
+        print('ERROR: Please ensure target location is within GeoTIFF dataset bounds', file=sys.stderr)
+        return None
+    elif (z < groundAlt):
+        print(f'ERROR: resolveTarget failed, bad sensor or elevation data.\nInitial drone altitude: {round(z)}m, terrain altitude: {groundAlt}m\nThis image is unusable.', file=sys.stderr)
+        return None
+
+    if engine == "adaptive":
+        end = marchAdaptive(y, x, z, azimuth, theta, elevationData, xParams, yParams, pyramid, kernel)
+    elif engine == "dda":
+        end = marchDDA(y, x, z, azimuth, theta, elevationData, xParams, yParams, pyramid)
+    elif engine == "overview":
+        if overviews is None:
+            overviews = parseGeoTIFF.buildOverviews(elevationData)
+        end = marchOverview(y, x, z, azimuth, theta, elevationData, xParams, yParams, overviews, pyramid)
+    else:
+        end = marchFixed(y, x, z, azimuth, theta, elevationData, xParams, yParams, pyramid, kernel)
+    status, curY, curX, curZ, terrainAlt = end
+    if status == STATUS_OUT_OF_BOUNDS:
+        if math.isnan(curY):
+            print('ERROR: resolveTarget ran out of bounds, the line of sight leaves the GeoTIFF dataset above all terrain')
+        else:
+            print(f'ERROR: resolveTarget ran out of bounds at {round(curY,4)}, {round(curX,4)}, {round(curZ,4)}m')
+        print('ERROR: Please ensure target location is within GeoTIFF dataset bounds')
+        return None
+
+    finalHorizDist = abs(haversine_float(x, y, curX, curY, z))
+    finalVertDist = abs(z - curZ)
+    # simple pythagorean theorem
+    # may be inaccurate for very very large horizontal distances
+    finalDist = sqrt(finalHorizDist ** 2 + finalVertDist ** 2)
+
+    return((finalDist, curY, curX, curZ, terrainAlt))
+
+"""batch counterpart of resolveTarget, resolves many lines of sight against one DEM at once
+returns a structured NumPy array of TARGET_DTYPE, of the same shape as the
+(broadcast) sensor data, with one result per line of sight
+
+Instead of printing errors and returning None, each result has a status code:
+STATUS_OK, STATUS_OUT_OF_BOUNDS, STATUS_UNDERGROUND or STATUS_INVALID,
+and NaN in every other field unless its status is STATUS_OK.
+Like resolveTarget, a line of sight straight down gives z NaN (i.e. None).
+No CoT messages are sent.
+
+With the "float" engine all lines of sight are stepped together in NumPy
+(see marchFixedBatch), the "adaptive", "dda" and "overview" engines
+search each line of sight in turn. The "decimal" engine is not vectorized,
+it is substituted with its float64 equivalent, the "float" engine.
+
+Parameters
+----------
+y, x, z, azimuth, theta : float or array of float
+    sensor data of each image, see resolveTarget
+elevationData, xParams, yParams, pyramid, kernel, overviews :
+    see resolveTarget
+engine: string
+    optional, one of ENGINES, defaults to config.engine
+"""
+def resolveTargetBatch(y, x, z, azimuth, theta, elevationData, xParams, yParams, engine=None, pyramid=None, kernel=None, overviews=None):
+    if engine is None:
+        engine = config.engine
+    if kernel is None:
+        kernel = config.kernel
+    if engine not in ENGINES:
+        print(f'ERROR: unknown resolveTarget engine "{engine}", expected one of {ENGINES}', file=sys.stderr)
+        return None
+    elif kernel not in parseGeoTIFF.KERNELS:
+        print(f'ERROR: unknown interpolation kernel "{kernel}", expected one of {parseGeoTIFF.KERNELS}', file=sys.stderr)
+        return None
+
+    y, x, z, azimuth, theta = np.broadcast_arrays(*[np.asarray(a, dtype=np.float64) for a in (y, x, z, azimuth, theta)])
+    shape = y.shape
+    y, x, z, azimuth, theta = [a.ravel() for a in (y, x, z, azimuth, theta)]
+    targets = np.zeros(y.size, dtype=TARGET_DTYPE)
+    for name in TARGET_DTYPE.names[1:]:
+        targets[name] = np.nan
+
+    invalid = ~(np.isfinite(y) & np.isfinite(x) & np.isfinite(z) & np.isfinite(azimuth) & np.isfinite(theta))
+    # convert azimuth and theta from degrees to radians
+    azimuth = np.mod(np.radians(azimuth), 2 * math.pi) # 0 <= azimuth < 2pi
+    theta = np.abs(np.radians(theta)) # pitch is technically neg., but we use pos.
+    # camera is facing backwards, see resolveTarget
+    backwards = theta > (math.pi / 2)
+    azimuth = np.where(backwards, np.mod(azimuth + math.pi, 2 * math.pi), azimuth)
+    theta = np.where(backwards, math.pi - theta, theta)
+
+    status = np.full(y.size, STATUS_OK, dtype=np.int8)
+    groundAlt = parseGeoTIFF.getAltFromLatLonArray(y, x, xParams, yParams, elevationData, kernel)
+    status[np.isnan(groundAlt)] = STATUS_OUT_OF_BOUNDS
+    with np.errstate(invalid='ignore'):
+        status[z < groundAlt] = STATUS_UNDERGROUND
+    status[invalid] = STATUS_INVALID
+
+    # straight downwards (within 1e-09, like math.isclose), target is directly below
+    down = (status == STATUS_OK) & (np.abs(theta - math.pi / 2) <= 1e-09 * (math.pi / 2))
+    targets["finalDist"][down] = z[down] - groundAlt[down]
+    targets["y"][down] = y[down]
+    targets["x"][down] = x[down]
+    targets["terrainAlt"][down] = groundAlt[down]
+
+    rays = np.flatnonzero((status == STATUS_OK) & ~down)
+    if engine == "adaptive":
+        ends = [marchAdaptive(float(y[i]), float(x[i]), float(z[i]), float(azimuth[i]), float(theta[i]),
+                              elevationData, xParams, yParams, pyramid, kernel) for i in rays]
+    elif engine == "dda":
+        ends = [marchDDA(float(y[i]), float(x[i]), float(z[i]), float(azimuth[i]), float(theta[i]),
+                         elevationData, xParams, yParams, pyramid) for i in rays]
+    elif engine == "overview":
+        if overviews is None:
+            overviews = parseGeoTIFF.buildOverviews(elevationData)
+        ends = [marchOverview(float(y[i]), float(x[i]), float(z[i]), float(azimuth[i]), float(theta[i]),
+                              elevationData, xParams, yParams, overviews, pyramid) for i in rays]
+    if engine in ("adaptive", "dda", "overview"):
+        ends = [np.array(a, dtype=np.float64) for a in zip(*ends)] if ends else [np.zeros(0)] * 5
+        endStatus, curY, curX, curZ, terrainAlt = ends
+        endStatus = endStatus.astype(np.int8)
+    else:
+        endStatus, curY, curX, curZ, terrainAlt = marchFixedBatch(y[rays], x[rays], z[rays], azimuth[rays], theta[rays],
+                                                                  elevationData, xParams, yParams, pyramid, kernel)
+    status[rays] = endStatus
+    found = endStatus == STATUS_OK
+    rays = rays[found]
+    curY, curX, curZ, terrainAlt = curY[found], curX[found], curZ[found], terrainAlt[found]
+
+    finalHorizDist = np.abs(haversine_float(x[rays], y[rays], curX, curY, z[rays]))
+    finalVertDist = np.abs(z[rays] - curZ)
+    # simple pythagorean theorem
+    # may be inaccurate for very very large horizontal distances
+    targets["finalDist"][rays] = np.sqrt(finalHorizDist ** 2 + finalVertDist ** 2)
+    targets["y"][rays] = curY
+    targets["x"][rays] = curX
+    targets["z"][rays] = curZ
+    targets["terrainAlt"][rays] = terrainAlt
+
+    targets["status"] = status
+    return targets.reshape(shape)
+
+"""fixed step search of the "float" engine, see resolveTargetFloat
+returns a tuple (status, y, x, z, terrainAlt) of the end of the search
+status is STATUS_OK, or STATUS_OUT_OF_BOUNDS with (y, x, z) where the line ran
+out of bounds (NaN if it left the DEM while skipped) and terrainAlt NaN
+
+The constructed line is stepped by config.increment meters until the line is
+within post_spacing/8 of the terrain, and the point one step beyond is returned,
+just like the decimal engine. Instead of one decimal.Decimal step at a time,
+the steps are computed in float64 NumPy chunks: each point along the line
+is found in closed form (see rayLatLon) and all terrain lookups of a chunk
+are done in one call to parseGeoTIFF.getAltFromLatLonArray
+
+Parameters
+----------
+y, x, z : float
+    latitude, longitude and altitude of aircraft
+azimuth, theta : float
+    azimuth and angle of declanation of the camera, in radians
+elevationData, xParams, yParams, pyramid, kernel :
+    see resolveTarget
+"""
+def marchFixed(y, x, z, azimuth, theta, elevationData, xParams, yParams, pyramid=None, kernel=None):
+    x0, x1, dx, ncols = xParams
+    y0, y1, dy, nrows = yParams
+
+    post_spacing_meters = haversine_float(0, y, dx, y, z) # meters between datapoints, from degrees
+    threshold = abs(post_spacing_meters) / 8.0 # meters of acceptable distance between constructed line and datapoint. somewhat arbitrary
+
+    # horizontal and vertical travel per step along the constructed line
+    horizStep = math.cos(theta) * config.increment
+    vertStep = math.sin(theta) * config.increment
+
+    # skip the steps that are provably more than threshold above the terrain,
+    #     (one less, in case of rounding) they could never end the search
+    start = 0
+    if pyramid is not None:
+        skipDist = skipAboveTerrain(y, x, z, azimuth, theta, xParams, yParams, pyramid, threshold)
+        if skipDist is None:
+            return (STATUS_OUT_OF_BOUNDS, math.nan, math.nan, math.nan, math.nan)
+        start = max(0, math.floor(skipDist / horizStep) - 1)
+
+    # steps are evaluated in chunks, each one twice as large as the last
+    chunkSize = 1024
+    while True:
+        steps = np.arange(start, start + chunkSize + 1, dtype=np.float64)
+        curZ = z - steps * vertStep
+        curY, curX = rayLatLon(y, x, z, azimuth, theta, steps * horizStep)
+        groundAlt = parseGeoTIFF.getAltFromLatLonArray(curY, curX, xParams, yParams, elevationData, kernel)
+        oob = (curY > y0) | (curY < y1) | (curX < x0) | (curX > x1) | np.isnan(groundAlt)
+        with np.errstate(invalid='ignore'):
+            matched = (curZ - groundAlt) <= threshold
+        # the last point of each chunk is only needed as the "one step beyond"
+        #     of the chunk's last match, see the decimal engine
+        hits = np.flatnonzero(matched[:-1] | oob[:-1])
+        if hits.size > 0:
+            i = hits[0]
+            if oob[i] or oob[i + 1]:
+                return (STATUS_OUT_OF_BOUNDS, float(curY[i + 1]), float(curX[i + 1]), float(curZ[i + 1]), math.nan)
+            return (STATUS_OK, float(curY[i + 1]), float(curX[i + 1]), float(curZ[i + 1]), float(groundAlt[i + 1]))
+        start += chunkSize
+        chunkSize *= 2
+
+"""vectorized counterpart of marchFixed, for resolveTargetBatch
+returns a tuple (status, y, x, z, terrainAlt) of arrays, one entry per line of sight
+
+Each line of sight is stepped exactly like marchFixed, and gets the same result.
+All lines of sight are stepped together, a chunk of steps each at a time, and
+each one is dropped from the following chunks once its search has ended.
+
+Parameters
+----------
+y, x, z, azimuth, theta : array of float
+    latitude, longitude and altitude of aircraft,
+    azimuth and angle of declanation of the camera, in radians
+elevationData, xParams, yParams, pyramid, kernel :
+    see resolveTarget
+"""
+def marchFixedBatch(y, x, z, azimuth, theta, elevationData, xParams, yParams, pyramid=None, kernel=None):
+    x0, x1, dx, ncols = xParams
+    y0, y1, dy, nrows = yParams
+
+    post_spacing_meters = haversine_float(0, y, dx, y, z) # meters between datapoints, from degrees
+    threshold = np.abs(post_spacing_meters) / 8.0 # meters of acceptable distance between constructed line and datapoint. somewhat arbitrary
+
+    # horizontal and vertical travel per step along the constructed line
+    horizStep = np.cos(theta) * config.increment
+    vertStep = np.sin(theta) * config.increment
+
+    status = np.full(y.size, STATUS_OK, dtype=np.int8)
+    endY, endX, endZ, endAlt = [np.full(y.size, np.nan) for i in range(4)]
+
+    # skip the steps that are provably more than threshold above the terrain, see marchFixed
+    start = np.zeros(y.size)
+    if pyramid is not None:
+        for i in range(y.size):
+            skipDist = skipAboveTerrain(float(y[i]), float(x[i]), float(z[i]), float(azimuth[i]), float(theta[i]),
+                                        xParams, yParams, pyramid, float(threshold[i]))
+            if skipDist is None:
+                status[i] = STATUS_OUT_OF_BOUNDS
+            else:
+                start[i] = max(0, math.floor(skipDist / horizStep[i]) - 1)
+
+    active = np.flatnonzero(status == STATUS_OK)
+    while active.size > 0:
+        # keep the (lines x steps) arrays of each chunk to a modest size
+        chunkSize = max(16, min(1024, (1 << 18) // active.size))
+        steps = start[active, None] + np.arange(chunkSize + 1, dtype=np.float64)
+        curZ = z[active, None] - steps * vertStep[active, None]
+        curY, curX = rayLatLon(y[active, None], x[active, None], z[active, None],
+                               azimuth[active, None], theta[active, None], steps * horizStep[active, None])
+        groundAlt = parseGeoTIFF.getAltFromLatLonArray(curY, curX, xParams, yParams, elevationData, kernel)
+        oob = (curY > y0) | (curY < y1) | (curX < x0) | (curX > x1) | np.isnan(groundAlt)
+        with np.errstate(invalid='ignore'):
+            matched = (curZ - groundAlt) <= threshold[active, None]
+        # the last point of each chunk is only needed as the "one step beyond", see marchFixed
+        hits = matched[:, :-1] | oob[:, :-1]
+        found = np.flatnonzero(hits.any(axis=1))
+        step = np.argmax(hits[found], axis=1)
+        ended = active[found]
+        ranOut = oob[found, step] | oob[found, step + 1]
+        status[ended] = np.where(ranOut, STATUS_OUT_OF_BOUNDS, STATUS_OK)
+        endY[ended] = curY[found, step + 1]
+        endX[ended] = curX[found, step + 1]
+        endZ[ended] = curZ[found, step + 1]
+        endAlt[ended] = np.where(ranOut, np.nan, groundAlt[found, step + 1])
+
+        start[active] += chunkSize
+        active = np.delete(active, found)
+
+    return (status, endY, endX, endZ, endAlt)
+
+"""coarse-to-fine search of the "adaptive" engine, see resolveTargetFloat
+returns a tuple (status, y, x, z, terrainAlt) of the end of the search, see marchFixed
+
+The constructed line is stepped by at least the DEM post spacing. When the line
+is far above the terrain, the step is widened to the furthest distance the
+terrain could not possibly reach the line, assuming the terrain is never steeper
+than config.max_terrain_slope (i.e. gap / (tan(theta) + max_terrain_slope)).
+Once the line crosses below the terrain, the crossing is bisected until it is
+known within config.bisect_tolerance meters, and returned.
+Given a pyramid, the search starts where the line may first meet the terrain.
+
+Parameters
+----------
+same as marchFixed
+"""
+def marchAdaptive(y, x, z, azimuth, theta, elevationData, xParams, yParams, pyramid=None, kernel=None):
+    x0, x1, dx, ncols = xParams
+    y0, y1, dy, nrows = yParams
+
+    # meters between datapoints, from degrees
+    post_spacing_meters = min(abs(haversine_float(0, y, dx, y, z)), abs(haversine_float(x, 0, x, dy, z)))
+    slope = math.tan(theta)
+
+    # altitude difference between the line and terrain, after a horizontal distance
+    #     NaN if out of bounds
+    def gapAt(dist):
+        curY, curX = rayLatLon(y, x, z, azimuth, theta, dist)
+        curY, curX = float(curY), float(curX)
+        if curY > y0 or curY < y1 or curX < x0 or curX > x1:
+            return math.nan, curY, curX
+        groundAlt = float(parseGeoTIFF.getAltFromLatLonArray(curY, curX, xParams, yParams, elevationData, kernel))
+        return z - dist * slope - groundAlt, curY, curX
+
+    lastDist = 0.0
+    if pyramid is not None:
+        lastDist = skipAboveTerrain(y, x, z, azimuth, theta, xParams, yParams, pyramid)
+        if lastDist is None:
+            return (STATUS_OUT_OF_BOUNDS, math.nan, math.nan, math.nan, math.nan)
+    lastGap, curY, curX = gapAt(lastDist)
+    if math.isnan(lastGap):
+        return (STATUS_OUT_OF_BOUNDS, curY, curX, z - lastDist * slope, math.nan)
+    while lastGap > 0.0:
+        step = max(post_spacing_meters, lastGap / (slope + config.max_terrain_slope))
+        gap, curY, curX = gapAt(lastDist + step)
+        # a wide step may have jumped out of bounds before the line reached the terrain,
+        #     back off towards the post spacing before giving up
+        while math.isnan(gap) and step > post_spacing_meters:
+            step = max(post_spacing_meters, step / 2)
+            gap, curY, curX = gapAt(lastDist + step)
+        if math.isnan(gap):
+            return (STATUS_OUT_OF_BOUNDS, curY, curX, z - (lastDist + step) * slope, math.nan)
+        if gap <= 0.0:
+            break
+        lastDist, lastGap = lastDist + step, gap
+    else:
+        # line starts exactly on the terrain
+        gap = lastGap
+        step = 0.0
+
+    # bisect the crossing, line is above terrain at lo and at or below terrain at hi
+    lo, hi = lastDist, lastDist + step
+    gapLo, gapHi = lastGap, gap
+    while hi - lo > config.bisect_tolerance:
+        mid = (lo + hi) / 2
+        gapMid = gapAt(mid)[0]
+        if gapMid > 0.0:
+            lo, gapLo = mid, gapMid
+        else:
+            hi, gapHi = mid, gapMid
+    # final linear interpolation between the two bracketing points
+    if gapLo != gapHi:
+        dist = lo + (hi - lo) * gapLo / (gapLo - gapHi)
+    else:
+        dist = hi
+    gap, curY, curX = gapAt(dist)
+    curZ = z - dist * slope
+    return (STATUS_OK, curY, curX, curZ, curZ - gap)
+
+"""exact grid traversal search of the "dda" engine, see resolveTargetFloat
+returns a tuple (status, y, x, z, terrainAlt) of the end of the search, see marchFixed
+
+The terrain is modelled as a bilinear patch over each DEM cell (the square
+between four neighbouring datapoints). The constructed line walks the cells it
+actually crosses, in order (see rayCells). Within each cell, the first crossing of
+the line and the cell's bilinear patch is solved for analytically
+(see rayPatchIntersection). The cost scales with the number of cells crossed,
+and no ridge is ever stepped over. Given a pyramid, blocks of cells the line
+provably clears are skipped whole.
+
+Parameters
+----------
+same as marchFixed, except for kernel: the bilinear surface is always used
+"""
+def marchDDA(y, x, z, azimuth, theta, elevationData, xParams, yParams, pyramid=None):
+    return marchDDAWindow(y, x, z, azimuth, theta, elevationData, xParams, yParams, pyramid)[:5]
+
+"""the search of marchDDA, between two angular distances along the line
+returns a tuple (status, y, x, z, terrainAlt, angDist) like marchDDA, plus the
+angular distance along the line of the end of the search. status is
+STATUS_OUT_OF_BOUNDS if the line leaves the DEM, or reaches end, first
+
+Parameters
+----------
+same as marchDDA
+start, end : float
+    optional, angular distances along the line (see rayLatLon) to search between
+"""
+def marchDDAWindow(y, x, z, azimuth, theta, elevationData, xParams, yParams, pyramid=None, start=0.0, end=math.inf):
+    x0, x1, dx, ncols = xParams
+    y0, y1, dy, nrows = yParams
+
+    lat0, lon0 = math.radians(y), math.radians(x)
+    r = float(radius_at_lat_lon_float(lat0, lon0)) + z
+    slope = math.tan(theta)
+
+    # continuous (col, row) index of the line, its altitude, and lat/lon at an angular distance
+    def pointAt(angDist):
+        dist = rayDistance(r, slope, angDist)
+        lat, lon = rhumbLatLon(lat0, lon0, angDist, azimuth)
+        lat, lon = math.degrees(float(lat)), math.degrees(float(lon))
+        return (lon - x0) / dx, (lat - y0) / dy, z - dist * slope, lat, lon
+
+    angLast = start
+    u, v, alt, lat, lon = pointAt(angLast)
+    for col, row, angIn, angOut in rayCells(y, x, z, azimuth, theta, xParams, yParams, pyramid, start=start):
+        if angIn >= end:
+            break
+        if angIn != angLast:
+            # entering after skipped cells
+            u, v, alt, lat, lon = pointAt(angIn)
+        uOut, vOut, altOut, latOut, lonOut = pointAt(angOut)
+
+        # corners of the cell, the last row/column of the DEM is repeated past its edge
+        colR, rowB = min(col + 1, ncols - 1), min(row + 1, nrows - 1)
+        h00 = float(elevationData[row, col])
+        h01 = float(elevationData[row, colR])
+        h10 = float(elevationData[rowB, col])
+        h11 = float(elevationData[rowB, colR])
+        if math.isnan(h00 + h01 + h10 + h11):
+            # no data, e.g. between the tiles of a DEM catalog
+            return (STATUS_OUT_OF_BOUNDS, lat, lon, alt, math.nan, angIn)
+
+        pu, pv = u - col, v - row
+        qu, qv = uOut - u, vOut - v
+        t = rayPatchIntersection(pu, pv, qu, qv, alt, altOut, h00, h01, h10, h11)
+        if t is not None:
+            angHit = angIn + t * (angOut - angIn)
+            fu, fv = pu + t * qu, pv + t * qv
+            terrainAlt = h00 * (1 - fu) * (1 - fv) + h01 * fu * (1 - fv) + h10 * (1 - fu) * fv + h11 * fu * fv
+            u, v, curZ, curY, curX = pointAt(angHit)
+            return (STATUS_OK, curY, curX, curZ, terrainAlt, angHit)
+
+        u, v, alt, lat, lon, angLast = uOut, vOut, altOut, latOut, lonOut, angOut
+
+    return (STATUS_OUT_OF_BOUNDS, lat, lon, alt, math.nan, angLast)
+
+"""coarse-to-fine search of the "overview" engine, see resolveTargetFloat
+returns a tuple (status, y, x, z, terrainAlt) like marchDDA
+
+The line is first intersected (like marchDDA) with the coarsest overview of
+the DEM with at least 2x2 datapoints (see parseGeoTIFF.buildOverviews).
+Each finer level is then only searched within config.overview_window cells
+(of the level above) either side of the crossing found on the level above,
+down to the DEM itself, so the cost of the search depends on the number of
+levels rather than the length of the line. Only where a level has no crossing
+within its window is the rest of the line searched on that level, and where
+it has none at all, the rest of the line is searched on the DEM itself,
+skipping over terrain with the max-elevation pyramid, if given.
+
+The result is that of the "dda" engine, unless the line meets terrain that
+is lost in the mean of a coarser level (e.g. a narrow ridge) before the window
+
+Parameters
+----------
+y, x, z : float
+    latitude, longitude and altitude of aircraft
+azimuth, theta : float
+    azimuth and angle of declanation of the camera, in radians
+elevationData, xParams, yParams :
+    see resolveTarget
+overviews : list of 2D array
+    overviews of elevationData, see parseGeoTIFF.buildOverviews
+pyramid : list of 2D array
+    optional, see resolveTarget
+"""
+def marchOverview(y, x, z, azimuth, theta, elevationData, xParams, yParams, overviews, pyramid=None):
+    # angular distance across a DEM cell, at least, along either axis
+    cellAngle = math.radians(max(abs(xParams[2]), abs(yParams[2])))
+    level = max([0] + [i for i, overview in enumerate(overviews) if min(overview.shape) >= 2])
+    start, end = 0.0, math.inf
+    while True:
+        levelXParams, levelYParams = parseGeoTIFF.overviewParams(xParams, yParams, level)
+        levelData = elevationData if level == 0 else overviews[level]
+        # the pyramid is of the DEM itself, not its overviews
+        levelPyramid = pyramid if level == 0 else None
+        result = marchDDAWindow(y, x, z, azimuth, theta, levelData, levelXParams, levelYParams, levelPyramid, start, end)
+        if result[0] != STATUS_OK and result[5] >= end:
+            # no crossing within the window, search the rest of the line on this level
+            result = marchDDAWindow(y, x, z, azimuth, theta, levelData, levelXParams, levelYParams, levelPyramid, end)
+        if level == 0:
+            return result[:5]
+        if result[0] == STATUS_OK:
+            window = config.overview_window * cellAngle * (1 << level)
+            start, end = max(result[5] - window, 0.0), result[5] + window
+            level -= 1
+        else:
+            # no crossing on this level, e.g. the line leaves the DEM above the terrain,
+            #     search the rest of the line on the DEM itself
+            end = math.inf
+            level = 0
+
+"""walk the DEM cells crossed by a constructed line, in order
+yields a tuple (col, row, angIn, angOut) for each cell, where angIn and angOut
+are the angular distances (see rayLatLon) at which the line enters and leaves it,
+and stops once the line leaves the DEM
+
+In the style of Amanatides & Woo's "A Fast Voxel Traversal Algorithm for Ray
+Tracing": the angular distance of the line to its next column and next row
+boundary is found in closed form, and the line steps into whichever is nearer.
+
+Given a max-elevation pyramid (see parseGeoTIFF.buildMaxPyramid), whole blocks
+of 2^level x 2^level cells are stepped over, and not yielded, while the line
+leaves them more than margin meters above their highest elevation. The line
+only descends, so it is lowest where it leaves a block. After each block the
+walk tries the next coarser level, and refines only where it must.
+
+Parameters
+----------
+y, x, z : float
+    latitude, longitude and altitude of aircraft
+azimuth, theta : float
+    azimuth and angle of declanation of the camera, in radians
+xParams, yParams :
+    see resolveTarget
+pyramid : list of 2D array
+    optional, see parseGeoTIFF.buildMaxPyramid
+margin : float
+    optional, meters the line must clear a block by for it to be skipped
+start : float
+    optional, angular distance along the line at which to start the walk
+"""
+def rayCells(y, x, z, azimuth, theta, xParams, yParams, pyramid=None, margin=0.0, start=0.0):
+    x0, x1, dx, ncols = xParams
+    y0, y1, dy, nrows = yParams
+
+    lat0, lon0 = math.radians(y), math.radians(x)
+    r = float(radius_at_lat_lon_float(lat0, lon0)) + z
+    slope = math.tan(theta)
+    cosAz, sinAz = math.cos(azimuth), math.sin(azimuth)
+    psi0 = math.log(math.tan(math.pi / 4 + lat0 / 2))
+
+    # angular distance at which the line reaches a row boundary (latitude, degrees)
+    def angleAtLat(lat):
+        return (math.radians(lat) - lat0) / cosAz
+
+    # angular distance at which the line reaches a column boundary (longitude, degrees)
+    def angleAtLon(lon):
+        deltaLon = math.radians(lon) - lon0
+        if abs(cosAz) < 1e-9:
+            # (almost) due east or west, the line keeps to its start latitude
+            return deltaLon * math.cos(lat0) / sinAz
+        # invert the rhumb line: deltaLon = tan(azimuth) * deltaPsi
+        psi = psi0 + deltaLon * cosAz / sinAz
+        lat = 2 * math.atan(math.exp(psi)) - math.pi / 2
+        return (lat - lat0) / cosAz
+
+    # continuous (col, row) index of the line at an angular distance
+    def indexAt(angDist):
+        lat, lon = rhumbLatLon(lat0, lon0, angDist, azimuth)
+        return (math.degrees(float(lon)) - x0) / dx, (math.degrees(float(lat)) - y0) / dy
+
+    u, v = ((x - x0) / dx, (y - y0) / dy) if start == 0.0 else indexAt(start)
+    col, row = math.floor(u), math.floor(v)
+    # direction of travel, in columns and rows
+    stepCol = 0 if abs(sinAz) < 1e-12 else (1 if sinAz / dx > 0 else -1)
+    stepRow = 0 if abs(cosAz) < 1e-12 else (1 if cosAz / dy > 0 else -1)
+    # starting exactly on a boundary and heading backwards, the cell is the one behind it
+    if stepCol < 0 and col == u:
+        col -= 1
+    if stepRow < 0 and row == v:
+        row -= 1
+
+    top = 0 if pyramid is None else len(pyramid) - 1
+    level = top
+    angIn = start
+    while 0 <= col < ncols and 0 <= row < nrows:
+        # from the current level, refine until a block is cleared, or down to a single cell
+        while True:
+            size = 1 << level
+            blockCol, blockRow = col >> level, row >> level
+            colAngle = math.inf if stepCol == 0 else angleAtLon(x0 + (blockCol + (stepCol > 0)) * size * dx)
+            rowAngle = math.inf if stepRow == 0 else angleAtLat(y0 + (blockRow + (stepRow > 0)) * size * dy)
+            angOut = max(angIn, min(colAngle, rowAngle))
+            if pyramid is None:
+                cleared = False
+                break
+            altOut = z - rayDistance(r, slope, angOut) * slope
+            # (with a hair of slack, interpolation may round just above its samples)
+            cleared = altOut > float(pyramid[level][blockRow][blockCol]) + margin + 1e-6
+            if cleared or level == 0:
+                break
+            level -= 1
+
+        if not cleared:
+            yield (col, row, angIn, angOut)
+
+        # step into the next block, through whichever boundary is nearer
+        if colAngle <= rowAngle:
+            col = (blockCol + 1) * size if stepCol > 0 else blockCol * size - 1
+            if size > 1:
+                row = min(max(math.floor(indexAt(angOut)[1]), blockRow * size), blockRow * size + size - 1)
+        else:
+            row = (blockRow + 1) * size if stepRow > 0 else blockRow * size - 1
+            if size > 1:
+                col = min(max(math.floor(indexAt(angOut)[0]), blockCol * size), blockCol * size + size - 1)
+        angIn = angOut
+        level = min(level + 1, top)
+
+"""given the start of a constructed line and a max-elevation pyramid,
+return the horizontal distance (meters) along the line up to which it is
+provably more than margin meters above all terrain, or None if the line
+leaves the DEM before it could meet the terrain
+
+Parameters
+----------
+same as rayCells
+"""
+def skipAboveTerrain(y, x, z, azimuth, theta, xParams, yParams, pyramid, margin=0.0):
+    lat0, lon0 = math.radians(y), math.radians(x)
+    r = float(radius_at_lat_lon_float(lat0, lon0)) + z
+    slope = math.tan(theta)
+    # only the first cell where the line may meet the terrain is needed
+    for col, row, angIn, angOut in rayCells(y, x, z, azimuth, theta, xParams, yParams, pyramid, margin):
+        return rayDistance(r, slope, angIn)
+    return None
+
+"""horizontal distance (meters) of travel along a constructed line for an
+angular distance of travel, inverse of the angular distance in rayLatLon
+
+Parameters
+----------
+r : float
+    radius of travel at the start of the line, WGS84 radius plus altitude (meters)
+slope : float
+    descent of the line per meter of horizontal travel, i.e. tan(theta)
+angDist : float
+    angular distance of travel
+"""
+def rayDistance(r, slope, angDist):
+    if slope > 0.0:
+        return -r * math.expm1(-angDist * slope) / slope
+    return r * angDist
+
+"""given a segment of the constructed line within a single DEM cell,
+return the fraction (0.0 to 1.0) of the segment at which it first meets the
+bilinear patch of the cell's four corners, or None if it stays above it
+
+Along the segment the cell fractions fu, fv and the line's altitude
+are linear in t, so (line altitude - patch altitude) is a quadratic
+A*t^2 + B*t + C, solved in closed form
+
+Parameters
+----------
+pu, pv : float
+    fraction of the cell (col, row) at the start of the segment
+qu, qv : float
+    change of fraction of the cell (col, row) over the segment
+altIn, altOut : float
+    altitude of the line at the start and end of the segment
+h00, h01, h10, h11 : float
+    elevation of the cell's corners at (row, col), (row, col+1),
+    (row+1, col), and (row+1, col+1)
+"""
+def rayPatchIntersection(pu, pv, qu, qv, altIn, altOut, h00, h01, h10, h11):
+    # patch: h(fu, fv) = a + b*fu + c*fv + d*fu*fv
+    a = h00
+    b = h01 - h00
+    c = h10 - h00
+    d = h00 - h01 - h10 + h11
+
+    A = -d * qu * qv
+    B = (altOut - altIn) - (b * qu + c * qv + d * (pu * qv + qu * pv))
+    C = altIn - (a + b * pu + c * pv + d * pu * pv)
+
+    if C <= 0.0:
+        return 0.0
+
+    roots = []
+    if abs(A) <= 1e-12 * (abs(B) + abs(C)):
+        if B != 0.0:
+            roots.append(-C / B)
+    else:
+        disc = B * B - 4 * A * C
+        if disc >= 0.0:
+            # numerically stable quadratic roots
+            q = -0.5 * (B + math.copysign(math.sqrt(disc), B))
+            roots.append(q / A)
+            if q != 0.0:
+                roots.append(C / q)
+    roots = [t for t in roots if 0.0 <= t <= 1.0]
+    if roots:
+        return min(roots)
+    elif A + B + C <= 0.0:
+        # below the patch at the end of the segment, but rounding hid the root
+        return 1.0
+    return None
+
+"""given the start of a constructed line, return the lat/lon (degrees) of the line
+after a horizontal distance (meters) of travel
+
+The line is followed at a constant azimuth, just like the repeated
+inverse_haversine steps of the decimal engine in resolveTarget. Those steps
+trace a rhumb line (loxodrome), which is found here in closed form.
+The radius of travel is the WGS84 radius at the start latitude plus the
+altitude of the line, which descends at tan(theta) per meter of horizontal
+travel. Unlike here, the decimal engine recomputes the WGS84 radius at the
+latitude of each step, so the two differ by up to about
+(A - B) sin(2 lat) dist^2 / (2 r^2), where A - B is the difference of the
+WGS84 equatorial and polar radii (21385m): about 3cm after 10km and 10cm
+after 20km of travel north or south at 45 degrees latitude, and less
+elsewhere, or heading east or west.
+
+Parameters
+----------
+all parameters may also be NumPy arrays (e.g. one line per row, one distance
+per column), which are broadcast against each other
+
+y : float
+    latitude of start of line
+x : float
+    longitude of start of line
+z : float
+    altitude of start of line (meters)
+azimuth : float
+    azimuth of line, in radians (0 is north, inc. clockwise)
+theta : float
+    angle of declanation of line, in radians (0 is level, inc. downward)
+dist : float or array of float
+    horizontal distance(s) of travel along the line, in meters
+"""
+def rayLatLon(y, x, z, azimuth, theta, dist):
+    lat0, lon0 = np.radians(y), np.radians(x)
+    dist = np.asarray(dist, dtype=np.float64)
+    r = radius_at_lat_lon_float(lat0, lon0) + z
+    # angular distance of travel, integrated over the descending altitude
+    #     of the line: integral of ds / (r - s * tan(theta))
+    slope = np.tan(theta)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        angDist = np.where(slope > 0.0, -np.log1p(-dist * slope / r) / slope, dist / r)
+
+    lat, lon = rhumbLatLon(lat0, lon0, angDist, azimuth)
+    return np.degrees(lat), np.degrees(lon)
+
+"""Rhumb line (loxodrome) destination
+via movable-type.co.uk/scripts/latlong.html
+given a point, angular distance, and a constant heading, return the new point (lat, lon)
+all units in Radians
+
+Parameters
+----------
+lat0 : float or array of float
+    latitude of the start point
+lon0 : float or array of float
+    longitude of the start point
+angDist : float or array of float
+    angular distance(s) of travel (i.e. distance / radius)
+azimuth : float or array of float
+    the constant heading of the direction of travel (start @ 0, inc. clockwise)
+"""
+def rhumbLatLon(lat0, lon0, angDist, azimuth):
+    lat = lat0 + angDist * np.cos(azimuth)
+    deltaPsi = np.log(np.tan(math.pi / 4 + lat / 2) / np.tan(math.pi / 4 + lat0 / 2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        q = np.where(np.abs(deltaPsi) > 1e-12, (lat - lat0) / deltaPsi, np.cos(lat0))
+    lon = lon0 + angDist * np.sin(azimuth) / q
+    return lat, lon
+
 """convert from azimuth notation (0 is up [+y], inc. clockwise) to
 math notation(0 is right [+x], inc. counter-clockwise)
 all units in Radians
@@ -394,6 +1277,25 @@ def radius_at_lat_lon(lat, lon):
     return r
 
 
+"""float64 (and NumPy array) counterpart of radius_at_lat_lon
+returns the radius of the WGS84 Ellipsoid in meters
+
+Parameters
+----------
+lat : float or array of float
+    geodetic latitude, in radians. assumed to be WGS84
+lon : float or array of float
+    geodetic longitude, in radians. assumed to be WGS84
+"""
+def radius_at_lat_lon_float(lat, lon):
+    A = 6378137.0 # equatorial radius of WGS ellipsoid, in meters
+    B = 6356752.3 # polar radius of WGS ellipsoid, in meters
+    cosLat, sinLat = np.cos(lat), np.sin(lat)
+    r = (A * A * cosLat) ** 2 + (B * B * sinLat) ** 2 # numerator
+    r /= (A * cosLat) ** 2 + (B * sinLat) ** 2 # denominator
+    return np.sqrt(r)
+
+
 """Inverse Haversine formula
 via github.com/jdeniau
 given a point, distance, and heading, return the new point (lat lon)
@@ -480,6 +1382,27 @@ def haversine(lon1, lat1, lon2, lat2, alt):
     r = r + decimal.Decimal(alt) # actual height above or below idealized ellipsoid
     return c * r
 
+"""float64 (and NumPy array) counterpart of haversine
+determines the great circle distance (meters) between
+two lattitude longitude pairs
+
+Parameters
+----------
+same as haversine, each may be a float or array of float
+"""
+def haversine_float(lon1, lat1, lon2, lat2, alt):
+    # convert decimal degrees to radians
+    lon1, lat1, lon2, lat2 = map(np.radians, [lon1, lat1, lon2, lat2])
+
+    # haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+    r = radius_at_lat_lon_float((lat1+lat2)/2, (lon1+lon2)/2)
+    r = r + alt # actual height above or below idealized ellipsoid
+    return c * r
+
 """takes two lat/lon pairs (a start A and a destination B) and finds the heading of the shortest direction of travel from A to B
 Note: this function will work with Geodetic coords of any ellipsoid (as long as both pairs' ellipsoid are the same)
 
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+imageWatcher.py
+
+This file watches a directory (and its subdirectories) for new drone images,
+    for find_me_mode.py
+
+A background thread reports each JPEG image once, as soon as it is fully
+    written, so images still being copied or downloaded into the directory are
+    never read half-written. On Linux, the directory is watched with inotify,
+    so new images are reported without scanning the directory again. Elsewhere
+    (or if inotify is unavailable) the directory is polled every
+    config.watch_poll_interval seconds, and an image is reported once its size
+    and modification time stop changing. An image found not yet fully written
+    is checked again every poll interval, until it is
+
+An image is fully written once it ends with the JPEG end of image marker,
+    see jpegMetadata.isCompleteJPEG
+"""
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+
+import config # OpenAthena global variables
+import jpegMetadata
+
+# image file extensions reported, lower case
+EXTENSIONS = ("jpg", "jpeg")
+
+# inotify event masks, see man 7 inotify
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+# struct inotify_event, followed by its name of len bytes
+INOTIFY_EVENT = struct.Struct("iIII")
+
+"""watches a directory for new, fully written JPEG images
+
+    start() reports the images already in the directory, then watches it on
+    a background thread until stop(). Each image is reported once, by its path,
+    see newImages()
+
+Parameters
+----------
+directory: string
+    path of the directory to watch, with its subdirectories
+inotify: bool
+    optional, use inotify if available (Linux), otherwise always poll
+pollInterval: float
+    optional, seconds between polls, defaults to config.watch_poll_interval
+"""
+class ImageWatcher(object):
+
+    def __init__(self, directory, inotify=True, pollInterval=None):
+        self.directory = os.path.abspath(directory)
+        self.pollInterval = config.watch_poll_interval if pollInterval is None else pollInterval
+        self.ready = queue.Queue()
+        # paths of the images reported so far
+        self.reported = set()
+        # {path: (size, modification time), or None with inotify} of images not yet fully written
+        self.pending = {}
+        self.thread = None
+        self.stopping = threading.Event()
+        self.inotifyFD = None
+        # {watch descriptor: directory path} of inotify
+        self.watches = {}
+        if inotify:
+            self.inotifyFD = openInotify()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    """whether the directory is watched with inotify, instead of polled"""
+    @property
+    def usesInotify(self):
+        return self.inotifyFD is not None
+
+    """report the images already in the directory, then start watching it, returns self"""
+    def start(self):
+        if self.usesInotify:
+            # watches are added before scanning, so no image is missed in between
+            self.watchTree(self.directory)
+            self.scan(self.directory, waitStable=False)
+            target = self.runInotify
+        else:
+            self.scan(self.directory, waitStable=False)
+            target = self.runPolling
+        self.thread = threading.Thread(target=target, name="ImageWatcher", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.inotifyFD is not None:
+            os.close(self.inotifyFD)
+            self.inotifyFD = None
+
+    """the paths of the images reported since last called, [] if none
+
+    Parameters
+    ----------
+    timeout: float
+        optional, seconds to wait for an image if there is none yet
+    """
+    def newImages(self, timeout=None):
+        images = []
+        try:
+            if timeout is not None:
+                images.append(self.ready.get(timeout=timeout))
+            while True:
+                images.append(self.ready.get_nowait())
+        except queue.Empty:
+            pass
+        return images
+
+    # report an image if it is fully written, waiting for its size and modification time to settle if waitStable
+    def consider(self, path, waitStable):
+        if path in self.reported or path.split('.')[-1].lower() not in EXTENSIONS:
+            return
+        if waitStable:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.pending.pop(path, None)
+                return
+            identity = (stat.st_size, stat.st_mtime_ns)
+            if self.pending.get(path) != identity:
+                self.pending[path] = identity
+                return
+        if jpegMetadata.isCompleteJPEG(path):
+            self.pending.pop(path, None)
+            self.reported.add(path)
+            self.ready.put(path)
+        elif not waitStable:
+            # checked again by recheckPending (or the next poll), it may be completed without another event
+            self.pending.setdefault(path, None)
+
+    # consider again the images not yet fully written, forgetting those removed since
+    def recheckPending(self):
+        for path in list(self.pending):
+            if os.path.exists(path):
+                self.consider(path, waitStable=False)
+            else:
+                self.pending.pop(path, None)
+
+    # consider each image in a directory tree
+    def scan(self, directory, waitStable):
+        for root, dirs, files in os.walk(directory):
+            for aFile in files:
+                self.consider(os.path.join(root, aFile), waitStable)
+
+    def runPolling(self):
+        while not self.stopping.wait(self.pollInterval):
+            self.scan(self.directory, waitStable=True)
+
+    # add an inotify watch to each directory of a tree
+    def watchTree(self, directory):
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        for root, dirs, files in os.walk(directory):
+            wd = libc.inotify_add_watch(self.inotifyFD, os.fsencode(root), mask)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                print(f'WARNING: could not watch {root}: {os.strerror(errno)}', file=sys.stderr)
+                continue
+            self.watches[wd] = root
+
+    def runInotify(self):
+        nextRecheck = time.monotonic() + self.pollInterval
+        while not self.stopping.is_set():
+            readable, _, _ = select.select([self.inotifyFD], [], [], min(0.25, self.pollInterval))
+            if time.monotonic() >= nextRecheck:
+                self.recheckPending()
+                nextRecheck = time.monotonic() + self.pollInterval
+            if not readable:
+                continue
+            try:
+                data = os.read(self.inotifyFD, 64 * 1024)
+            except OSError:
+                continue
+            offset = 0
+            while offset + INOTIFY_EVENT.size <= len(data):
+                wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b'\x00')
+                offset += INOTIFY_EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    # events were lost, look over the whole tree instead
+                    self.scan(self.directory, waitStable=False)
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    continue
+                root = self.watches.get(wd)
+                if root is None or not name:
+                    continue
+                path = os.path.join(root, os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # images may be written to it before it is watched
+                        self.watchTree(path)
+                        self.scan(path, waitStable=False)
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self.consider(path, waitStable=False)
+
+libc = None
+
+# a new inotify file descriptor, or None if inotify is unavailable
+def openInotify():
+    global libc
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        if libc is None:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    return fd
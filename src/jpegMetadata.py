@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+jpegMetadata.py
+
+This file reads the EXIF and XMP metadata of a JPEG drone image
+
+The JPEG is read one marker segment at a time, from its start up to the
+    start of scan (SOS) marker, after which only compressed image data follows.
+    Only the APP1 segments holding EXIF or XMP are read, every other segment
+    (e.g. thumbnails or previews) is skipped over, so only a few kB of a
+    10-25 MB image are read
+
+XMP larger than one segment (64 kB) is split into a main packet and an
+    Extended XMP packet spread across multiple APP1 segments, which are
+    put back together. See part 3 of the XMP specification:
+    github.com/adobe/XMP-Toolkit-SDK/blob/main/docs/XMPSpecificationPart3.pdf
+"""
+import io
+import struct
+
+from PIL import Image
+from PIL import ExifTags
+
+EXIF_HEADER = b'Exif\x00\x00'
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+EXTENDED_XMP_HEADER = b'http://ns.adobe.com/xmp/extension/\x00'
+
+MARKER_APP1 = 0xE1
+MARKER_SOS = 0xDA
+MARKER_EOI = 0xD9
+# markers without a length or payload
+STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD9))
+
+"""read the EXIF and XMP metadata of a JPEG image in one pass over its header
+
+    returns a tuple (exifData, xmp_str) where exifData is a dict of EXIF tags by
+    name (see PIL.ExifTags.TAGS) including those of its Exif and GPSInfo IFDs,
+    like PIL's Image._getexif(), or None if the image has no EXIF. xmp_str is
+    the XMP packet as text (with its Extended XMP appended after it, if any),
+    or "" if the image has no XMP
+
+    raises ValueError if the file is not a JPEG or is cut short,
+    or OSError if it can't be read
+
+Parameters
+----------
+filename: string
+    filename of the JPEG image
+"""
+def readJPEGMetadata(filename):
+    exif = None
+    xmp = b''
+    # {guid: (full length, {offset: chunk})} of the Extended XMP segments
+    extended = {}
+    with open(filename, 'rb') as f:
+        for marker, length in jpegSegments(f):
+            if marker != MARKER_APP1:
+                f.seek(length, io.SEEK_CUR)
+                continue
+            payload = f.read(length)
+            if len(payload) < length:
+                raise ValueError('JPEG is cut short')
+            if payload.startswith(EXIF_HEADER) and exif is None:
+                exif = payload
+            elif payload.startswith(XMP_HEADER) and not xmp:
+                xmp = payload[len(XMP_HEADER):]
+            elif payload.startswith(EXTENDED_XMP_HEADER):
+                # a GUID (32 hex digits), the full length and the offset of this chunk
+                header = payload[len(EXTENDED_XMP_HEADER):len(EXTENDED_XMP_HEADER) + 40]
+                if len(header) == 40:
+                    guid = header[:32].decode('ascii', errors='replace')
+                    fullLength, offset = struct.unpack('>II', header[32:])
+                    extended.setdefault(guid, (fullLength, {}))[1][offset] = payload[len(EXTENDED_XMP_HEADER) + 40:]
+
+    exifData = None
+    if exif is not None:
+        exifData = {}
+        rawExif = Image.Exif()
+        rawExif.load(exif)
+        for tag, value in rawExif._get_merged_dict().items():
+            exifData[ExifTags.TAGS.get(tag, tag)] = value
+
+    xmp_str = xmpText(xmp)
+    extendedXMP = joinExtendedXMP(extended, xmp_str)
+    if extendedXMP:
+        xmp_str += extendedXMP
+    return exifData, xmp_str
+
+"""walk the marker segments of a JPEG file, from its start to the start of scan
+
+    yields (marker, length) for each segment with a payload, with the file
+    positioned at the start of its payload of length bytes. The payload must be
+    read or skipped over (e.g. with f.seek) before the next segment is yielded
+
+Parameters
+----------
+f: file
+    a JPEG file opened in binary mode, positioned at its start
+"""
+def jpegSegments(f):
+    if f.read(2) != b'\xff\xd8':
+        raise ValueError('not a JPEG, no start of image marker')
+    while True:
+        byte = f.read(1)
+        if byte != b'\xff':
+            raise ValueError('JPEG is cut short, or has a corrupt marker')
+        # any number of 0xFF fill bytes may come before a marker
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            raise ValueError('JPEG is cut short')
+        marker = byte[0]
+        if marker in (MARKER_SOS, MARKER_EOI):
+            return
+        if marker in STANDALONE_MARKERS:
+            continue
+        size = f.read(2)
+        if len(size) < 2:
+            raise ValueError('JPEG is cut short')
+        # the length of a segment includes its own two bytes
+        length = struct.unpack('>H', size)[0] - 2
+        if length < 0:
+            raise ValueError('JPEG has a corrupt segment length')
+        yield marker, length
+
+# the text of an XMP packet, cut to its x:xmpmeta element if it has one
+def xmpText(xmp):
+    text = xmp.decode('utf-8', errors='replace')
+    start, end = text.find('<x:xmpmeta'), text.find('</x:xmpmeta>')
+    if start != -1 and end != -1:
+        text = text[start:end + len('</x:xmpmeta>')]
+    return text
+
+"""the text of the Extended XMP of a JPEG, from its chunks, or "" if it has none
+    or it is incomplete. If the main XMP names its Extended XMP (xmpNote:HasExtendedXMP)
+    only that one is used, otherwise the first complete one
+"""
+def joinExtendedXMP(extended, xmp_str):
+    guids = sorted(extended)
+    start = xmp_str.find('HasExtendedXMP')
+    if start != -1:
+        named = [guid for guid in guids if guid in xmp_str[start:start + 64]]
+        guids = named
+    for guid in guids:
+        fullLength, chunks = extended[guid]
+        data = b''
+        for offset, chunk in sorted(chunks.items()):
+            if offset != len(data):
+                # a chunk is missing
+                break
+            data += chunk
+        if len(data) == fullLength:
+            return xmpText(data)
+    return ""
+
+"""whether a file is a whole JPEG, i.e. it starts with the start of image marker
+    and ends with the end of image marker (ignoring any zero padding after it).
+    A JPEG still being written (e.g. copied or downloaded) is not yet whole
+
+Parameters
+----------
+filename: string
+    filename of the JPEG image
+"""
+def isCompleteJPEG(filename):
+    try:
+        with open(filename, 'rb') as f:
+            if f.read(2) != b'\xff\xd8':
+                return False
+            f.seek(0, io.SEEK_END)
+            size = f.tell()
+            f.seek(max(2, size - 4096))
+            tail = f.read()
+    except OSError:
+        return False
+    return tail.rstrip(b'\x00').endswith(b'\xff\xd9')
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+lazyDEM.py
+
+This file provides lazy access to GeoTIFF Digital Elevation Models that are
+    too large to be loaded into memory as a whole
+
+Uncompressed rasters are memory-mapped, compressed (tiled or stripped) rasters
+    are decoded one tile/strip at a time as they are used, and kept in a
+    least recently used (LRU) cache within a byte budget (see config.dem_cache_bytes)
+"""
+import itertools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import tifffile
+
+import config # OpenAthena global variables
+
+"""open the elevation data of a GeoTIFF DEM without reading it into memory
+
+    returns a np.memmap of the raster if it is uncompressed and contiguous in the file,
+    otherwise a LazyDEM which decodes its tiles/strips on demand.
+    Either can be used in place of the 2D array of elevation data
+
+Parameters
+----------
+geoFile: GeoTiff
+    the GeoTIFF DEM, as opened by the geotiff library
+geofilename: string
+    filename of the GeoTIFF DEM
+cacheBytes: int
+    optional, byte budget of the LazyDEM tile cache, defaults to config.dem_cache_bytes
+cache: TileCache
+    optional, a tile cache shared with other LazyDEMs, instead of one of cacheBytes
+"""
+def openLazyDEM(geoFile, geofilename, cacheBytes=None, cache=None):
+    with tifffile.TiffFile(geofilename) as tif:
+        memmappable = tif.pages[0].is_memmappable
+    if memmappable:
+        return tifffile.memmap(geofilename, page=0, mode='r')
+    return LazyDEM(geoFile.read(), cacheBytes, cache=cache, filename=geofilename)
+
+"""a least recently used (LRU) cache of decoded tiles, within a byte budget
+    may be shared by many LazyDEMs (e.g. the files of a DEM catalog, see demCatalog.py),
+    and used from multiple threads
+
+Parameters
+----------
+cacheBytes: int
+    optional, byte budget of the cache, defaults to config.dem_cache_bytes
+"""
+class TileCache(object):
+
+    def __init__(self, cacheBytes=None):
+        if cacheBytes is None:
+            cacheBytes = config.dem_cache_bytes
+        self.cacheBytes = cacheBytes
+        self.cachedBytes = 0
+        self.tiles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.tiles)
+
+    # the cached tile of a key, or None
+    def get(self, key):
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+            return tile
+
+    # add a tile, dropping least recently used tiles beyond the budget,
+    #     but always keeping the one just added
+    def put(self, key, tile):
+        with self.lock:
+            if key not in self.tiles:
+                self.tiles[key] = tile
+                self.cachedBytes += tile.nbytes
+            while self.cachedBytes > self.cacheBytes and len(self.tiles) > 1:
+                oldKey, oldTile = self.tiles.popitem(last=False)
+                self.cachedBytes -= oldTile.nbytes
+
+"""a read-only 2D array of elevation data, decoded one tile/strip at a time
+
+    supports the indexing used on elevation data throughout OpenAthena:
+    elevation[row, col] with ints or (broadcastable) integer arrays of
+    rows and columns, elevation[row] for a whole row, and windows with slices,
+    e.g. elevation[r0:r1, c0:c1]. np.asarray(elevation) reads the whole raster
+
+    Each tile is decoded the first time it is used, and kept until the cache
+    exceeds its byte budget, least recently used tiles are dropped first
+    (see TileCache). The cache may be used from multiple threads
+
+Parameters
+----------
+source: array-like
+    2D array which is read one tile at a time with source[r0:r1, c0:c1]
+    e.g. the zarr array of GeoTiff.read(), its chunks (the tiles or strips
+    of the GeoTIFF) are used as tiles
+cacheBytes: int
+    optional, byte budget of the tile cache, defaults to config.dem_cache_bytes
+tileShape: tuple
+    optional, (rows, cols) of each tile, defaults to the chunks of source
+cache: TileCache
+    optional, a tile cache shared with other LazyDEMs, instead of one of cacheBytes
+filename: string
+    optional, filename of the GeoTIFF DEM source is read from, so that other
+    processes may open it too (see sharedDEM.py)
+"""
+class LazyDEM(object):
+
+    ndim = 2
+    # tells apart the tiles of each LazyDEM in a shared cache
+    ids = itertools.count()
+
+    def __init__(self, source, cacheBytes=None, tileShape=None, cache=None, filename=None):
+        if tileShape is None:
+            tileShape = getattr(source, "chunks", None) or (256, 256)
+        self.source = source
+        self.filename = filename
+        self.shape = tuple(source.shape)
+        self.dtype = np.dtype(source.dtype)
+        self.size = self.shape[0] * self.shape[1]
+        self.nbytes = self.size * self.dtype.itemsize
+        self.tileRows, self.tileCols = int(tileShape[0]), int(tileShape[1])
+        self.tilesPerRow = -(-self.shape[1] // self.tileCols)
+        self.cache = TileCache(cacheBytes) if cache is None else cache
+        self.id = next(LazyDEM.ids)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        elevation = self[:, :]
+        return elevation if dtype is None else elevation.astype(dtype)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2:
+            raise IndexError(f'LazyDEM is 2D, got {len(key)} indices')
+        row, col = key
+        if isinstance(row, (slice, int, np.integer)) and isinstance(col, (slice, int, np.integer)):
+            if isinstance(row, slice) or isinstance(col, slice):
+                return self.window(row, col)
+            row, col = self.checkIndex(row, 0), self.checkIndex(col, 1)
+            return self.tile(row // self.tileRows, col // self.tileCols)[row % self.tileRows, col % self.tileCols]
+        return self.gather(row, col)
+
+    # bounds checked, non-negative index along an axis
+    def checkIndex(self, index, axis):
+        index = int(index)
+        if index < -self.shape[axis] or index >= self.shape[axis]:
+            raise IndexError(f'index {index} is out of bounds for axis {axis} with size {self.shape[axis]}')
+        return index % self.shape[axis]
+
+    # values at (broadcast) integer arrays of rows and columns, one pass per tile used
+    def gather(self, row, col):
+        row, col = np.broadcast_arrays(np.asarray(row), np.asarray(col))
+        if row.dtype.kind not in "iu" or col.dtype.kind not in "iu":
+            raise IndexError('LazyDEM only supports integer and slice indices')
+        shape = row.shape
+        row, col = row.ravel(), col.ravel()
+        if row.size and (row.min() < -self.shape[0] or row.max() >= self.shape[0]
+                         or col.min() < -self.shape[1] or col.max() >= self.shape[1]):
+            raise IndexError(f'index out of bounds for LazyDEM of shape {self.shape}')
+        row, col = np.mod(row, self.shape[0]), np.mod(col, self.shape[1])
+        result = np.empty(row.size, dtype=self.dtype)
+
+        tileIds = (row // self.tileRows) * self.tilesPerRow + col // self.tileCols
+        # indices of the values, grouped by tile
+        order = np.argsort(tileIds, kind='stable')
+        tileIds = tileIds[order]
+        starts = np.flatnonzero(np.diff(tileIds)) + 1
+        groups = np.split(order, starts)
+        for tileId, group in zip(tileIds[np.concatenate(([0], starts))].tolist(), groups):
+            tile = self.tile(tileId // self.tilesPerRow, tileId % self.tilesPerRow)
+            result[group] = tile[row[group] % self.tileRows, col[group] % self.tileCols]
+        return result.reshape(shape)
+
+    # a window of rows and columns, each an int or a slice, assembled from the tiles it overlaps
+    def window(self, row, col):
+        rows = range(*row.indices(self.shape[0])) if isinstance(row, slice) else [self.checkIndex(row, 0)]
+        cols = range(*col.indices(self.shape[1])) if isinstance(col, slice) else [self.checkIndex(col, 1)]
+        if len(rows) == 0 or len(cols) == 0:
+            result = np.empty((len(rows), len(cols)), dtype=self.dtype)
+        else:
+            r0, r1 = min(rows[0], rows[-1]), max(rows[0], rows[-1]) + 1
+            c0, c1 = min(cols[0], cols[-1]), max(cols[0], cols[-1]) + 1
+            result = np.empty((r1 - r0, c1 - c0), dtype=self.dtype)
+            for tileRow in range(r0 // self.tileRows, (r1 - 1) // self.tileRows + 1):
+                for tileCol in range(c0 // self.tileCols, (c1 - 1) // self.tileCols + 1):
+                    tile = self.tile(tileRow, tileCol)
+                    tr0, tc0 = tileRow * self.tileRows, tileCol * self.tileCols
+                    rr0, rr1 = max(r0, tr0), min(r1, tr0 + tile.shape[0])
+                    cc0, cc1 = max(c0, tc0), min(c1, tc0 + tile.shape[1])
+                    result[rr0 - r0:rr1 - r0, cc0 - c0:cc1 - c0] = tile[rr0 - tr0:rr1 - tr0, cc0 - tc0:cc1 - tc0]
+            # steps other than 1 (e.g. every nth row), from the enclosing window
+            result = result[rows[0] - r0::rows.step if isinstance(rows, range) else 1,
+                            cols[0] - c0::cols.step if isinstance(cols, range) else 1][:len(rows), :len(cols)]
+        if not isinstance(col, slice):
+            result = result[:, 0]
+        if not isinstance(row, slice):
+            result = result[0]
+        return result
+
+    # the decoded tile at (tileRow, tileCol), from the cache if possible
+    def tile(self, tileRow, tileCol):
+        key = (self.id, tileRow, tileCol)
+        tile = self.cache.get(key)
+        if tile is None:
+            r0, c0 = tileRow * self.tileRows, tileCol * self.tileCols
+            tile = np.asarray(self.source[r0:r0 + self.tileRows, c0:c0 + self.tileCols], dtype=self.dtype)
+            tile.flags.writeable = False
+            self.cache.put(key, tile)
+        return tile
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+mgrsEncoder.py
+
+This file encodes locations as NATO MGRS grid references, at 1m, 10m and 100m
+    precision at once (en.wikipedia.org/wiki/Military_Grid_Reference_System,
+    via github.com/hobuinc/mgrs)
+
+Each location is converted once, at 1m precision. The 10m and 100m references
+    are the same reference with its easting and northing digits truncated, which
+    is exactly what the mgrs library gives for the coarser precisions. A single
+    converter is shared by every conversion, so encoding many targets (e.g. for
+    a report) costs one conversion per target
+"""
+from collections import namedtuple
+
+import mgrs # Military Grid ref converter
+
+"""NATO MGRS grid reference of a location
+
+mgrs, mgrs10m, mgrs100m: string
+    the reference at 1m, 10m and 100m precision,
+    e.g. "33TUG0396131054", "33TUG03963105", "33TUG039310"
+gridZone: string
+    grid zone designator, e.g. "33T" (or "Z" in the polar regions)
+square: string
+    100km square identifier, e.g. "UG"
+digits: string
+    easting and northing of mgrs within the square, e.g. "0396131054",
+    underlined in terminal output
+"""
+MGRSRef = namedtuple("MGRSRef", ["mgrs", "mgrs10m", "mgrs100m", "gridZone", "square", "digits"])
+
+# shared by every conversion
+converter = mgrs.MGRS()
+
+"""the MGRSRef of a location
+raises mgrs.core.MGRSError if it can't be encoded (e.g. latitude out of range)
+
+Parameters
+----------
+latitude, longitude: float
+    WGS84 latitude and longitude, in decimal degrees
+"""
+def encodeOne(latitude, longitude):
+    reference = converter.toMGRS(float(latitude), float(longitude), MGRSPrecision=5)
+    # zone number (absent in the polar regions) and latitude band
+    zoneEnd = 0
+    while reference[zoneEnd].isdigit():
+        zoneEnd += 1
+    zoneEnd += 1
+    gridZone, square, digits = reference[:zoneEnd], reference[zoneEnd:zoneEnd + 2], reference[zoneEnd + 2:]
+    return MGRSRef(reference, truncate(reference, 4), truncate(reference, 3), gridZone, square, digits)
+
+"""the MGRSRefs of many locations, a list in the same order,
+None for each location which can't be encoded
+
+Parameters
+----------
+latitudes, longitudes: sequence of float (or array)
+    WGS84 latitudes and longitudes, in decimal degrees
+"""
+def encode(latitudes, longitudes):
+    references = []
+    for latitude, longitude in zip(latitudes, longitudes):
+        try:
+            references.append(encodeOne(latitude, longitude))
+        except (mgrs.core.MGRSError, ValueError, TypeError):
+            references.append(None)
+    return references
+
+"""an MGRS reference truncated to a coarser precision
+
+Parameters
+----------
+reference: string
+    MGRS reference, e.g. "33TUG0396131054"
+precision: int
+    number of digits of easting and of northing, e.g. 4 for 10m, 3 for 100m
+"""
+def truncate(reference, precision):
+    squareEnd = len(reference.rstrip("0123456789"))
+    digits = reference[squareEnd:]
+    half = len(digits) // 2
+    return reference[:squareEnd] + digits[:half][:precision] + digits[half:][:precision]
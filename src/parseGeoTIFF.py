@@ -7,19 +7,32 @@ This file is responsible for obtaining elevation data from a given GeoTIFF Digit
 May be run in user-interactive mode for displaying a color render of a GeoTIFF DEM
 """
 import sys
+import os
 import time
+import csv
+import json
 import matplotlib.pyplot as plt
 # from osgeo import gdal
 from geotiff import GeoTiff
 import math
+import tempfile
 from math import sin, asin, cos, atan2, sqrt
 import numpy as np
 import decimal # more float precision with Decimal objects
 
 import config # OpenAthena global variables
+import lazyDEM
+import demCatalog
+import demSidecar
+import geoid
 
 import getTarget
 
+# names of the interpolation kernels getAltFromLatLon and getAltFromLatLonArray may use
+KERNELS = ("idw", "nearest", "bilinear", "bicubic")
+# datapoints of a DEM processed at a time, by buildMaxPyramid
+BAND_DATAPOINTS = 1 << 24
+
 def main():
 
     if ("--version" in sys.argv or "-v" in sys.argv or "-V" in sys.argv or
@@ -30,7 +43,12 @@ def main():
     if len(sys.argv) == 1 or ("--help" in sys.argv or "-h" in sys.argv or
         "-H" in sys.argv or "H" in sys.argv or "help" in sys.argv):
         #
-        outstr = "usage: parseGeoTIFF.py [Rome-30m-DEM.tif]\n\nparseGeoTIFF.py may display a render of a GeoTIFF Digital Elevation Model.\nA GUI window will appear with an image render,\nmouse-over the image to view a tooltip where:\nx=longitude y=latitude [height above WGS84 reference ellipsoid]\n\nIf you exit the GUI, you will then be prompted for a latitude and longitude.\nYou may exit the program with CTRL+C, otherwise input a latitude and longitude\nto recieve the altitude of the nearest DEM datapoint"
+        outstr = "usage: parseGeoTIFF.py [Rome-30m-DEM.tif]\n       parseGeoTIFF.py <Rome-30m-DEM.tif | DEM-tile-directory> --points <points.csv|points.ndjson|-> [--format csv|ndjson] [--kernel idw|nearest|bilinear|bicubic]\n\nparseGeoTIFF.py may display a render of a GeoTIFF Digital Elevation Model.\nA GUI window will appear with an image render,\nmouse-over the image to view a tooltip where:\nx=longitude y=latitude [height above WGS84 reference ellipsoid]\n\nIf you exit the GUI, you will then be prompted for a latitude and longitude.\nYou may exit the program with CTRL+C, otherwise input a latitude and longitude\nto recieve the altitude of the nearest DEM datapoint\n\nWith --points, parseGeoTIFF.py instead reads points from a CSV or NDJSON file\n(or stdin, for '-') and writes each point with its elevation to stdout"
+
+    if "--points" in sys.argv:
+        # non-interactive mode, no GUI or prompts
+        queryPoints()
+        return
 
     if 1 < len(sys.argv) and len(sys.argv) < 3:
         ext = sys.argv[1].split('.')[-1].lower()
@@ -54,26 +72,8 @@ def main():
     # based on:
     # stackoverflow.com/a/24957068
 
-    # geodata = gdal.Open(geofile)
-    geodata = GeoTiff(geofile)
-
-    # band = geodata.GetRasterBand(1)
-
-    elevation = geodata.read()
-
-    try:
-        # convert to numpy array for drastic in-memory perf increase
-        elevation = np.array(elevation)
-    except MemoryError:
-        # it is possible, though highly unlikely,
-        #     ...that a very large geotiff may exceed memory bounds
-        #        this should only happen on 32-bit Python runtime
-        #        or computers w/ very little RAM
-        #
-        # performance will be severely impacted
-        elevation = None
-        elevation = geodata.read()
-
+    # read lazily if too large for memory, or from the DEM's sidecar if it has one
+    elevation, (x0, dx, dxdy, y0, dydx, dy) = getGeoFileFromString(geofile)
 
     print("The shape of the elevation data is: ", elevation.shape)
     time.sleep(1)
@@ -96,12 +96,6 @@ def main():
     # I'm making the assumption that the image isn't rotated/skewed/etc.
     # This is not the correct method in general, but let's ignore that for now
     # If dxdy or dydx aren't 0, then this will be incorrect
-    # x0, dx, dxdy, y0, dydx, dy = geodata.GetGeoTransform()
-    x0 = geodata.tifTrans.get_x(0,0)
-    dx = geodata.tifTrans.get_x(1,0) - x0
-    y0 = geodata.tifTrans.get_y(0,0)
-    dy = geodata.tifTrans.get_y(0,1) - y0
-    dxdy = dydx = 0
 
     # This should help with type conversion
     # mx+b
@@ -115,7 +109,13 @@ def main():
 
     xParams = (x0, x1, dx, ncols)
     yParams = (y0, y1, dy, nrows)
-    plt.imshow(elevation, cmap='gist_earth', extent=[x0, x1, y1, y0])
+    # render the finest overview with no more datapoints than the figure has pixels,
+    #     rather than the whole DEM
+    figure = plt.figure()
+    width, height = figure.get_size_inches() * figure.dpi
+    overviews = buildOverviews(elevation)
+    level = overviewLevelFor(overviews, int(height), int(width))
+    plt.imshow(np.asarray(overviews[level]), cmap='gist_earth', extent=[x0, x1, y1, y0])
     plt.show()
     while True:
         lat = getTarget.inputNumber('please enter a latitude: ', y1, y0)
@@ -125,14 +125,194 @@ def main():
 
 # end main func
 
+"""non-interactive mode of main(), for sampling many points at once
+    parseGeoTIFF.py dem.tif --points <points.csv|points.ndjson|-> [--format csv|ndjson] [--kernel <kernel>]
+
+    reads points from a file (or stdin, for '-') and writes them to stdout,
+    each with its elevation, see streamElevations
+    the format is taken from the file extension, unless given with --format
+    (stdin defaults to csv)
+    the interpolation kernel is one of KERNELS, defaults to config.kernel
+"""
+def queryPoints():
+    if len(sys.argv) < 2 or (sys.argv[1].split('.')[-1].lower() != "tif" and not os.path.isdir(sys.argv[1])):
+        sys.exit(f'FATAL ERROR: expected GeoTIFF ".tif" DEM as first argument!')
+    geofilename = sys.argv[1].strip()
+
+    i = sys.argv.index("--points")
+    if i + 1 >= len(sys.argv):
+        sys.exit("FATAL ERROR: expected filename (or '-' for stdin) after '--points'")
+    pointsfilename = sys.argv[i + 1]
+
+    fmt = None
+    if "--format" in sys.argv:
+        i = sys.argv.index("--format")
+        if i + 1 >= len(sys.argv) or sys.argv[i + 1].lower() not in ("csv", "ndjson"):
+            sys.exit("FATAL ERROR: expected 'csv' or 'ndjson' after '--format'")
+        fmt = sys.argv[i + 1].lower()
+    elif pointsfilename != "-" and pointsfilename.split('.')[-1].lower() in ("ndjson", "jsonl"):
+        fmt = "ndjson"
+    else:
+        fmt = "csv"
+
+    kernel = config.kernel
+    if "--kernel" in sys.argv:
+        i = sys.argv.index("--kernel")
+        if i + 1 >= len(sys.argv) or sys.argv[i + 1].lower() not in KERNELS:
+            sys.exit(f'FATAL ERROR: expected one of {", ".join(KERNELS)} after \'--kernel\'')
+        kernel = sys.argv[i + 1].lower()
+
+    elevationData, (x0, dx, dxdy, y0, dydx, dy) = getGeoFileFromString(geofilename)
+    nrows, ncols = elevationData.shape
+    xParams = (x0, x0 + dx * ncols, dx, ncols)
+    yParams = (y0, y0 + dy * nrows, dy, nrows)
+
+    if pointsfilename == "-":
+        streamElevations(sys.stdin, sys.stdout, fmt, xParams, yParams, elevationData, kernel=kernel)
+    else:
+        try:
+            infile = open(pointsfilename, newline='')
+        except OSError as e:
+            sys.exit(f'FATAL ERROR: can\'t open points file \'{pointsfilename}\': {e}')
+        with infile:
+            streamElevations(infile, sys.stdout, fmt, xParams, yParams, elevationData, kernel=kernel)
+
+"""read points from a CSV or NDJSON stream, and write each of them to another
+    stream with its elevation added, in the same format. Points are read and
+    looked up (see getAltFromLatLonArray) a chunk at a time, so any number
+    of points may be streamed
+
+    CSV: columns named lat/latitude and lon/lng/long/longitude are used if the
+        first row is a header, otherwise the first two columns are lat, lon.
+        Each row is written back out with an extra "elevation" column
+    NDJSON: one JSON object per line, with keys lat/latitude and lon/lng/long/longitude.
+        Each object is written back out with an extra "elevation" key
+
+    Points that are out of bounds, or whose lat/lon can't be read,
+    get an empty (CSV) or null (NDJSON) elevation
+
+Parameters
+----------
+infile: file
+     text stream of points
+outfile: file
+     text stream to write points with elevations to
+fmt: string
+     "csv" or "ndjson"
+xParams, yParams, elevation:
+     see getAltFromLatLon
+chunkSize: int
+     optional, number of points looked up at once
+kernel: string
+     optional, interpolation kernel, see getAltFromLatLonArray
+"""
+def streamElevations(infile, outfile, fmt, xParams, yParams, elevation, chunkSize=65536, kernel=None):
+    latNames = ("lat", "latitude")
+    lonNames = ("lon", "lng", "long", "longitude")
+
+    def toFloat(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return math.nan
+
+    if fmt == "csv":
+        reader = csv.reader(infile)
+        writer = csv.writer(outfile, lineterminator='\n')
+        latCol, lonCol = 0, 1
+        first = next(reader, None)
+        if first is None:
+            return
+        header = [name.strip().lower() for name in first]
+        if any(name in latNames for name in header) and any(name in lonNames for name in header):
+            latCol = next(i for i, name in enumerate(header) if name in latNames)
+            lonCol = next(i for i, name in enumerate(header) if name in lonNames)
+            writer.writerow(first + ["elevation"])
+            first = None
+
+        def records():
+            if first is not None:
+                yield first
+            for row in reader:
+                if row:
+                    yield row
+
+        def latLon(row):
+            if len(row) <= max(latCol, lonCol):
+                return math.nan, math.nan
+            return toFloat(row[latCol]), toFloat(row[lonCol])
+
+        def write(row, alt):
+            writer.writerow(row + ["" if math.isnan(alt) else f'{alt:.3f}'])
+    else:
+        def records():
+            for lineNumber, line in enumerate(infile, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    point = json.loads(line)
+                except ValueError:
+                    print(f'ERROR: skipping line {lineNumber}, invalid JSON', file=sys.stderr)
+                    continue
+                if not isinstance(point, dict):
+                    print(f'ERROR: skipping line {lineNumber}, expected a JSON object', file=sys.stderr)
+                    continue
+                yield point
+
+        def latLon(point):
+            lat = next((point[name] for name in latNames if name in point), None)
+            lon = next((point[name] for name in lonNames if name in point), None)
+            return toFloat(lat), toFloat(lon)
+
+        def write(point, alt):
+            point["elevation"] = None if math.isnan(alt) else round(alt, 3)
+            outfile.write(json.dumps(point) + "\n")
+
+    chunk = []
+    for record in records():
+        chunk.append(record)
+        if len(chunk) >= chunkSize:
+            writeChunk(chunk, latLon, write, xParams, yParams, elevation, kernel)
+            chunk = []
+    if chunk:
+        writeChunk(chunk, latLon, write, xParams, yParams, elevation, kernel)
+    outfile.flush()
+
+"""look up the elevations of a chunk of records and write them, see streamElevations
+"""
+def writeChunk(chunk, latLon, write, xParams, yParams, elevation, kernel=None):
+    lats, lons = np.array([latLon(record) for record in chunk], dtype=np.float64).reshape(-1, 2).T
+    alts = getAltFromLatLonArray(lats, lons, xParams, yParams, elevation, kernel)
+    for record, alt in zip(chunk, alts.tolist()):
+        write(record, alt)
+
 """get and open a geoFile named by a string
     e.g. from a command line argument
 
+    the name may also be a directory of GeoTIFF DEM tiles, which are read
+    as one seamless DEM (see demCatalog.DEMCatalog)
+
+    if the DEM has a fresh sidecar (see prepare_dem.py), it is loaded from
+    the sidecar instead, unless sidecar is False
+
+    the heights are converted to config.vertical_datum, see normalizeVerticalDatum
+
     if the name is invalid, exit with error
 
 """
-def getGeoFileFromString(geofilename):
+def getGeoFileFromString(geofilename, sidecar=True):
     geofilename.strip()
+    if sidecar:
+        prepared = demSidecar.loadSidecar(geofilename)
+        if prepared is not None:
+            return prepared
+    if os.path.isdir(geofilename):
+        # a directory of GeoTIFF DEM tiles, read as one seamless DEM
+        try:
+            catalog = demCatalog.DEMCatalog.fromDirectory(geofilename)
+        except ValueError:
+            sys.exit(f'FATAL ERROR: no GeoTIFF DEM tiles found in directory \'{geofilename}\'')
+        return normalizeVerticalDatum(catalog, catalog.geoTransform), catalog.geoTransform
     # geoFile = gdal.Open(geofilename)
     geoFile = GeoTiff(geofilename)
     if geoFile is None:
@@ -141,20 +321,7 @@ def getGeoFileFromString(geofilename):
 
     # band = geoFile.GetRasterBand(1)
     # elevationData = band.ReadAsArray()
-    elevationData = geoFile.read()
-
-    try:
-        # convert to numpy array for drastic in-memory perf increase
-        elevationData = np.array(elevationData)
-    except MemoryError:
-        # it is possible, though highly unlikely,
-        #     ...that a very large geotiff may exceed memory bounds
-        #        this should only happen on 32-bit Python runtime
-        #        or computers w/ very little RAM
-        #
-        # performance will be severely impacted
-        elevationData = None
-        elevationData = geodata.read()
+    elevationData = readElevationData(geoFile, geofilename)
 
     x0 = geoFile.tifTrans.get_x(0,0)
     dx = geoFile.tifTrans.get_x(1,0) - x0
@@ -166,8 +333,75 @@ def getGeoFileFromString(geofilename):
     dxdy = dydx = 0
     geoTransform = (x0, dx, dxdy, y0, dydx, dy)
 
+    elevationData = normalizeVerticalDatum(elevationData, geoTransform, demSidecar.readNodata(geofilename))
     return elevationData, geoTransform
 
+"""read the elevation data of an opened GeoTIFF DEM
+
+    returns a 2D NumPy array of the elevation data if it fits within
+    config.dem_in_memory_limit bytes, otherwise (or if it doesn't fit in memory)
+    a lazily read 2D array-like, see lazyDEM.openLazyDEM
+
+Parameters
+----------
+geoFile: GeoTiff
+    the GeoTIFF DEM, as opened by the geotiff library
+geofilename: string
+    filename of the GeoTIFF DEM
+"""
+def readElevationData(geoFile, geofilename):
+    elevationData = geoFile.read()
+    if elevationData.nbytes > config.dem_in_memory_limit:
+        return lazyDEM.openLazyDEM(geoFile, geofilename)
+
+    try:
+        # convert to numpy array for drastic in-memory perf increase
+        elevationData = np.array(elevationData)
+    except MemoryError:
+        # it is possible that a very large geotiff may exceed memory bounds
+        #     this should only happen on 32-bit Python runtime
+        #     or computers w/ very little RAM
+        #
+        # read it lazily instead, performance will be impacted
+        elevationData = None
+        elevationData = lazyDEM.openLazyDEM(geoFile, geofilename)
+    return elevationData
+
+"""convert the heights of a DEM from config.dem_vertical_datum to config.vertical_datum, once
+    so resolveTarget compares them with aircraft altitudes of the same datum,
+    without converting any height while resolving a target (see geoid.convertDEM)
+
+    returns elevationData itself if config.vertical_datum is None or the same
+    as config.dem_vertical_datum, otherwise the
+    converted heights, in memory, or in a temporary memory-mapped file if
+    elevationData is read lazily (see lazyDEM.py and demCatalog.py)
+
+    prepare_dem.py keeps the converted heights in the DEM's sidecar,
+    so they are not converted again each time the DEM is loaded
+
+Parameters
+----------
+elevationData: 2D array
+    elevation data of the DEM
+geoTransform: tuple
+    (x0, dx, dxdy, y0, dydx, dy) of the DEM, see getGeoFileFromString
+nodata: float
+    optional, nodata value of the DEM, left unchanged
+"""
+def normalizeVerticalDatum(elevationData, geoTransform, nodata=None):
+    if config.vertical_datum is None or geoid.datumEPSG(config.dem_vertical_datum) == geoid.datumEPSG(config.vertical_datum):
+        return elevationData
+    x0, dx, dxdy, y0, dydx, dy = geoTransform
+    nrows, ncols = elevationData.shape
+    xParams = (x0, x0 + dx * ncols, dx, ncols)
+    yParams = (y0, y0 + dy * nrows, dy, nrows)
+    out = None
+    if not isinstance(elevationData, np.ndarray):
+        # too large for memory
+        out = temporaryArray((nrows, ncols), "athena-dem-")
+    return geoid.convertDEM(elevationData, xParams, yParams, config.dem_vertical_datum, config.vertical_datum,
+                            out=out, nodata=nodata)
+
 """prompt the user for the entry of a GeoTIFF filename
     if filename is invalid, will re-prompt
     until a valid file name is entered
@@ -198,23 +432,15 @@ def getGeoFileFromUser():
                 continue
     #
 
+    # the DEM may have a fresh sidecar, see prepare_dem.py
+    prepared = demSidecar.loadSidecar(geofilename)
+    if prepared is not None:
+        return prepared
+
     # band = geoFile.GetRasterBand(1)
     # elevationData = band.ReadAsArray()
 
-    elevationData = geoFile.read()
-
-    try:
-        # convert to numpy array for drastic in-memory perf increase
-        elevationData = np.array(elevationData)
-    except MemoryError:
-        # it is possible, though highly unlikely,
-        #     ...that a very large geotiff may exceed memory bounds
-        #        this should only happen on 32-bit Python runtime
-        #        or computers w/ very little RAM
-        #
-        # performance will be severely impacted
-        elevationData = None
-        elevationData = geodata.read()
+    elevationData = readElevationData(geoFile, geofilename)
 
     x0 = geoFile.tifTrans.get_x(0,0)
     dx = geoFile.tifTrans.get_x(1,0) - x0
@@ -226,6 +452,7 @@ def getGeoFileFromUser():
     dxdy = dydx = 0
     geoTransform = (x0, dx, dxdy, y0, dydx, dy)
 
+    elevationData = normalizeVerticalDatum(elevationData, geoTransform, demSidecar.readNodata(geofilename))
     return elevationData, geoTransform
 
 # """check if a geoTiff is invalid, i.e. rotated or skewed
@@ -281,34 +508,41 @@ elevation: list[list]
      elevation[0][max] is NE corner of data
      elevation[max][0] is SW corner of data
      elevation[max][max] is SE corner of data
+kernel: string
+     optional, interpolation kernel, one of KERNELS, defaults to config.kernel
+     see getAltFromLatLonArray
 
 """
-def getAltFromLatLon(lat, lon, xParams, yParams, elevation):
+def getAltFromLatLon(lat, lon, xParams, yParams, elevation, kernel=None):
     x0, x1, dx, ncols = xParams
     y0, y1, dy, nrows = yParams
+    lat, lon = float(lat), float(lon)
+    if kernel is None:
+        kernel = config.kernel
     # Out of Bounds (OOB) check
     if (lat > y0 or y1 > lat) or (lon > x1 or x0 > lon):
         return None
-
-    # Kinda dumb
-    #     @todo this can be replaced with simple algerbra :/
-    xL, xR = binarySearchNearest(x0, ncols, lon, dx)
-    yT, yB = binarySearchNearest(y0, nrows, lat, dy)
-
-    x0, x1, dx = decimal.Decimal(x0), decimal.Decimal(x1), decimal.Decimal(dx)
-    y0, y1, dy = decimal.Decimal(y0), decimal.Decimal(y1), decimal.Decimal(dy)
-
-    lat, lon = decimal.Decimal(lat), decimal.Decimal(lon)
-
-    L1 = (y0 + yT * dy, x0 + xR * dx, decimal.Decimal(int(elevation[yT][xR])))
-    L2 = (y0 + yT * dy, x0 + xL * dx, decimal.Decimal(int(elevation[yT][xL])))
-    L3 = (y0 + yB * dy, x0 + xL * dx, decimal.Decimal(int(elevation[yB][xL])))
-    L4 = (y0 + yB * dy, x0 + xR * dx, decimal.Decimal(int(elevation[yB][xR])))
+    if kernel != "idw":
+        alt = getAltFromLatLonArray(lat, lon, xParams, yParams, elevation, kernel)
+        return None if alt is None or math.isnan(alt) else float(alt)
+
+    # the four datapoints surrounding the location,
+    #     the last row/column of the DEM is repeated past its edge
+    col, row = latLonToIndex(lat, lon, xParams, yParams)
+    xL, yT = min(math.floor(col), ncols - 1), min(math.floor(row), nrows - 1)
+    xR, yB = min(xL + 1, ncols - 1), min(yT + 1, nrows - 1)
+
+    L1 = (y0 + yT * dy, x0 + xR * dx, float(elevation[yT, xR]))
+    L2 = (y0 + yT * dy, x0 + xL * dx, float(elevation[yT, xL]))
+    L3 = (y0 + yB * dy, x0 + xL * dx, float(elevation[yB, xL]))
+    L4 = (y0 + yB * dy, x0 + xR * dx, float(elevation[yB, xR]))
     samples = [L1, L2, L3, L4]
     target = (lat, lon)
 
-    power = decimal.Decimal(2.0)
-    return idwInterpolation(target, samples, power)
+    power = 2.0
+    alt = idwInterpolation(target, samples, power)
+    # NaN where there is no data, e.g. between the tiles of a DEM catalog
+    return None if math.isnan(alt) else alt
 
     # xIndex = None
     # if ( abs(lon - (x0 + xL * dx)) < abs(lon - (x0 + xR * dx))):
@@ -328,21 +562,437 @@ def getAltFromLatLon(lat, lon, xParams, yParams, elevation):
 
 
 def idwInterpolation(target, samples, power):
-    sumWeights = decimal.Decimal(0.0)
-    sumWeightedElevations = decimal.Decimal(0.0)
+    sumWeights = 0.0
+    sumWeightedElevations = 0.0
 
+    lat, lon = math.radians(target[0]), math.radians(target[1])
+    # radius of the earth at the target, the samples are at most one cell away
+    r = float(getTarget.radius_at_lat_lon_float(lat, lon))
     for neighbor in samples:
-        distance = getTarget.haversine(target[1], target[0], neighbor[1], neighbor[0], neighbor[2])
+        # haversine formula, see getTarget.haversine_float
+        sLat, sLon = math.radians(neighbor[0]), math.radians(neighbor[1])
+        a = sin((sLat - lat) / 2) ** 2 + cos(lat) * cos(sLat) * sin((sLon - lon) / 2) ** 2
+        distance = 2 * asin(sqrt(a)) * (r + neighbor[2])
         if (abs(distance) <= 0.5):
             return neighbor[2]
 
-        weight = decimal.Decimal(1.0) / (distance ** power)
+        weight = 1.0 / (distance ** power)
         sumWeights += weight
         sumWeightedElevations += weight * neighbor[2]
 
     return sumWeightedElevations / sumWeights
 
 
+"""bulk (float64) counterpart of getAltFromLatLon, obtains the elevations of
+    many points in one NumPy pass. Used by the float engines in getTarget.py
+    and by the --points mode of parseGeoTIFF.py
+    accepts scalars or NumPy arrays of lat/lon and returns a float64 array of elevations
+
+    with the "idw" kernel, neighbour selection and IDW weighting mirror
+    getAltFromLatLon exactly, so the two only differ by floating point rounding.
+    Out of Bounds (OOB) points are returned as NaN instead of None,
+    i.e. np.isnan(result) is the mask of OOB points
+
+    The interpolation kernels (see each for its cost and accuracy):
+    "idw" inverse distance weighting of the 4 surrounding datapoints, the original (see idwInterpolationArray)
+    "nearest" nearest datapoint (see nearestInterpolation)
+    "bilinear" bilinear in grid-fraction space (see bilinearInterpolation)
+    "bicubic" cubic convolution of the 16 surrounding datapoints (see bicubicInterpolation)
+
+Parameters
+----------
+lat: float or array of float
+     latitude(s) of desired location(s) (e.g y-axis)
+lon: float or array of float
+     longitude(s) of desired location(s) (e.g. x-axis)
+xParams: tuple
+     tuple of 4 elements (x0, x1, dx, ncols), see getAltFromLatLon
+yParams: tuple
+     tuple of 4 elements (y0, y1, dy, nrows), see getAltFromLatLon
+elevation: 2D array
+     elevation data, see getAltFromLatLon
+kernel: string
+     optional, interpolation kernel, one of KERNELS, defaults to config.kernel
+"""
+def getAltFromLatLonArray(lat, lon, xParams, yParams, elevation, kernel=None):
+    x0, x1, dx, ncols = xParams
+    y0, y1, dy, nrows = yParams
+    if kernel is None:
+        kernel = config.kernel
+    if kernel not in KERNELS:
+        print(f'ERROR: unknown interpolation kernel "{kernel}", expected one of {KERNELS}', file=sys.stderr)
+        return None
+    lat, lon = np.broadcast_arrays(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+
+    # Out of Bounds (OOB) check, NaN input is treated as OOB
+    oob = ~((lat <= y0) & (y1 <= lat) & (lon <= x1) & (x0 <= lon))
+
+    col, row = latLonToIndex(lat, lon, xParams, yParams)
+    col, row = np.where(oob, 0.0, col), np.where(oob, 0.0, row)
+    if not hasattr(elevation, "shape"):
+        # (a lazily read DEM is left as-is, only the datapoints used are read)
+        elevation = np.asarray(elevation)
+    if kernel == "nearest":
+        result = nearestInterpolation(col, row, elevation)
+    elif kernel == "bilinear":
+        result = bilinearInterpolation(col, row, elevation)
+    elif kernel == "bicubic":
+        result = bicubicInterpolation(col, row, elevation)
+    else:
+        result = idwInterpolationArray(lat, lon, col, row, xParams, yParams, elevation)
+    return np.where(oob, np.nan, result)
+
+"""interpolation kernels of getAltFromLatLonArray
+
+Each takes arrays of the fractional (col, row) index of in bounds locations
+(see latLonToIndex) and returns a float64 array of their elevations.
+Past the last row/column of the DEM, its edge datapoints are repeated.
+Cost is per location, in datapoint reads and arithmetic.
+
+Parameters
+----------
+col, row: array of float
+     fractional column and row index of each location
+elevation: 2D array
+     elevation data, see getAltFromLatLon
+"""
+
+"""nearest neighbour kernel, see interpolation kernels above
+    cost: 1 datapoint read, the cheapest kernel
+    accuracy: a step function, off by up to half the change in elevation
+    between neighbouring datapoints. Exact at the datapoints
+"""
+def nearestInterpolation(col, row, elevation):
+    nrows, ncols = elevation.shape
+    xN = np.minimum(np.floor(col + 0.5).astype(np.intp), ncols - 1)
+    yN = np.minimum(np.floor(row + 0.5).astype(np.intp), nrows - 1)
+    return elevation[yN, xN].astype(np.float64)
+
+"""bilinear kernel, see interpolation kernels above
+    cost: 4 datapoint reads and a handful of multiplications, no trigonometry
+    accuracy: continuous, exact at the datapoints and linear along the grid
+    lines between them. This is what most DEM consumers (e.g. GDAL) expect,
+    and the same terrain surface the "dda" engine of getTarget.resolveTarget uses.
+    Interpolation in grid-fraction (i.e. lat/lon) space differs from true
+    distance weighting by far less than the DEM's own error
+"""
+def bilinearInterpolation(col, row, elevation):
+    nrows, ncols = elevation.shape
+    xL = np.minimum(np.floor(col).astype(np.intp), ncols - 1)
+    yT = np.minimum(np.floor(row).astype(np.intp), nrows - 1)
+    xR, yB = np.minimum(xL + 1, ncols - 1), np.minimum(yT + 1, nrows - 1)
+    fu, fv = col - xL, row - yT
+    h00 = elevation[yT, xL].astype(np.float64)
+    h01 = elevation[yT, xR].astype(np.float64)
+    h10 = elevation[yB, xL].astype(np.float64)
+    h11 = elevation[yB, xR].astype(np.float64)
+    return (h00 * (1 - fu) * (1 - fv) + h01 * fu * (1 - fv)
+            + h10 * (1 - fu) * fv + h11 * fu * fv)
+
+"""bicubic (Keys cubic convolution, a = -0.5) kernel, see interpolation kernels above
+    cost: 16 datapoint reads and 8 cubic weights, about 4x the bilinear kernel
+    accuracy: smooth (continuous slope), exact at the datapoints, and the most
+    faithful to smoothly curved terrain. Like any cubic it may overshoot
+    between datapoints on abrupt terrain, by up to 0.28x the local relief,
+    see buildMaxPyramid
+"""
+def bicubicInterpolation(col, row, elevation):
+    nrows, ncols = elevation.shape
+    xI = np.minimum(np.floor(col).astype(np.intp), ncols - 1)
+    yI = np.minimum(np.floor(row).astype(np.intp), nrows - 1)
+    weightsX = cubicWeights(col - xI)
+    weightsY = cubicWeights(row - yI)
+    result = np.zeros(np.shape(col))
+    for j, weightY in enumerate(weightsY):
+        yIdx = np.clip(yI + j - 1, 0, nrows - 1)
+        for i, weightX in enumerate(weightsX):
+            xIdx = np.clip(xI + i - 1, 0, ncols - 1)
+            result += weightY * weightX * elevation[yIdx, xIdx]
+    return result
+
+"""weights of the 4 datapoints (at -1, 0, 1, 2) of Keys cubic convolution, a = -0.5
+    for a fraction t (0.0 to 1.0) of the way from datapoint 0 to datapoint 1
+"""
+def cubicWeights(t):
+    t2, t3 = t * t, t * t * t
+    return ((-t3 + 2 * t2 - t) / 2,
+            (3 * t3 - 5 * t2 + 2) / 2,
+            (-3 * t3 + 4 * t2 + t) / 2,
+            (t3 - t2) / 2)
+
+"""inverse distance weighting kernel, the original kernel of getAltFromLatLon
+    see interpolation kernels above, also takes the lat/lon of each location
+    cost: 4 datapoint reads and 4 haversine distances, the most trigonometry of any kernel
+    accuracy: exact within 0.5m of a datapoint, but not continuous across cell
+    boundaries, as the far corners of a cell keep some weight up to its edge.
+    Kept as the reference kernel
+"""
+def idwInterpolationArray(lat, lon, col, row, xParams, yParams, elevation):
+    x0, x1, dx, ncols = xParams
+    y0, y1, dy, nrows = yParams
+    # the four datapoints surrounding each location, see getAltFromLatLon
+    xL = np.minimum(np.floor(col).astype(np.intp), ncols - 1)
+    yT = np.minimum(np.floor(row).astype(np.intp), nrows - 1)
+    xR, yB = np.minimum(xL + 1, ncols - 1), np.minimum(yT + 1, nrows - 1)
+    neighbors = [(yT, xR), (yT, xL), (yB, xL), (yB, xR)]
+
+    latRad, lonRad = np.radians(lat), np.radians(lon)
+    cosLat = np.cos(latRad)
+    r = getTarget.radius_at_lat_lon_float(latRad, lonRad)
+    sumWeights = np.zeros(lat.shape)
+    sumWeightedElevations = np.zeros(lat.shape)
+    # first neighbor within 0.5m is used as-is, like idwInterpolation
+    exact = np.full(lat.shape, np.nan)
+    for yIdx, xIdx in neighbors:
+        sLat, sLon = np.radians(y0 + yIdx * dy), np.radians(x0 + xIdx * dx)
+        sAlt = elevation[yIdx, xIdx].astype(np.float64)
+        # haversine formula, see idwInterpolation
+        a = np.sin((sLat - latRad) / 2) ** 2 + cosLat * np.cos(sLat) * np.sin((sLon - lonRad) / 2) ** 2
+        distance = 2 * np.arcsin(np.sqrt(a)) * (r + sAlt)
+        isExact = (np.abs(distance) <= 0.5) & np.isnan(exact)
+        exact = np.where(isExact, sAlt, exact)
+        # (a neighbor at distance 0 is exact, its infinite weight is discarded)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = 1.0 / (distance ** 2.0)
+            sumWeights += weight
+            sumWeightedElevations += weight * sAlt
+
+    with np.errstate(invalid='ignore'):
+        return np.where(np.isnan(exact), sumWeightedElevations / sumWeights, exact)
+
+"""given a latitude and longitude, return the fractional (col, row) index of
+    the location in the DEM, found in closed form from the geotransform
+    e.g. (2.25, 7.5) is a quarter of the way from column 2 to column 3,
+    and half way from row 7 to row 8. Accepts scalars or NumPy arrays
+
+Parameters
+----------
+lat: float or array of float
+     latitude(s) of desired location(s) (e.g y-axis)
+lon: float or array of float
+     longitude(s) of desired location(s) (e.g. x-axis)
+xParams: tuple
+     tuple of 4 elements (x0, x1, dx, ncols), see getAltFromLatLon
+yParams: tuple
+     tuple of 4 elements (y0, y1, dy, nrows), see getAltFromLatLon
+"""
+def latLonToIndex(lat, lon, xParams, yParams):
+    x0, x1, dx, ncols = xParams
+    y0, y1, dy, nrows = yParams
+    return (lon - x0) / dx, (lat - y0) / dy
+
+"""build a max-elevation pyramid (mipmap) of a DEM, for empty space skipping in
+    getTarget.resolveTarget. Build it once, right after the DEM is loaded
+
+    returns a list of 2D float32 arrays, from finest to coarsest
+    level 0 has one entry per DEM cell (the square between datapoints [row][col]
+    and [row+1][col+1]), an upper bound of the terrain anywhere within that cell
+    each next level halves the rows and columns, each entry is the max of the
+    (up to) 2x2 entries below it, until the last level is a single entry
+
+    the bound depends on the interpolation kernel: every kernel but "bicubic"
+    stays within the 4 datapoints at the corners of a cell, "bicubic" may
+    overshoot the 16 datapoints around it by up to 0.28125x their relief.
+    Build the pyramid with the same kernel as is passed to resolveTarget
+
+    the DEM is read a band of rows at a time. The pyramid of a DEM which
+    isn't in memory (read lazily, see lazyDEM.py, or memory-mapped) is about
+    1.33x as large as the DEM in float32, so its levels larger than a band
+    are written to temporary files and memory-mapped, rather than held in
+    memory. Building it still reads the whole DEM: if the DEM was loaded from
+    a sidecar which includes the pyramid (see prepare_dem.py), the pyramid is
+    loaded from the sidecar instead
+
+Parameters
+----------
+elevation: 2D array
+     elevation data, see getAltFromLatLon
+kernel: string
+     optional, interpolation kernel, one of KERNELS, defaults to config.kernel
+bandRows: int
+     optional, number of rows of the DEM read at a time, defaults to BAND_DATAPOINTS datapoints
+"""
+def buildMaxPyramid(elevation, kernel=None, bandRows=None):
+    if kernel is None:
+        kernel = config.kernel
+    pyramid = demSidecar.loadPyramid(elevation, kernel)
+    if pyramid is not None:
+        return pyramid
+    if not hasattr(elevation, "shape"):
+        elevation = np.asarray(elevation)
+    outOfCore = isinstance(elevation, np.memmap) or not isinstance(elevation, np.ndarray)
+    nrows, ncols = elevation.shape
+    if bandRows is None:
+        bandRows = max(1, BAND_DATAPOINTS // ncols)
+    # rows/columns of the datapoints around each cell that bound its terrain
+    first, last = (-1, 2) if kernel == "bicubic" else (0, 1)
+
+    level = pyramidLevel((nrows, ncols), outOfCore)
+    for r0 in range(0, nrows, bandRows):
+        r1 = min(r0 + bandRows, nrows)
+        # the band, plus the rows around it, the edge is repeated past the DEM
+        h0, h1 = max(r0 + first, 0), min(r1 + last, nrows)
+        band = np.asarray(elevation[h0:h1], dtype=np.float64)
+        band = np.concatenate([band[:1]] * (h0 - (r0 + first)) + [band] + [band[-1:]] * ((r1 + last) - h1), axis=0)
+        if kernel == "bicubic":
+            # max and min of the 4x4 datapoints, rows/columns -1 to +2 of each cell
+            high = neighborhoodReduce(band, np.maximum, first, last)
+            low = neighborhoodReduce(band, np.minimum, first, last)
+            # the negative weights of the cubic convolution sum to at most 0.28125
+            bound = high + 0.28125 * (high - low)
+        else:
+            bound = neighborhoodReduce(band, np.maximum, first, last)
+        # round up to a whole meter, float32 can hold it exactly and stay an upper bound
+        level[r0:r1] = np.ceil(bound[-first:bound.shape[0] - last]).astype(np.float32)
+
+    pyramid = [level]
+    while level.shape[0] > 1 or level.shape[1] > 1:
+        nrows, ncols = level.shape
+        # an even number of rows, so bands don't split a 2x2 block
+        levelRows = max(2, BAND_DATAPOINTS // ncols)
+        levelRows += levelRows % 2
+        coarser = pyramidLevel(((nrows + 1) // 2, (ncols + 1) // 2), outOfCore)
+        for r0 in range(0, nrows, levelRows):
+            coarser[r0 // 2:(r0 + levelRows + 1) // 2] = decimateMax(np.asarray(level[r0:r0 + levelRows]))
+        level = coarser
+        pyramid.append(level)
+    if outOfCore:
+        for level in pyramid:
+            if isinstance(level, np.memmap):
+                level.flush()
+    return pyramid
+
+"""an empty level of a max-elevation pyramid (see buildMaxPyramid), float32
+    memory-mapped from a temporary file (see temporaryArray) if outOfCore
+    and it's larger than BAND_DATAPOINTS
+"""
+def pyramidLevel(shape, outOfCore):
+    if not outOfCore or shape[0] * shape[1] <= BAND_DATAPOINTS:
+        return np.empty(shape, dtype=np.float32)
+    return temporaryArray(shape, "athena-pyramid-")
+
+"""an empty float32 np.memmap of a temporary file, for arrays too large for memory
+    the file is deleted once the array is no longer used. It is named,
+    so other processes may map it too (see sharedDEM.py)
+
+Parameters
+----------
+shape: tuple
+    shape of the array
+prefix: string
+    optional, prefix of the name of the file
+"""
+def temporaryArray(shape, prefix="athena-"):
+    tempFile = tempfile.NamedTemporaryFile(prefix=prefix)
+    array = np.memmap(tempFile, dtype=np.float32, mode='w+', shape=shape)
+    # kept open (and so not deleted) for as long as the array is
+    array.tempFile = tempFile
+    return array
+
+"""max of each 2x2 block of entries of a pyramid level, as float32
+    an odd last row/column makes blocks of its own
+"""
+def decimateMax(level):
+    nrows, ncols = level.shape
+    padded = np.full((nrows + nrows % 2, ncols + ncols % 2), -np.inf, dtype=np.float32)
+    padded[:nrows, :ncols] = level
+    return np.maximum(np.maximum(padded[0::2, 0::2], padded[0::2, 1::2]),
+                      np.maximum(padded[1::2, 0::2], padded[1::2, 1::2]))
+
+"""reduce (e.g. np.maximum) each datapoint of a DEM with its neighbours from
+    offset first to offset last (inclusive) along both rows and columns,
+    the edge datapoints are repeated past the edges of the DEM
+"""
+def neighborhoodReduce(elevation, reduce, first, last):
+    nrows, ncols = elevation.shape
+    rows = np.arange(nrows)
+    result = elevation[np.clip(rows + first, 0, nrows - 1)]
+    for offset in range(first + 1, last + 1):
+        result = reduce(result, elevation[np.clip(rows + offset, 0, nrows - 1)])
+    cols = np.arange(ncols)
+    reduced = result[:, np.clip(cols + first, 0, ncols - 1)]
+    for offset in range(first + 1, last + 1):
+        reduced = reduce(reduced, result[:, np.clip(cols + offset, 0, ncols - 1)])
+    return reduced
+
+"""build the overviews of a DEM, decimated copies of its elevation data
+    for work that only needs a coarse view of the terrain, e.g. rendering
+    (see main) or a coarse-to-fine search (see getTarget.marchOverview)
+
+    returns a list of 2D arrays, where level i is decimated 2^i times:
+    level 0 is the elevation data itself, and each datapoint of level i + 1
+    is the mean of (up to) 2x2 datapoints of level i, ignoring NaN (no data).
+    The last level is a single datapoint. Overviews from a DEM's sidecar
+    (see prepare_dem.py) are returned instead if it has them
+
+Parameters
+----------
+elevation: 2D array
+     elevation data, see getAltFromLatLon
+bandRows: int
+     optional, number of rows of the DEM read at a time, defaults to about 16M datapoints
+"""
+def buildOverviews(elevation, bandRows=None):
+    overviews = demSidecar.loadOverviews(elevation)
+    if overviews is not None:
+        return overviews
+    if not hasattr(elevation, "shape"):
+        elevation = np.asarray(elevation)
+    nrows, ncols = elevation.shape
+    if bandRows is None:
+        bandRows = max(2, (1 << 24) // ncols)
+    # an even number of rows, so bands don't split a 2x2 block
+    bandRows += bandRows % 2
+
+    overviews = [elevation]
+    if nrows <= 1 and ncols <= 1:
+        return overviews
+    level = np.empty(((nrows + 1) // 2, (ncols + 1) // 2), dtype=np.float32)
+    for r0 in range(0, nrows, bandRows):
+        level[r0 // 2:(r0 + bandRows + 1) // 2] = decimateMean(np.asarray(elevation[r0:r0 + bandRows], dtype=np.float64))
+    overviews.append(level)
+    while level.shape[0] > 1 or level.shape[1] > 1:
+        level = decimateMean(level).astype(np.float32)
+        overviews.append(level)
+    return overviews
+
+"""mean of each 2x2 block of datapoints of a 2D array, ignoring NaN
+    an odd last row/column makes blocks of its own
+"""
+def decimateMean(level):
+    nrows, ncols = level.shape
+    padded = np.full((nrows + nrows % 2, ncols + ncols % 2), np.nan, dtype=np.float64)
+    padded[:nrows, :ncols] = level
+    valid = ~np.isnan(padded)
+    padded[~valid] = 0.0
+    total = padded[0::2, 0::2] + padded[0::2, 1::2] + padded[1::2, 0::2] + padded[1::2, 1::2]
+    count = valid[0::2, 0::2].astype(np.int8) + valid[0::2, 1::2] + valid[1::2, 0::2] + valid[1::2, 1::2]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / count
+
+"""xParams and yParams (see getTarget.resolveTarget) of a level of the
+    overviews of a DEM (see buildOverviews), given those of the DEM
+    each datapoint of an overview lies at the center of the block of DEM
+    datapoints it is the mean of
+"""
+def overviewParams(xParams, yParams, level):
+    x0, x1, dx, ncols = xParams
+    y0, y1, dy, nrows = yParams
+    size = 1 << level
+    ncols, nrows = -(-ncols // size), -(-nrows // size)
+    x0, y0 = x0 + dx * (size - 1) / 2, y0 + dy * (size - 1) / 2
+    dx, dy = dx * size, dy * size
+    return (x0, x0 + dx * ncols, dx, ncols), (y0, y0 + dy * nrows, dy, nrows)
+
+"""the finest level of the overviews of a DEM (see buildOverviews) which
+    has no more than nrows rows and ncols columns, e.g. the pixels of a render
+"""
+def overviewLevelFor(overviews, nrows, ncols):
+    for level, overview in enumerate(overviews):
+        if overview.shape[0] <= nrows and overview.shape[1] <= ncols:
+            return level
+    return len(overviews) - 1
+
 """given a list and value, return a tuple of the two indexes in list whose value is closest to value
 
 Parameters
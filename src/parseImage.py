@@ -13,7 +13,8 @@ user community.
 
 Please email photo examples, with intact metadata and a locate-able subject in the direct center of image to matthew (at) krupczak (dot) org
 
-If your UAV make or model is not listed here, feel free to help out and make a pull request:
+If your UAV make or model is not listed here, feel free to help out and make a pull request
+(a new drone is an entry of XMP_SCHEMAS in dronePose.py):
 Makes:
     DJI
     Skydio
@@ -30,20 +31,21 @@ en.wikipedia.org/wiki/EXIF
 
 import sys
 import os
+import io
+import contextlib
+import multiprocessing
 import time
 import math
 from math import sin, asin, cos, atan2, sqrt
 import decimal # more float precision with Decimal objects
+import numpy as np
 
 # from osgeo import gdal # en.wikipedia.org/wiki/GDAL
 from geotiff import GeoTiff
 # https://pypi.org/project/mgrs/
-import mgrs # Military Grid ref converter
-# # # https://pypi.org/project/pyproj/
-from pyproj import CRS, Transformer # Python interface to PROJ (cartographic projections and coordinate transformations library)
-
-from PIL import Image
-from PIL import ExifTags
+import mgrsEncoder # Military Grid ref converter
+# EGM96 <-> WGS84 altitudes, see geoid.py
+import geoid
 
 #     write and mangle
 #     eli.thegreenplace.net/2012/03/15/processing-xml-in-python-with-elementtree
@@ -52,8 +54,14 @@ from PIL import ExifTags
 # except ImportError:
 #     import xml.etree.ElementTree as ET
 
-from parseGeoTIFF import getAltFromLatLon, binarySearchNearest, getGeoFileFromUser, getGeoFileFromString
+from parseGeoTIFF import getAltFromLatLon, binarySearchNearest, getGeoFileFromUser, getGeoFileFromString, buildMaxPyramid, buildOverviews
 from getTarget import *
+import getTarget
+import sharedDEM
+import jpegMetadata
+import dronePose
+import resultCache
+from dronePose import exifGetYXZ
 
 from WGS84_SK42_Translator import Translator as converter # rafasaurus' SK42 coord translator
 from SK42_Gauss_Kruger import Projector as Projector      # Matt's Gauss Kruger projector for SK42 (adapted from Nickname Nick)
@@ -67,35 +75,53 @@ from SK42_Gauss_Kruger import Projector as Projector      # Matt's Gauss Kruger
 def parseImage():
     images = []
     elevationData = None
+    # results of images already processed, see resultCache.py
+    cache = None
+    # number of worker processes for headless mode, see parseImagesHeadless
+    jobs = 1
+    # the command line, less the --jobs option
+    argv = list(sys.argv)
+    for i, segment in enumerate(argv):
+        if segment.lower() == "--jobs":
+            try:
+                jobs = int(argv[i + 1])
+            except (IndexError, ValueError):
+                jobs = 0
+            if jobs < 1:
+                sys.exit('FATAL ERROR: expected a number of processes (1 or more) after \'--jobs\'')
+            del argv[i:i + 2]
+            break
     headless = False
-    if len(sys.argv) > 2:
+    if len(argv) > 2:
         headless = True
 
-    if ("--version" in sys.argv or "-v" in sys.argv or "-V" in sys.argv or
-        "V" in sys.argv or "version" in sys.argv):
+    if ("--version" in argv or "-v" in argv or "-V" in argv or
+        "V" in argv or "version" in argv):
         #
         sys.exit(config.version)
-    elif ("--help" in sys.argv or "-h" in sys.argv or
-        "-H" in sys.argv or "H" in sys.argv or "help" in sys.argv):
+    elif ("--help" in argv or "-h" in argv or
+        "-H" in argv or "H" in argv or "help" in argv):
         #
-        outstr = "usage: parseImage.py [dem.tif] [Drone-Image.JPG] [Drone-Image2.JPG] [...]\n\nparseImage.py may take a GeoTIFF DEM (.tif) as input.\n\nIf provided one or more drone image filenames after,\nparseImage.py will run in headless mode and write a file of the convention:\n[Drone-Image.JPG.ATHENA]\n\nOtherwise, The user will be prompted for one or more image filenames. \nWhen finished, target match output will be displayed for each image\n"
+        outstr = "usage: parseImage.py [dem.tif | DEM-tile-directory] [Drone-Image.JPG] [Drone-Image2.JPG] [...] [--jobs N]\n\nparseImage.py may take a GeoTIFF DEM (.tif) as input.\n\nIf provided one or more drone image filenames after,\nparseImage.py will run in headless mode and write a file of the convention:\n[Drone-Image.JPG.ATHENA]\nWith --jobs N, the images are processed by N processes at once\n\nOtherwise, The user will be prompted for one or more image filenames. \nWhen finished, target match output will be displayed for each image\n"
         sys.exit(outstr)
 
     # If provided arguments in command line,
     #     the first argument must be a geoTiff filename
     #     and every other argument after is a drone image filename
-    if len(sys.argv) > 1:
-        ext = sys.argv[1].split('.')[-1].lower()
-        if ext != "tif":
+    if len(argv) > 1:
+        ext = argv[1].split('.')[-1].lower()
+        # (a directory of GeoTIFF DEM tiles is read as one seamless DEM, see demCatalog.py)
+        if ext != "tif" and not os.path.isdir(argv[1]):
             if ext in ["dt0", "dt1", "dt2", "dt3", "dt4", "dt5"]:
                 print(f'FILE FORMAT ERROR: DTED format ".{ext}" not supported. Please use a GeoTIFF ".tif" file!')
-            outstr = f'FATAL ERROR: got first argument: {sys.argv[1]}, expected GeoTIFF ".tif" DEM!'
+            outstr = f'FATAL ERROR: got first argument: {argv[1]}, expected GeoTIFF ".tif" DEM!'
             sys.exit(outstr)
 
-        elevationData, (x0, dx, dxdy, y0, dydx, dy) = getGeoFileFromString(sys.argv[1])
+        elevationData, (x0, dx, dxdy, y0, dydx, dy) = getGeoFileFromString(argv[1])
+        cache = resultCache.ResultCache.fromConfig(argv[1])
 
         if headless:
-            for imageName in sys.argv[2:]:
+            for imageName in argv[2:]:
                 images.append(imageName.strip())
     else:
         # prompt the user for a filename of a GeoTIFF,
@@ -105,6 +131,10 @@ def parseImage():
     nrows, ncols = elevationData.shape
     x1 = x0 + dx * ncols
     y1 = y0 + dy * nrows
+    # max-elevation pyramid, lets resolveTarget skip over terrain the line of sight can't reach (not used by the "decimal" engine)
+    pyramid = buildMaxPyramid(elevationData) if config.engine != "decimal" else None
+    # decimated overviews, for the coarse-to-fine "overview" engine
+    overviews = buildOverviews(elevationData) if config.engine == "overview" else None
 
     if not headless:
         print("The shape of the elevation data is: ", elevationData.shape)
@@ -132,773 +162,414 @@ def parseImage():
         #
     #
 
+    if headless:
+        parseImagesHeadless(images, elevationData, xParams, yParams, pyramid, overviews, jobs, cache)
+        return
+
     while images:
         thisImage = images.pop()
         thisImage = thisImage.strip()
 
-        sensData = None, None, None, None, None
-        target = None
-        try:
-        # if True:
-            #from stackoverflow.com/a/14637315
-            #    if XMP in image is spread in multiple pieces, this
-            #    approach will fail to extract data in all
-            #    but the first XMP piece of image
-            fd = open(thisImage, 'rb') #read as binary
-            d = str(fd.read()) # ...but convert to string
-            xmp_start = d.find('<x:xmpmeta')
-            xmp_end = d.find('</x:xmpmeta')
-            xmp_str = d[xmp_start:xmp_end+12]
-            fd.close()
-
-            exifData = {}
-            img = Image.open(thisImage)
-            exifDataRaw = img._getexif()
-            for tag, value in exifDataRaw.items():
-                decodedTag = ExifTags.TAGS.get(tag, tag)
-                exifData[decodedTag] = value
-
-            # print(exifData)
-
-            # agisoft.com/forum/index.php?topic=5008.0
-            # Alexey Pasumansky
-            # makeTag = "tiff:Make="
-            if xmp_start != xmp_end:
-                # tagStart = xmp_str.find(makeTag)
-                # xmpMake = xmp_str[tagStart + len(makeTag) : tagStart + len(makeTag) + 10]
-                # xmpMake = str(xmpMake.split('\"',3)[1])
-                # print(f'xmpMake: {xmpMake}')
-                make = exifData["Make"].upper()
-                make = make.strip()
-                model = exifData["Model"].upper()
-                model = model.strip()
-                if make[-1] == "\0":
-                    # fix nul terminated string bug
-                    # joelonsoftware.com/2003/10/08/the-absolute-minimum-every-software-developer-absolutely-positively-must-know-about-unicode-and-character-sets-no-excuses
-                    make = make.rstrip("\0")
-
-                if make == "DJI":
-                    sensData = handleDJI(xmp_str)
-                    if sensData is not None:
-                        y, x, z, azimuth, theta = sensData
-                        target = resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams)
-                    else:
-                        print(f'ERROR with {thisImage}, couldn\'t find sensor data', file=sys.stderr)
-                        print(f'skipping {thisImage}', file=sys.stderr)
-                        continue
-                elif make == "SKYDIO":
-                    sensData = handleSKYDIO(xmp_str)
-                    if sensData is not None:
-                        y, x, z, azimuth, theta = sensData
-                        target = resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams)
-                    else:
-                        print(f'ERROR with {thisImage}, couldn\'t find sensor data', file=sys.stderr)
-                        print(f'skipping {thisImage}', file=sys.stderr)
-                        continue
-                elif make == "AUTEL ROBOTICS":
-                    sensData = handleAUTEL(xmp_str, exifData)
-                    if sensData is not None:
-                        y, x, z, azimuth, theta = sensData
-                        target = resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams)
-                    else:
-                        print(f'ERROR with {thisImage}, couldn\'t find sensor data', file=sys.stderr)
-                        print(f'skipping {thisImage}', file=sys.stderr)
-                        continue
-                elif make == "PARROT":
-                    # will whitelist more models as they are tested
-                    if model != "ANAFI":
-                        # for instance, the parrot disco fixed-wing doesn't
-                        #     have a camera gimbal
-                        print(f'ERROR with {thisImage}, Parrot {model} is not supported', file=sys.stderr)
-                        print(f'skipping {thisImage}', file=sys.stderr)
-                        continue
-                    else:
-                        sensData = handlePARROT(xmp_str, exifData)
-                        if sensData is not None:
-                            y, x, z, azimuth, theta = sensData
-                            target = resolveTarget(y, x, z, azimuth, theta, elevationData, xParams, yParams)
-                        else:
-                            print(f'ERROR with {thisImage}, couldn\'t find sensor data', file=sys.stderr)
-                            print(f'skipping {thisImage}', file=sys.stderr)
-                            continue
-
-                elif False: # your drone make here
-                    # <----YOUR HANDLER FUNCTION HERE---->
-                    pass
-                elif False: # your drone make here
-                    # <----YOUR HANDLER FUNCTION HERE---->
-                    pass
-                else:
-                    print(f'ERROR with {thisImage}, make {make} not compatible with this program!', file=sys.stderr)
-                    print(f'skipping {thisImage}', file=sys.stderr)
-                    continue
-
-            else:
-                print(f'ERROR with {thisImage}, xmp data not found!', file=sys.stderr)
-                print(f'skipping {thisImage}', file=sys.stderr)
-                continue
-        # else:
-        except:
-            print(f'ERROR with filename {thisImage}, skipping...', file=sys.stderr)
+        result = resolveImage(thisImage, elevationData, xParams, yParams, pyramid, overviews, cache)
+        if result is None:
             continue
-        #
+        target = result.target
         if target is not None:
             finalDist, tarY, tarX, tarZ, terrainAlt = target
-            #convert WGS to EGM96
-            tarZ = WGStoEGM(tarY, tarX, tarZ)
-
-            if headless:
-
-                filename = thisImage + ".ATHENA"
-                dateTime = exifData["DateTime"]
-
-                file_object = open(filename, 'w')
-
-                m = mgrs.MGRS()
-                targetMGRS = m.toMGRS(tarY, tarX)
-                targetMGRS10m = m.toMGRS(tarY,tarX, MGRSPrecision=4)
-                targetMGRS100m = m.toMGRS(tarY, tarX, MGRSPrecision=3)
-
-                file_object.write(str(tarY) + "\n")
-                file_object.write(str(tarX) + "\n")
-                if tarZ is None:
-                    tarZ = terrainAlt
-                file_object.write(str(tarZ) + "\n")
-                file_object.write(str(finalDist) + "\n")
-                if dateTime is not None:
-                    file_object.write(str(dateTime) + "\n")
-                else:
-                    file_object.write("\n")
-                file_object.write(targetMGRS + "\n")
-                file_object.write(targetMGRS10m + "\n")
-                file_object.write(targetMGRS100m + "\n")
-
-
-                # # normal decimal like GPS co-ords, "WGS84"
-                # wgs84 = "epsg:4326"
-                # # SK-42, A.K.A CK-42 A.K.A. Pulkovo 1942 A.K.A Gauss Kruger
-                # # alternative, ellipsoidal projection used by
-                # # many old soviet maps
-                # #
-                # # coordinates expressed as Y, X, units in meters
-                # #
-                # # ID:
-                # #     CM 159 E
-                # #     epsg:4284
-                # #     https://spatialreference.org/ref/epsg/4284/
-                # sk42 = "epsg:28468"
-                # transformer = Transformer.from_crs(wgs84, sk42)
-                # targetSK42Lon, targetSK42Lat = transformer.transform(float(tarX), float(tarY))
-
-                targetSK42Lat = converter.WGS84_SK42_Lat(float(tarY), float(tarX), float(tarZ))
-                targetSK42Lon = converter.WGS84_SK42_Long(float(tarY), float(tarX), float(tarZ))
-                targetSK42Alt = float(tarZ) - converter.SK42_WGS84_Alt(targetSK42Lat, targetSK42Lon, 0.0)
-                file_object.write(f'{targetSK42Lat}\n')
-                file_object.write(f'{targetSK42Lon}\n')
-                file_object.write(f'{targetSK42Alt}\n')
-                GK_zone, targetSK42_N_GK, targetSK42_E_GK = Projector.SK42_Gauss_Kruger(targetSK42Lat, targetSK42Lon)
-                file_object.write(f'{GK_zone}\n')
-                file_object.write(f'{targetSK42_N_GK}\n')
-                file_object.write(f'{targetSK42_E_GK}\n')
-
-                file_object.write("# format: lat, lon, alt, dist, time, MGRS 1m, MGRS 10m, MGRS 100m, SK42 Lat, SK42 Lon, SK42 Alt., SK42 Gauss-Krüger Zone, SK42 Gauss-Krüger Northing (X), SK42 Gauss-Krüger Easting (Y),  \n")
-
-                if make == "AUTEL ROBOTICS":
-                    file_object.write(f'# CAUTION: in-accuracies have been observed with Autel drones. This result is from a "{model}" drone')
-
-                file_object.close()
+            #convert to EGM96
+            tarZ, terrainAlt = egmAltitudes(tarY, tarX, tarZ, terrainAlt)
+
+            print(f'\n\nfilename: {thisImage}')
+            dateTime = result.dateTime
+            if dateTime is not None:
+                print(f'Image Date/Time: {dateTime}')
+
+            print(f'\nApproximate range to target: {int(round(finalDist))}\n')
+
+            if not math.isnan(tarZ):
+                print(f'Approximate EGM96 alt (constructed): {math.ceil(tarZ)}')
+            else:
+                # edge case where drone camera is pointed straight down
+                tarZ = float(terrainAlt)
+            print(f'Approximate EGM96 alt (terrain): {round(terrainAlt)}\n')
+
+            print('Target:')
+            print(f'WGS84 (lat, lon): {round(tarY, 6)}, {round(tarX, 6)} EGM96 Alt: {math.ceil(tarZ)}')
+            print(f'Google Maps: https://maps.google.com/?q={round(tarY,6)},{round(tarX,6)}\n')
+            # en.wikipedia.org/wiki/Military_Grid_Reference_System
+            # via github.com/hobuinc/mgrs
+            targetMGRS = mgrsEncoder.encodeOne(tarY, tarX)
+            if os.name != 'nt':
+                print(f'NATO MGRS: {targetMGRS.gridZone}{targetMGRS.square}\033[4m{targetMGRS.digits}\033[0;0m EGM96 Alt: \033[4m{math.ceil(tarZ)}\033[0;0m')
             else:
-                print(f'\n\nfilename: {thisImage}')
-                dateTime = exifData["DateTime"]
-                if dateTime is not None:
-                    print(f'Image Date/Time: {dateTime}')
-
-                print(f'\nApproximate range to target: {int(round(finalDist))}\n')
-
-                if tarZ is not None:
-                    print(f'Approximate EGM96 alt (constructed): {math.ceil(tarZ)}')
-                else:
-                    # edge case where drone camera is pointed straight down
-                    tarZ = float(terrainAlt)
-                print(f'Approximate EGM96 alt (terrain): {round(terrainAlt)}\n')
-
-                print('Target:')
-                print(f'WGS84 (lat, lon): {round(tarY, 6)}, {round(tarX, 6)} EGM96 Alt: {math.ceil(tarZ)}')
-                print(f'Google Maps: https://maps.google.com/?q={round(tarY,6)},{round(tarX,6)}\n')
-                # en.wikipedia.org/wiki/Military_Grid_Reference_System
-                # via github.com/hobuinc/mgrs
-                m = mgrs.MGRS()
-                targetMGRS = m.toMGRS(tarY, tarX)
-                targetMGRS10m = m.toMGRS(tarY,tarX, MGRSPrecision=4)
-                targetMGRS100m = m.toMGRS(tarY, tarX, MGRSPrecision=3)
-                gzdEndIndex = 2
-                while(targetMGRS[gzdEndIndex].isalpha()):
-                    gzdEndIndex += 1
-                if os.name != 'nt':
-                    print(f'NATO MGRS: {targetMGRS[0:gzdEndIndex]}\033[4m{targetMGRS[gzdEndIndex:]}\033[0;0m EGM96 Alt: \033[4m{math.ceil(tarZ)}\033[0;0m')
-                else:
-                    print(f'NATO MGRS: {targetMGRS} EGM96 Alt: {math.ceil(tarZ)}')
-                print(f'MGRS 10m: {targetMGRS10m}')
-                print(f'MGRS 100m: {targetMGRS100m}\n')
-
-                # # normal decimal like GPS co-ords, "WGS84"
-                # wgs84 = "epsg:4326"
-                # SK-42, A.K.A CK-42 A.KA Pulkovo 1942 A.K.A Gauss Kruger
-                # alternative, ellipsoidal projection used by
-                # many old soviet maps
-                #
-                # coordinates expressed as Y, X, units in meters
-                #
-                # ID:
-                #     CM 159 E
-                #     epsg:4284
-                #     https://spatialreference.org/ref/epsg/4284/
-                # sk42 = "epsg:4284"
-                # sk42 = "epsg:4024"
-                # transformer = Transformer.from_crs(wgs84, sk42)
-                # targetSK42Lon, targetSK42Lat, targetSK42Alt = transformer.transform(float(tarX), float(tarY), float(tarZ))
-                # targetSK42Lon = round(targetSK42Lon,6)
-                # targetSK42Lat = round(targetSK42Lat,6)
-                # print(f'SK42 (TESTING ONLY): {targetSK42Lat}, {targetSK42Lon}, Alt: {targetSK42Lat}')
-
-                # @TODO: Convert altitude from EGM96 to WGS84 vertical datum before converting to SK42!
-                targetSK42Lat = converter.WGS84_SK42_Lat(float(tarY), float(tarX), float(tarZ))
-                targetSK42Lon = converter.WGS84_SK42_Long(float(tarY), float(tarX), float(tarZ))
-                # Note: This altitude calculation assumes the SK42 and WGS84 ellipsoid have the exact same center
-                #     This is not totally correct, but in practice is close enough to the actual value
-                #     @TODO Could be refined at a later time with better math
-                #     See: https://gis.stackexchange.com/a/88499
-                targetSK42Alt = float(tarZ) - converter.SK42_WGS84_Alt(targetSK42Lat, targetSK42Lon, 0.0)
-                targetSK42Alt = int(round(targetSK42Alt))
-                print('SK42 (истема координат 1942 года):')
-                print(f'    Geodetic (°): {round(targetSK42Lat, 6)}, {round(targetSK42Lon, 6)} Alt: {targetSK42Alt}')
-                targetSK42LatDMS, targetSK42LonDMS = decimalToDegreeMinuteSecond(targetSK42Lat, targetSK42Lon)
-                print('    Geodetic (° \' "):')
-                print('      '+targetSK42LatDMS)
-                print('      '+targetSK42LonDMS)
-                GK_zone, targetSK42_N_GK, targetSK42_E_GK = Projector.SK42_Gauss_Kruger(targetSK42Lat, targetSK42Lon)
-                outstr = strFormatSK42GK(GK_zone, targetSK42_N_GK, targetSK42_E_GK, targetSK42Alt)
-                print(outstr)
+                print(f'NATO MGRS: {targetMGRS.mgrs} EGM96 Alt: {math.ceil(tarZ)}')
+            print(f'MGRS 10m: {targetMGRS.mgrs10m}')
+            print(f'MGRS 100m: {targetMGRS.mgrs100m}\n')
+
+            # # normal decimal like GPS co-ords, "WGS84"
+            # wgs84 = "epsg:4326"
+            # SK-42, A.K.A CK-42 A.KA Pulkovo 1942 A.K.A Gauss Kruger
+            # alternative, ellipsoidal projection used by
+            # many old soviet maps
+            #
+            # coordinates expressed as Y, X, units in meters
+            #
+            # ID:
+            #     CM 159 E
+            #     epsg:4284
+            #     https://spatialreference.org/ref/epsg/4284/
+            # sk42 = "epsg:4284"
+            # sk42 = "epsg:4024"
+            # transformer = Transformer.from_crs(wgs84, sk42)
+            # targetSK42Lon, targetSK42Lat, targetSK42Alt = transformer.transform(float(tarX), float(tarY), float(tarZ))
+            # targetSK42Lon = round(targetSK42Lon,6)
+            # targetSK42Lat = round(targetSK42Lat,6)
+            # print(f'SK42 (TESTING ONLY): {targetSK42Lat}, {targetSK42Lon}, Alt: {targetSK42Lat}')
+
+            # @TODO: Convert altitude from EGM96 to WGS84 vertical datum before converting to SK42!
+            # Note: This altitude calculation assumes the SK42 and WGS84 ellipsoid have the exact same center
+            #     This is not totally correct, but in practice is close enough to the actual value
+            #     @TODO Could be refined at a later time with better math
+            #     See: https://gis.stackexchange.com/a/88499
+            targetSK42Lat, targetSK42Lon, targetSK42Alt = converter.WGS84_SK42(float(tarY), float(tarX), float(tarZ))
+            targetSK42Alt = int(round(targetSK42Alt))
+            print('SK42 (истема координат 1942 года):')
+            print(f'    Geodetic (°): {round(targetSK42Lat, 6)}, {round(targetSK42Lon, 6)} Alt: {targetSK42Alt}')
+            targetSK42LatDMS, targetSK42LonDMS = decimalToDegreeMinuteSecond(targetSK42Lat, targetSK42Lon)
+            print('    Geodetic (° \' "):')
+            print('      '+targetSK42LatDMS)
+            print('      '+targetSK42LonDMS)
+            GK_zone, targetSK42_N_GK, targetSK42_E_GK = Projector.SK42_Gauss_Kruger(targetSK42Lat, targetSK42Lon)
+            outstr = strFormatSK42GK(GK_zone, targetSK42_N_GK, targetSK42_E_GK, targetSK42Alt)
+            print(outstr)
     #
 
-"""takes a xmp metadata string from a drone image of type "DJI Meta Data",
-returns tuple (y, x, z, azimuth, theta)
+"""read the sensor data of a drone image and resolve its target, see resolveTarget
+returns a resultCache.Result, with the target of resolveTarget (or None),
+or None if the image was skipped (with an error printed)
 
 Parameters
 ----------
-xmp_str : String
-    a string containing the contents of XMP metadata of "DJI Meta Data" format
-    may contain errant newline sequences, preventing parsing as true XML
-elements : String[]
-    optionally passed in to override XMP tags to use for search
-    e.x.: with Autel drones, replace "drone-dji:GpsLatitude=" with "drone:GpsLatitude", etc.
+thisImage : string
+    filename of the drone image
+elevationData, xParams, yParams, pyramid, overviews :
+    see resolveTarget
+cache : resultCache.ResultCache
+    optional, the result is taken from cache if the image hasn't changed since
+    it was last processed, otherwise it is kept there
 """
-def handleDJI( xmp_str, elements=None):
-    # default, unless overridden
-    if elements == None:
-        elements = ["drone-dji:AbsoluteAltitude=",
-                    "drone-dji:GpsLatitude=",
-                    "drone-dji:GpsLongitude=",
-                    # Gimbal values are absolute
-                    "drone-dji:GimbalRollDegree=", #should always be 0
-                    "drone-dji:GimbalYawDegree=",
-                    "drone-dji:GimbalPitchDegree=",
-                    # ...not relative to these values
-                    # https://developer.dji.com/iframe/mobile-sdk-doc/android/reference/dji/sdk/Gimbal/DJIGimbal.html
-                    # could be different for other mfns.?
-                    "drone-dji:FlightRollDegree=",
-                    "drone-dji:FlightYawDegree=",
-                    "drone-dji:FlightPitchDegree="]
-
-    dict = xmp_parse( xmp_str, elements)
-    if dict is None:
-        return None
-
-    # print( xmp_str )
-    # print([e for e in elements if "GpsLongitude" in e][0])
-
+def resolveImage(thisImage, elevationData, xParams, yParams, pyramid=None, overviews=None, cache=None):
+    target = None
+    if cache is not None:
+        key = cache.fileKey(thisImage)
+        result = cache.lookup(key)
+        if result is not None:
+            sendCachedTarget(result)
+            return result
     try:
-        y = float(dict[[e for e in elements if "GpsLatitude" in e][0]])
-    except ValueError:
-        print("Value Error")
-        return None
-    except TypeError:
-        print(str(dict[[e for e in elements if "GpsLatitude" in e][0]]))
-        print("Type Error")
-        return None
-
-    # Autel drones have a typo, "GpsLongtitude" instead of "GpsLongitude"
-    #     we must be able to handle either case, with or w/o typo
-    #     in case it is fixed later :(
-    typoAgnostic = [e for e in elements if "GpsLong" in e]
-    for e in typoAgnostic:
-        if dict[e] == None:
-            typoAgnostic.remove(e)
-    if len(typoAgnostic) == 1:
-        typoAgnostic = typoAgnostic[0]
-    else:
-        print("Typo Agnostic")
-        return None
-    x = float(dict[typoAgnostic])
-
-    z = float(dict[[e for e in elements if "AbsoluteAltitude" in e][0]])
-
-    azimuth = float(dict[[e for e in elements if "GimbalYawDegree" in e][0]])
-
-    theta = abs(float(dict[[e for e in elements if "GimbalPitchDegree" in e][0]]))
-
-    if azimuth == 0.0 and theta == 0.0:
-        print(f'ERROR: camera orientation invalid. Your model drone may be incompatible with this software')
-        return None
+    # if True:
+        # EXIF and XMP (including Extended XMP) from the header of the JPEG only
+        exifData, xmp_str = jpegMetadata.readJPEGMetadata(thisImage)
+        if exifData is None:
+            print(f'ERROR with {thisImage}, exif data not found!', file=sys.stderr)
+            print(f'skipping {thisImage}', file=sys.stderr)
+            return None
 
-    if y is None or x is None or z is None or azimuth is None or theta is None:
+        # print(exifData)
+
+        # agisoft.com/forum/index.php?topic=5008.0
+        # Alexey Pasumansky
+        # makeTag = "tiff:Make="
+        if xmp_str:
+            # tagStart = xmp_str.find(makeTag)
+            # xmpMake = xmp_str[tagStart + len(makeTag) : tagStart + len(makeTag) + 10]
+            # xmpMake = str(xmpMake.split('\"',3)[1])
+            # print(f'xmpMake: {xmpMake}')
+            make = exifData["Make"].upper()
+            make = make.strip()
+            model = exifData["Model"].upper()
+            model = model.strip()
+            if make[-1] == "\0":
+                # fix nul terminated string bug
+                # joelonsoftware.com/2003/10/08/the-absolute-minimum-every-software-developer-absolutely-positively-must-know-about-unicode-and-character-sets-no-excuses
+                make = make.rstrip("\0")
+
+            pose = readPose(thisImage, make, model, xmp_str, exifData)
+            if pose is None:
+                return None
+            target = resolveTarget(pose.y, pose.x, pose.z, pose.azimuth, pose.theta, elevationData, xParams, yParams, pyramid=pyramid, overviews=overviews)
+            result = resultCache.Result(pose, make, model, exifData.get("DateTime"), target)
+
+        else:
+            print(f'ERROR with {thisImage}, xmp data not found!', file=sys.stderr)
+            print(f'skipping {thisImage}', file=sys.stderr)
+            return None
+    # else:
+    except:
+        print(f'ERROR with filename {thisImage}, skipping...', file=sys.stderr)
         return None
-    else:
-        # # debug printout
-        # print(f'y: "{y}" x: "{x}" z: "{z}" azimuth: "{azimuth}" theta: "{theta}"')
+    if cache is not None:
+        cache.store(key, result)
+    return result
 
-        #if AUTEL do not attempt EGM96 to WGS84 conversion
-        #if RTK do not attempt conversion
-        if not "autel" in xmp_str.lower() and not "rtkflag" in xmp_str.lower():
-            z = EGMtoWGS(y,x,z)
-        return (y, x, z, azimuth, theta)
-
-"""takes a xmp metadata string from a Skydio drone,
-returns tuple (y, x, z, azimuth, theta)
+"""send the target of a result answered from a ResultCache as a Cursor on Target message,
+as getTarget.resolveTarget does for each target it resolves
 
 Parameters
 ----------
-xmp_str: String
-    a string containing the contents of XMP metadata of a Skydio drone image
+result : resultCache.Result
+    the cached result of a drone image
 """
-def handleSKYDIO( xmp_str ):
-    # Skydio has multiple frame of reference tags with same children
-    #     (i.e. "Yaw", "Pitch", etc.)
-    #     will need to parse differently :(
-    #
-    # More info:
-    #     https://support.skydio.com/hc/en-us/articles/4417425974683-Skydio-camera-and-metadata-overview
-
-
-    element = "drone-skydio:CameraOrientationNED"
-    startIndex = xmp_str.find(element)
-    if startIndex == -1:
-        return None
-    substr = xmp_str[startIndex + len(element) :]
+def sendCachedTarget(result):
+    if result.target is not None and result.target[3] is not None:
+        finalDist, tarY, tarX, tarZ, terrainAlt = result.target
+        getTarget.create_and_send_cot(tarX, tarY, tarZ, finalDist)
 
-    isNewFormat = False
-    canary = substr.split('\"')[1]
-    if canary == "Resource":
-        isNewFormat = True
+"""resolve the target of a drone image and write it to a file of the convention
+[Drone-Image.JPG.ATHENA], as parseImage does in headless mode
+returns True if the file was written, False if the image was skipped (with an error printed)
 
-    CONED = substr
-
-    # # debug printout
-    # print(xmp_str)
-    # print(substr)
-
-    if isNewFormat:
-        # replace "<" open tag character with ">" close tag character
-        #     this way we can use the same character for splitting up the string
-        CONED = CONED.replace('<','>')
-
-        theta = CONED.find('Pitch')
-        if theta == -1:
-            return None
-        substr = CONED[theta :]
-        theta = substr.split('>')[1]
-
-        azimuth = CONED.find('Yaw')
-        if azimuth == -1:
-            return None
-        substr = CONED[azimuth :]
-        azimuth = substr.split('>')[1]
-
-    else:
-        theta = CONED.split('\"')[3]
-        azimuth = CONED.split('\"')[5]
-
-
-    try:
-        theta = float(theta)
-        azimuth = float(azimuth)
-    except ValueError:
-        errstr = f"ERROR: parsing isNewFormat: {isNewFormat} Skydio image failed"
-        errstr += f"with values theta: {theta} azimuth: {azimuth}"
-        print(errstr, file=sys.stderr)
-        return None
-    except TypeError:
-        errstr = f"ERROR: parsing isNewFormat: {isNewFormat} Skydio image failed"
-        errstr += f"with values theta: {theta} azimuth: {azimuth}"
-        print(errstr, file=sys.stderr)
-        return None
-
-    theta = abs(theta)
-
-    if isNewFormat:
-        xmp_str = xmp_str.replace('<','>')
-
-        y = xmp_str.find('drone-skydio:Latitude')
-        if y == -1:
-            return None
-        substr = xmp_str[y :]
-        y = substr.split('>')[1]
-
-        x = xmp_str.find('drone-skydio:Longitude')
-        if x == -1:
-            return None
-        substr = xmp_str[x :]
-        x = substr.split('>')[1]
-
-        z = xmp_str.find('drone-skydio:AbsoluteAltitude')
-        if z == -1:
-            return None
-        substr = xmp_str[z :]
-        z = substr.split('>')[1]
-    else:
-        elements = ["drone-skydio:Latitude=",
-                    "drone-skydio:Longitude=",
-                    "drone-skydio:AbsoluteAltitude="]
-        gpsDict = xmp_parse(xmp_str, elements)
-        if gpsDict is None:
-            return None
-        y = gpsDict["drone-skydio:Latitude="]
-        x = gpsDict["drone-skydio:Longitude="]
-        z = gpsDict["drone-skydio:AbsoluteAltitude="]
-    #
+Parameters
+----------
+same as resolveImage
+"""
+def headlessImage(thisImage, elevationData, xParams, yParams, pyramid=None, overviews=None, cache=None):
+    result = resolveImage(thisImage, elevationData, xParams, yParams, pyramid, overviews, cache)
+    if result is None or result.target is None:
+        return False
+    writeAthenaFile(thisImage, result)
+    return True
 
-    try:
-        y = float(y)
-        x = float(x)
-        z = float(z)
-    except ValueError:
-        errstr = f"ERROR: parsing isNewFormat: {isNewFormat} Skydio image failed"
-        errstr += f" with values y: {y} x: {x} z: {z}"
-        print(errstr, file=sys.stderr)
-        return None
-    except TypeError:
-        errstr = f"ERROR: parsing isNewFormat: {isNewFormat} Skydio image failed"
-        errstr += f" with values y: {y} x: {x} z: {z}"
-        print(errstr, file=sys.stderr)
-        return None
-    #
+"""write the target of a drone image to a file of the convention [Drone-Image.JPG.ATHENA]
 
-    if y is None or x is None or z is None or azimuth is None or theta is None:
-        errstr = f"ERROR: parsing isNewFormat: {isNewFormat} Skydio image failed!"
-        errstr += f": \"{y}\", \"{x}\", \"{z}\", \"{azimuth}\", \"{theta}\""
-        print(errstr, file=sys.stderr)
-        return None
+Parameters
+----------
+thisImage : string
+    filename of the drone image
+result : resultCache.Result
+    the result of the image, see resolveImage, its target must not be None
+egmAlts : tuple
+    optional, (target altitude, terrain altitude) of the target in EGM96,
+    if already converted, see egmAltitudes
+sk42 : tuple
+    optional, (latitude, longitude, altitude, Gauss-Krüger zone, northing, easting) of the
+    target in SK42, if already converted, see WGS84_SK42_Translator.Translator.WGS84_SK42
+    and SK42_Gauss_Kruger.Projector.SK42_Gauss_Kruger_Array
+mgrsRef : mgrsEncoder.MGRSRef
+    optional, NATO MGRS reference of the target, if already encoded
+"""
+def writeAthenaFile(thisImage, result, egmAlts=None, sk42=None, mgrsRef=None):
+    target, make, model = result.target, result.make, result.model
+    finalDist, tarY, tarX, tarZ, terrainAlt = target
+    if egmAlts is None:
+        #convert to EGM96
+        egmAlts = egmAltitudes(tarY, tarX, tarZ, terrainAlt)
+    tarZ, terrainAlt = egmAlts
+    if math.isnan(tarZ):
+        tarZ = None
+
+    filename = thisImage + ".ATHENA"
+    dateTime = result.dateTime
+
+    file_object = open(filename, 'w')
+
+    if mgrsRef is None:
+        mgrsRef = mgrsEncoder.encodeOne(tarY, tarX)
+    targetMGRS, targetMGRS10m, targetMGRS100m = mgrsRef.mgrs, mgrsRef.mgrs10m, mgrsRef.mgrs100m
+
+    file_object.write(str(tarY) + "\n")
+    file_object.write(str(tarX) + "\n")
+    if tarZ is None:
+        tarZ = terrainAlt
+    file_object.write(str(tarZ) + "\n")
+    file_object.write(str(finalDist) + "\n")
+    if dateTime is not None:
+        file_object.write(str(dateTime) + "\n")
     else:
-        # # debug printout
-        # print(f'y: "{y}" x: "{x}" z: "{z}" azimuth: "{azimuth}" theta: "{theta}"')
-
-        #convert height from EGM96 to WGS84
-        z = EGMtoWGS(y,x,z)
-        return (y, x, z, azimuth, theta)
-
-"""takes a xmp metadata string and exifData dictionary from an Autel drone,
-returns a tuple (y, x, z, azimuth, theta)
-
-WARNING: in-accuracies have been observed from Autel's reported altitude and azimuth
-    result quality is sub-optimal, proceed with caution
+        file_object.write("\n")
+    file_object.write(targetMGRS + "\n")
+    file_object.write(targetMGRS10m + "\n")
+    file_object.write(targetMGRS100m + "\n")
+
+
+    # # normal decimal like GPS co-ords, "WGS84"
+    # wgs84 = "epsg:4326"
+    # # SK-42, A.K.A CK-42 A.K.A. Pulkovo 1942 A.K.A Gauss Kruger
+    # # alternative, ellipsoidal projection used by
+    # # many old soviet maps
+    # #
+    # # coordinates expressed as Y, X, units in meters
+    # #
+    # # ID:
+    # #     CM 159 E
+    # #     epsg:4284
+    # #     https://spatialreference.org/ref/epsg/4284/
+    # sk42 = "epsg:28468"
+    # transformer = Transformer.from_crs(wgs84, sk42)
+    # targetSK42Lon, targetSK42Lat = transformer.transform(float(tarX), float(tarY))
+
+    if sk42 is None:
+        sk42 = converter.WGS84_SK42(float(tarY), float(tarX), float(tarZ))
+        sk42 += Projector.SK42_Gauss_Kruger(sk42[0], sk42[1])
+    targetSK42Lat, targetSK42Lon, targetSK42Alt, GK_zone, targetSK42_N_GK, targetSK42_E_GK = sk42
+    file_object.write(f'{targetSK42Lat}\n')
+    file_object.write(f'{targetSK42Lon}\n')
+    file_object.write(f'{targetSK42Alt}\n')
+    file_object.write(f'{GK_zone}\n')
+    file_object.write(f'{targetSK42_N_GK}\n')
+    file_object.write(f'{targetSK42_E_GK}\n')
+
+    file_object.write("# format: lat, lon, alt, dist, time, MGRS 1m, MGRS 10m, MGRS 100m, SK42 Lat, SK42 Lon, SK42 Alt., SK42 Gauss-Krüger Zone, SK42 Gauss-Krüger Northing (X), SK42 Gauss-Krüger Easting (Y),  \n")
+
+    if make == "AUTEL ROBOTICS":
+        file_object.write(f'# CAUTION: in-accuracies have been observed with Autel drones. This result is from a "{model}" drone')
+
+    file_object.close()
+
+"""headless mode, see parseImage
+each image is resolved (by a pool of worker processes if jobs is more than 1),
+then the altitudes of all targets are converted to EGM96 (and the targets to MGRS, SK42
+and Gauss-Krüger) at once, and the
+[Drone-Image.JPG.ATHENA] file of each image is written. An error with one
+image never stops the others, the output of each image is printed in the order of images
+
+With worker processes, the DEM is shared by all workers (see sharedDEM.py),
+rather than copied to each
+
+returns a list of True/False, for each image whether its .ATHENA file was written
 
 Parameters
 ----------
-xmp_str: String
-    a string containing the contents of XMP metadata of a Autel drone image
-exifData: Dict
-    a dictionary containing the EXIF metadata of a Autel drone image,
-    expressed as key:value pairs
+images : list of string
+    filenames of the drone images
+elevationData, xParams, yParams, pyramid, overviews :
+    see resolveTarget
+jobs : int
+    optional, number of worker processes
+cache : resultCache.ResultCache
+    optional, see resolveImage, shared by all workers
 """
-def handleAUTEL(xmp_str, exifData):
-    warnStr = ""
-    if os.name != 'nt':
-        warnStr += '\033[1;31;m' #ANSI escape sequence, bold and red
-    warnStr += 'USER WARNING: in-accuracies have been observed from Autels\'\n'
-    warnStr += '    reported altitude, azimuth, and theta. This may result in bad target res.\n\n'
-    warnStr += '    PROCEED WITH CAUTION '
-    if os.name != 'nt':
-        warnStr +="\033[0;0m" #ANSI escape sequence, reset terminal to normal colors
-    print(warnStr)
-
-
-    # # Debug printout
-    # print(xmp_str)
-    # print("\n")
-    # print(exifData)
-
-    metadataAbout = xmp_str.find("rdf:about=") + len("rdf:about=")
-    metadataAbout = xmp_str[metadataAbout : metadataAbout + 15]
-    metadataAbout = metadataAbout.split(' ')[0]
-    metadataAbout = metadataAbout.upper()
-    metadataAbout = metadataAbout.replace('"', '')
-
-    # Newer firmware versions use simmilar XMP tags as DJI
-    if metadataAbout == "DJI":
-        # autel uses drone:tag instead of drone-dji:tag
-        # everything else format is the same as DJI
-        # v lame
-        elements = ["drone:AbsoluteAltitude=",
-                    "drone:GpsLatitude=",
-                    # typo in Autel robotics metada
-                    #     'Longtitude' instead of 'Longitude'
-                    #     OMFG
-                    "drone:GpsLongtitude=",
-                    # include without typo
-                    #     in case the typo is fixed in later firmware ver
-                    #     :'(
-                    "drone:GpsLongitude=",
-                    "drone:GimbalRollDegree=",
-                    "drone:GimbalYawDegree=",
-                    "drone:GimbalPitchDegree="]
-        return handleDJI(xmp_str, elements)
+def parseImagesHeadless(images, elevationData, xParams, yParams, pyramid=None, overviews=None, jobs=1, cache=None):
+    images = [image.strip() for image in images]
+    if jobs > 1:
+        results = []
+        with sharedDEM.SharedDEM(elevationData, xParams, yParams, pyramid, overviews) as dem:
+            with multiprocessing.Pool(jobs, initializer=attachWorkerDEM, initargs=(dem, cache)) as pool:
+                for result, out, err in pool.imap(resolveImageWorker, images):
+                    sys.stdout.write(out)
+                    sys.stderr.write(err)
+                    results.append(result)
     else:
-        # Older firmware versions use proprietary Autel Robotics XMP tags
-        #    If the metadata rdf:about is not "Autel Robotics Meta Data"
-        #    then this software can't parse metadata, so throw an error
-        if not "AUTEL" in metadataAbout:
-            errstr = f"ERROR: unexpected metadata format while parsing Autel image: '{metadataAbout}'"
-            print(errstr, file=sys.stderr)
-            return None
-
-    coords = exifGetYXZ(exifData)
-    if coords is None:
-        return None
-    y, x, z = coords
-
-    elements = ["Camera:Pitch=",
-                "Camera:Yaw=",
-                "Camera:Roll="]
-
-    canary = xmp_str.find("Camera:Pitch=")
-    # print(f'canary: {canary}')
-
-    if canary != -1:
-        dirDict = xmp_parse(xmp_str, elements)
-        # I've noticed this can be inaccurate sometimes
-        #     poor calibration of magnetometer for compass heading?
-        azimuth = dirDict["Camera:Yaw="]
-
-        theta = dirDict["Camera:Pitch="]
+        results = [resolveImage(image, elevationData, xParams, yParams, pyramid, overviews, cache) for image in images]
+
+    resolved = [(image, result) for image, result in zip(images, results)
+                if result is not None and result.target is not None]
+    converted = []
+    if resolved:
+        #convert to EGM96 and SK42, all at once
+        targets = [result.target for image, result in resolved]
+        tarY, tarX, tarZ, terrainAlt = (np.array([np.nan if target[i] is None else float(target[i]) for target in targets])
+                                        for i in range(1, 5))
+        egmAlt, egmTerrainAlt = egmAltitudes(tarY, tarX, tarZ, terrainAlt)
+        sk42Lat, sk42Lon, sk42Alt = converter.WGS84_SK42(tarY, tarX, np.where(np.isnan(egmAlt), egmTerrainAlt, egmAlt))
+        zone, northing, easting = Projector.SK42_Gauss_Kruger_Array(sk42Lat, sk42Lon)
+        mgrsRefs = mgrsEncoder.encode(tarY, tarX)
+        converted = zip(mgrsRefs, egmAlt.tolist(), egmTerrainAlt.tolist(), sk42Lat.tolist(), sk42Lon.tolist(), sk42Alt.tolist(),
+                        zone.tolist(), northing.tolist(), easting.tolist())
+
+    written = dict.fromkeys(images, False)
+    for (image, result), (mgrsRef, egmAlt, egmTerrainAlt, *sk42) in zip(resolved, converted):
         try:
-            theta = float(theta)
-            # AUTEL (old firmware) Camera pitch 0 is down, 90 is forward towards horizon
-            # so, we use its complement instead
-            theta = 90.0 - theta
-            azimuth = float(azimuth)
-        except ValueError:
-            errstr = f"ERROR: parsing Autel image "
-            errstr += f"with values theta: {theta} azimuth: {azimuth}"
-            print(errstr, file=sys.stderr)
-            return None
-        except TypeError:
-            errstr = f"ERROR: parsing Autel image "
-            errstr += f"with values theta: {theta} azimuth: {azimuth}"
-            print(errstr, file=sys.stderr)
-            return None
-
-        if theta < 0:
-            return None
-    else:
-        # replace "<" open tag character with ">" close tag character
-        #     this way we can use the same character for splitting up the string
-        searchspace = xmp_str.replace('<','>')
-
-        theta = searchspace.find("Camera:Pitch")
-        if theta == -1:
-            return None
-        substr = searchspace[theta :]
-        theta = substr.split('>', 3)[1]
-
-        azimuth = searchspace.find("Camera:Yaw")
-        if azimuth == -1:
-            return None
-        substr = searchspace[azimuth :]
-        azimuth = substr.split('>', 3)[1]
+            writeAthenaFile(image, result, (egmAlt, egmTerrainAlt), tuple(sk42), mgrsRef)
+            written[image] = True
+        except Exception as e:
+            print(f'ERROR with filename {image}: {e}, could not write {image}.ATHENA', file=sys.stderr)
+    return [written[image] for image in images]
+
+# the shared DEM and result cache of a worker process of parseImagesHeadless
+workerDEM = None
+workerCache = None
+
+def attachWorkerDEM(dem, cache=None):
+    global workerDEM, workerCache
+    workerDEM = dem.attach()
+    workerCache = cache
+
+# resolveImage in a worker process, returns (result, stdout, stderr) of the image
+def resolveImageWorker(thisImage):
+    out, err = io.StringIO(), io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
         try:
-            theta = abs(float(theta))
-            # AUTEL (old firmware) Camera pitch 0 is down, 90 is forward towards horizon
-            # so, we use its complement instead
-            theta = 90 - theta
-            azimuth = float(azimuth)
-        except ValueError:
-            errstr = f"ERROR: parsing Autel image "
-            errstr += f"with values theta: {theta} azimuth: {azimuth}"
-            print(errstr, file=sys.stderr)
-            return None
-        except TypeError:
-            errstr = f"ERROR: parsing Autel image "
-            errstr += f"with values theta: {theta} azimuth: {azimuth}"
-            print(errstr, file=sys.stderr)
-            return None
-
-        if theta < 0:
-            return None
-
-    if y is None or x is None or z is None or azimuth is None or theta is None:
-        return None
-    else:
-        # # debug printout
-        # print(f'y: "{y}" x: "{x}" z: "{z}" azimuth: "{azimuth}" theta: "{theta}"')
-        #assume old Autel firmware, convert from EGM96 to WGS84 HAE
-        z = EGMtoWGS(y,x,z)
-        return (y, x, z, azimuth, theta)
+            result = resolveImage(thisImage, workerDEM.elevationData, workerDEM.xParams, workerDEM.yParams,
+                                  workerDEM.pyramid, workerDEM.overviews, workerCache)
+        except Exception as e:
+            print(f'ERROR with filename {thisImage}: {e}, skipping...', file=sys.stderr)
+            result = None
+    return result, out.getvalue(), err.getvalue()
 
+"""takes the make, model, xmp metadata string and exifData dictionary of a drone image,
+returns its dronePose.Pose with altitude in WGS84 (height above ellipsoid),
+or None (with an error printed) if the drone isn't supported or the pose can't be found
 
-"""takes a xmp metadata string and exifData dictionary from a Parrot drone,
-returns a tuple (y, x, z, azimuth, theta)
+See dronePose.XMP_SCHEMAS for the supported drones
 
 Parameters
 ----------
+thisImage: string
+    filename of the drone image, for error messages
+make, model: string
+    EXIF make and model of the drone, upper case
 xmp_str: String
-    a string containing the contents of XMP metadata of a Parrot drone image
+    a string containing the contents of XMP metadata of the drone image
 exifData: Dict
-    a dictionary containing the EXIF metadata of a Parrot drone image,
+    a dictionary containing the EXIF metadata of the drone image,
     expressed as key:value pairs
 """
-def handlePARROT(xmp_str, exifData):
-    # https://developer.parrot.com/docs/pdraw/photo-metadata.html
-    #
-    # There are many different Parrot drones out there, each with different specs
-    #     for instance, the Parrot Disco fixed-wing doesn't have a camera gimbal.
-    #     Each and every drone model will have to be tested for compatibility
-
-
-    """ Get theta and azimuth from XMP tags
-    """
-    # replace "<" open tag character with ">" close tag character
-    #     this way we can use the same character for splitting up the string
-    searchspace = xmp_str.replace('<','>')
-
-    theta = searchspace.find('drone-parrot:CameraPitchDegree')
-    if theta == -1:
-        return None
-    substr = searchspace[theta :]
-    theta = substr.split('>')[1]
-
-    azimuth = searchspace.find('drone-parrot:CameraYawDegree')
-    if azimuth == -1:
+def readPose(thisImage, make, model, xmp_str, exifData):
+    schemas = dronePose.schemasFor(make, model)
+    if not schemas:
+        if any(schema["make"] == make for schema in dronePose.XMP_SCHEMAS):
+            # for instance, the parrot disco fixed-wing doesn't
+            #     have a camera gimbal
+            print(f'ERROR with {thisImage}, {make} {model} is not supported', file=sys.stderr)
+        else:
+            print(f'ERROR with {thisImage}, make {make} not compatible with this program!', file=sys.stderr)
+        print(f'skipping {thisImage}', file=sys.stderr)
         return None
-    substr = searchspace[azimuth :]
-    azimuth = substr.split('>')[1]
 
-    """ Get Lat, Lon, and Alt from EXIF GPS tags
-    """
-    coords = exifGetYXZ(exifData)
-    if coords is None:
+    pose = dronePose.parsePose(schemas, xmp_str, exifData)
+    if pose is None:
+        print(f'ERROR with {thisImage}, couldn\'t find sensor data', file=sys.stderr)
+        print(f'skipping {thisImage}', file=sys.stderr)
         return None
-    y, x, z = coords
+    # to the datum targets are resolved in
+    datum = targetDatum()
+    return pose._replace(z=geoid.changeDatum(pose.y, pose.x, pose.z, pose.datum, datum), datum=datum)
 
-    try:
-        theta = float(theta)
-        azimuth = float(azimuth)
-    except ValueError:
-        errstr = f"ERROR: parsing Parrot image "
-        errstr += f"with values theta: {theta} azimuth: {azimuth}"
-        print(errstr, file=sys.stderr)
-        return None
-    except TypeError:
-        errstr = f"ERROR: parsing Parrot image "
-        errstr += f"with values theta: {theta} azimuth: {azimuth}"
-        print(errstr, file=sys.stderr)
-        return None
-
-    theta = abs(theta)
+"""vertical datum of the altitudes of aircraft and of the targets resolved, see config.vertical_datum"""
+def targetDatum():
+    return config.vertical_datum or "WGS84"
 
-    if y is None or x is None or z is None or azimuth is None or theta is None:
-        return None
-    else:
-        # # debug printout
-        # print(f'y: "{y}" x: "{x}" z: "{z}" azimuth: "{azimuth}" theta: "{theta}"')
+"""vertical datum of the DEM as loaded, i.e. of terrain altitudes, see config.vertical_datum"""
+def terrainDatum():
+    return config.vertical_datum or config.dem_vertical_datum
 
-        #if model name contains "anafiai" parrot drone uses WGS4 HAE
-        #other models need conversion
-        if not "anafiai" in xmp_str.lower():
-            z = EGMtoWGS()
-        return (y, x, z, azimuth, theta)
-
-"""takes a xmp metadata string and a list of keys
-return a dictionary of key, value pairs
-       ...or None if xmp_str is empty
+"""converts the altitude and terrain altitude of targets to EGM96
+returns a tuple (altitude, terrain altitude) of floats, or of arrays if any is an array,
+NaN where the altitude is None
 
 Parameters
 ----------
-xmp_str: String
-    a string containing the contents of XMP metadata
-elements: String[]
-    a list of strings, each string is a key for which to search XMP data
-    for its corresponding value
+tarY, tarX : float or array
+    latitude and longitude of the targets
+tarZ, terrainAlt : float or array
+    altitude of the targets (in targetDatum), and of the terrain under them (in terrainDatum)
 """
-def xmp_parse ( xmp_str, elements ):
-    dict = {}
-    if len(xmp_str.strip()) > 0:
-        for element in elements:
-            if xmp_str.find(element) == -1:
-                dict[element] = None
-            else:
-                value = xmp_str[xmp_str.find(element) + len(element) : xmp_str.find(element) + len(element) + 10]
-                value = value.split('\"',3)[1]
-                dict[element] = value
-    else:
-        return None
-
-    return dict
-
-"""takes a python dictionary generated from EXIF data
-return a tuple (y, x, z) of latitude, longitude, and altitude
-in decimal form
-
-Parameters
-----------
-exifData: dict {key : value}
-    a Python dictionary object containing key : value pairs of EXIF tags and their
-    corresponding values
-
-"""
-def exifGetYXZ(exifData):
-    GPSInfo = exifData['GPSInfo']
-    # e.g. N or S
-    latDir = GPSInfo[1].strip().upper()
-    latDeg = GPSInfo[2][0]
-    latMin = GPSInfo[2][1]
-    latSec = GPSInfo[2][2]
-
-    y = latDeg
-    y += (latMin / 60.0)
-    y += (latSec / 3600.0)
-    if latDir == "S":
-        y = y * -1.0
-
-
-    # e.g. E or W
-    lonDir = GPSInfo[3].strip().upper()
-    lonDeg = GPSInfo[4][0]
-    lonMin = GPSInfo[4][1]
-    lonSec = GPSInfo[4][2]
-
-    x = lonDeg
-    x += (lonMin / 60.0)
-    x += (lonSec / 3600.0)
-    if lonDir == "W":
-        x = x * -1.0
-
-    altDir = GPSInfo[5] # GPSInfo.GPSAltitudeRef 0 if positive elevation, 1 if negative
-    z = GPSInfo[6]
-    if altDir == 1:
-        z *= -1.0
-
-    try:
-        y = float(y)
-        x = float(x)
-        z = float(z)
-    except ValueError:
-        print("ERROR: failed to extract GPS data from EXIF values", file=sys.stderr)
-        return None
-    except TypeError:
-        print("ERROR: failed to extract GPS data from EXIF values", file=sys.stderr)
-        return None
-
-    return (y, x, z)
+def egmAltitudes(tarY, tarX, tarZ, terrainAlt):
+    tarZ = math.nan if tarZ is None else tarZ
+    terrainAlt = math.nan if terrainAlt is None else terrainAlt
+    return (geoid.changeDatum(tarY, tarX, tarZ, targetDatum(), "EGM96"),
+            geoid.changeDatum(tarY, tarX, terrainAlt, terrainDatum(), "EGM96"))
 
 """takes a decimal +/- Lat and Lon and returns a tuple of two strings containing Degrees Minutes Seconds each
 
@@ -955,30 +626,14 @@ def decimalToDegreeMinuteSecond(Lat, Lon):
 
 
 #Converts EGM96 height to WGS84 height above ellipsoid
+#    (or arrays of them, see geoid.py)
 def EGMtoWGS(latitude, longitude,height):
-    #Load WGS84 + EGM96 alt CRS
-    egm_crs = CRS.from_epsg(9707)
-    #load WGS84 CRS
-    wgs_crs = CRS.from_epsg(4979)
-    
-    #transform ASML to HAE
-    transformer = Transformer.from_crs(crs_from=egm_crs,crs_to=wgs_crs)
-    new_coords = transformer.transform(latitude,longitude,height)
-    new_lat,new_long,new_height = new_coords
-    return new_height
+    return geoid.egmToWGS(latitude, longitude, height)
 
 #convert WGS84 Height above Ellipsoid to EGM96
+#    (or arrays of them, see geoid.py)
 def WGStoEGM(latitude, longitude, height):
-    #Load WGS84 + EGM96 alt CRS
-    egm_crs = CRS.from_epsg(9707)
-    #load WGS84 CRS
-    wgs_crs = CRS.from_epsg(4979)
-    
-    #transform HAE to ASML
-    transformer = Transformer.from_crs(crs_from=wgs_crs,crs_to=egm_crs)
-    new_coords = transformer.transform(latitude,longitude,height)
-    new_lat,new_long,new_height = new_coords
-    return new_height
+    return geoid.wgsToEGM(latitude, longitude, height)
 
 if __name__ == "__main__":
     parseImage()
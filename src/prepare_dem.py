@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+prepare_dem.py
+
+This file prepares a GeoTIFF Digital Elevation Model (or a directory of DEM tiles)
+    for instant loading, by writing its sidecar (see demSidecar.py)
+
+The heights are converted to config.vertical_datum (if set) in the sidecar,
+    so they are not converted each time the DEM is loaded
+
+Once prepared, parseImage.py, getTarget.py, find_me_mode.py and parseGeoTIFF.py
+    load the DEM from its sidecar automatically, for as long as the DEM is unchanged.
+    Run again after the DEM has changed (a warning is printed until then)
+
+"""
+import sys
+import time
+
+import config # OpenAthena global variables
+import parseGeoTIFF
+import demSidecar
+
+def main():
+    usage = "usage: prepare_dem.py <dem.tif | DEM-tile-directory> [--kernel idw|nearest|bilinear|bicubic] [...]\n\nprepare_dem.py writes a sidecar of a GeoTIFF DEM, next to it,\nfrom which all modes of OpenAthena load the DEM instantly.\n\nThe sidecar includes the max-elevation pyramid for each interpolation kernel\ngiven with --kernel (default: config.kernel), and the overviews of the DEM.\nIf config.vertical_datum is set, its heights are converted to it"
+    if len(sys.argv) < 2 or sys.argv[1] in ("--help", "-h", "-H", "H", "help"):
+        sys.exit(usage)
+    geofilename = sys.argv[1].strip()
+
+    kernels = []
+    for i, segment in enumerate(sys.argv):
+        if segment.lower() == "--kernel":
+            if i + 1 >= len(sys.argv) or sys.argv[i + 1].lower() not in parseGeoTIFF.KERNELS:
+                sys.exit(f'FATAL ERROR: expected one of {", ".join(parseGeoTIFF.KERNELS)} after \'--kernel\'')
+            kernels.append(sys.argv[i + 1].lower())
+    if not kernels:
+        kernels = [config.kernel]
+
+    start = time.time()
+    # taken first, so a DEM changed while being read leaves the sidecar out of date
+    fingerprint = demSidecar.sourceFingerprint(geofilename)
+    elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(geofilename, sidecar=False)
+    print(f'Read DEM \'{geofilename}\' of shape {elevationData.shape} ({time.time() - start:.1f}s)')
+    if config.vertical_datum is not None:
+        print(f'Heights converted from {config.dem_vertical_datum} to {config.vertical_datum}')
+
+    pyramids = {}
+    for kernel in kernels:
+        bound = demSidecar.pyramidBound(kernel)
+        if bound not in (demSidecar.pyramidBound(k) for k in pyramids):
+            pyramids[kernel] = parseGeoTIFF.buildMaxPyramid(elevationData, kernel)
+
+    overviews = parseGeoTIFF.buildOverviews(elevationData)
+
+    path = demSidecar.writeSidecar(geofilename, elevationData, geoTransform, pyramids, fingerprint, overviews=overviews)
+    print(f'Wrote DEM sidecar \'{path}\' ({time.time() - start:.1f}s)')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+prepare_geoid.py
+
+This file installs the EGM96 geoid grid with which altitudes are converted
+    offline (see geoid.py), after verifying it
+
+The grid is downloaded separately, either NGA's 15 minute grid WW15MGH.DAC
+    (earth-info.nga.mil) or PROJ's egm96_15.gtx (download.osgeo.org/proj),
+    and is verified against NGA's test points before being copied into the
+    src directory, where geoid.py finds it while config.geoid_grid is None
+
+"""
+import os
+import shutil
+import sys
+
+import geoid
+
+"""verify a geoid grid file, and copy it to where geoid.py finds it
+returns the filename of the installed grid
+raises ValueError (or OSError) if the grid can't be read or isn't EGM96
+
+Parameters
+----------
+filename: string
+    filename of the downloaded grid, WW15MGH.DAC or a .gtx grid
+"""
+def installGrid(filename):
+    grid = geoid.GeoidGrid.fromFile(filename)
+    geoid.verifyGrid(grid)
+    del grid
+    name = geoid.GRID_NAMES[1] if filename.lower().endswith(".gtx") else geoid.GRID_NAMES[0]
+    path = os.path.join(geoid.GRID_DIRECTORY, name)
+    if os.path.abspath(filename) == os.path.abspath(path):
+        return path
+    # copied alongside then renamed, so a partial copy is never used
+    partial = path + ".partial"
+    shutil.copyfile(filename, partial)
+    os.replace(partial, path)
+    # only one grid installed, the other format would be found first
+    for other in geoid.GRID_NAMES:
+        if other != name and os.path.isfile(os.path.join(geoid.GRID_DIRECTORY, other)):
+            os.remove(os.path.join(geoid.GRID_DIRECTORY, other))
+    return path
+
+def main():
+    usage = "usage: prepare_geoid.py <WW15MGH.DAC | egm96_15.gtx>\n\nprepare_geoid.py verifies a downloaded EGM96 geoid grid,\nand installs it in the src directory, from which altitudes\nare converted between EGM96 and WGS84 offline"
+    if len(sys.argv) < 2 or sys.argv[1] in ("--help", "-h", "-H", "H", "help"):
+        sys.exit(usage)
+    filename = sys.argv[1].strip()
+    try:
+        path = installGrid(filename)
+    except (OSError, ValueError) as e:
+        sys.exit(f'FATAL ERROR: geoid grid \'{filename}\' not installed: {e}')
+    print(f'Verified and installed geoid grid \'{path}\'')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+resultCache.py
+
+This file keeps the results of drone images already processed in a local
+    SQLite database, so parseImage.py and find_me_mode.py answer images which
+    haven't changed since from the database, instead of parsing and resolving
+    them again
+
+Each result is the camera pose, make, model and capture time of an image, and
+    its resolved target. A result is keyed by the image's path, size and
+    modification time, and by a fingerprint of the DEM and of the settings which
+    change the target (engine, kernel, ...), see demFingerprint. Once either
+    changes, the image is processed again (and its result replaced)
+"""
+import decimal
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections import namedtuple
+
+import config # OpenAthena global variables
+import demSidecar
+import dronePose
+
+# increment whenever the table layout changes, older databases are then emptied
+CACHE_VERSION = 1
+
+"""the result of a drone image
+
+pose: dronePose.Pose
+    camera pose of the image, altitude in config.vertical_datum (WGS84 if None)
+make, model: string
+    EXIF make and model of the drone, upper case
+dateTime: string
+    EXIF DateTime of the image, or None
+target: tuple
+    (distance, y, x, z, terrainAlt) of getTarget.resolveTarget, or None
+    if the target couldn't be resolved
+"""
+Result = namedtuple("Result", ["pose", "make", "model", "dateTime", "target"])
+
+"""identifies a GeoTIFF DEM file or directory of DEM tiles, along with the
+    settings resolveTarget uses with it. Results of the same images against
+    another DEM, or with other settings, are kept apart
+
+Parameters
+----------
+geofilename: string
+    filename of the GeoTIFF DEM, or directory of DEM tiles
+"""
+def demFingerprint(geofilename):
+    identity = [os.path.abspath(geofilename), demSidecar.sourceFingerprint(geofilename),
+                config.version, config.engine, config.kernel, config.increment,
+                config.max_terrain_slope, config.bisect_tolerance, config.overview_window,
+                config.dem_vertical_datum, config.vertical_datum]
+    return hashlib.sha1(json.dumps(identity).encode()).hexdigest()
+
+"""the results of drone images against one DEM, in a SQLite database
+
+    the database may be shared by many processes at once (e.g. the workers of
+    parseImage --jobs N). A ResultCache may be pickled to worker processes,
+    each of which opens its own connection to the database. Within a process,
+    a ResultCache may be used by many threads
+
+Parameters
+----------
+path: string
+    filename of the database, created if it doesn't exist
+dem: string
+    fingerprint of the DEM, see demFingerprint
+"""
+class ResultCache(object):
+
+    def __init__(self, path, dem):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.dem = dem
+        self.connection = None
+        self.lock = threading.RLock()
+
+    """open the database of config.result_cache for a GeoTIFF DEM,
+        returns None (with a warning printed) if it is disabled or can't be opened
+
+    Parameters
+    ----------
+    geofilename: string
+        filename of the GeoTIFF DEM, or directory of DEM tiles
+    """
+    @classmethod
+    def fromConfig(cls, geofilename):
+        if not config.result_cache:
+            return None
+        try:
+            cache = cls(config.result_cache, demFingerprint(geofilename))
+            cache.connect()
+        except (OSError, sqlite3.Error) as e:
+            print(f'WARNING: result cache \'{config.result_cache}\' not used: {e}', file=sys.stderr)
+            return None
+        return cache
+
+    def __getstate__(self):
+        return {"path": self.path, "dem": self.dem}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.connection = None
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    """open the database (if it isn't yet), returns its connection"""
+    def connect(self):
+        with self.lock:
+            if self.connection is not None:
+                return self.connection
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # wait on the other processes writing to the database
+            connection = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+            try:
+                connection.execute("PRAGMA journal_mode=WAL")
+                version = connection.execute("PRAGMA user_version").fetchone()[0]
+                if version != CACHE_VERSION:
+                    with connection:
+                        connection.execute("DROP TABLE IF EXISTS results")
+                        connection.execute(f"PRAGMA user_version={CACHE_VERSION}")
+                with connection:
+                    connection.execute("""CREATE TABLE IF NOT EXISTS results (
+                        path TEXT, dem TEXT, size INTEGER, mtime INTEGER,
+                        make TEXT, model TEXT, dateTime TEXT,
+                        y REAL, x REAL, z REAL, azimuth REAL, theta REAL, target TEXT,
+                        PRIMARY KEY (path, dem))""")
+            except sqlite3.Error:
+                connection.close()
+                raise
+            self.connection = connection
+            return connection
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    """identifies the current contents of an image file, a tuple (path, size, modification time (ns))
+        or None if it can't be read. Taken before the image is read, so an image
+        changed while being read is processed again next time
+
+    Parameters
+    ----------
+    filename: string
+        filename of the drone image
+    """
+    def fileKey(self, filename):
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        return os.path.abspath(filename), stat.st_size, stat.st_mtime_ns
+
+    """the Result of an image, or None if there is none (or the image has changed since)
+
+    Parameters
+    ----------
+    key: tuple
+        the image's fileKey
+    """
+    def lookup(self, key):
+        if key is None:
+            return None
+        path, size, mtime = key
+        try:
+            with self.lock:
+                row = self.connect().execute(
+                    "SELECT make, model, dateTime, y, x, z, azimuth, theta, target FROM results "
+                    "WHERE path = ? AND dem = ? AND size = ? AND mtime = ?", (path, self.dem, size, mtime)).fetchone()
+        except sqlite3.Error as e:
+            print(f'WARNING: could not read result cache \'{self.path}\': {e}', file=sys.stderr)
+            return None
+        if row is None:
+            return None
+        make, model, dateTime, y, x, z, azimuth, theta, target = row
+        # converted to the datum targets are resolved in, see parseImage.readPose
+        pose = dronePose.Pose(y, x, z, azimuth, theta, config.vertical_datum or "WGS84")
+        return Result(pose, make, model, dateTime, loadTarget(target))
+
+    """keep the Result of an image, replacing any older one
+
+    Parameters
+    ----------
+    key: tuple
+        the image's fileKey, from before it was read
+    result: Result
+        the result of the image
+    """
+    def store(self, key, result):
+        if key is None:
+            return
+        path, size, mtime = key
+        pose = result.pose
+        try:
+            with self.lock, self.connect() as connection:
+                connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (path, self.dem, size, mtime, result.make, result.model, result.dateTime,
+                                    float(pose.y), float(pose.x), float(pose.z), float(pose.azimuth), float(pose.theta),
+                                    dumpTarget(result.target)))
+        except sqlite3.Error as e:
+            print(f'WARNING: could not write result cache \'{self.path}\': {e}', file=sys.stderr)
+
+# a target as text, each value exactly as printed, so a cached result is written out the same
+def dumpTarget(target):
+    if target is None:
+        return None
+    return json.dumps([None if value is None else str(value) for value in target])
+
+# the "decimal" engine's targets are Decimal, the others' float
+def loadTarget(text):
+    if text is None:
+        return None
+    number = decimal.Decimal if config.engine == "decimal" else float
+    return tuple(None if value is None else number(value) for value in json.loads(text))
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+sharedDEM.py
+
+This file publishes a DEM once, for many worker processes to share
+    (e.g. a multiprocessing pool resolving the targets of many images)
+
+The elevation data, and optionally its max-elevation pyramid and overviews,
+    are copied once into one block of shared memory (or a memory-mapped file).
+    The SharedDEM handle is small enough to be pickled to each worker, where
+    it is attached without copying anything, so all workers together use the
+    memory of one copy of the DEM. Arrays which are already memory-mapped from
+    a file (e.g. a DEM loaded from its sidecar, see prepare_dem.py) are not
+    copied at all, workers map the same file. Nor are DEMs read lazily from
+    their GeoTIFF file(s) (see lazyDEM.py and demCatalog.py), workers open
+    the same files lazily
+
+Workers forked from the main process need none of this, they share its memory
+    already: forWorkers gives them an InheritedDEM instead, which copies nothing
+"""
+import mmap
+import multiprocessing
+import os
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+from geotiff import GeoTiff
+
+import config # OpenAthena global variables
+import demCatalog
+import lazyDEM
+import parseGeoTIFF
+import getTarget
+
+# byte alignment of each array within the shared memory block
+ALIGNMENT = 64
+
+"""a DEM published once for many processes, with the metadata to use it
+
+    Created in the main process, which owns the shared memory until unlink()
+    (or the end of a with block). Pickled to worker processes, where attach()
+    maps the arrays without copying them. A worker should be a child process
+    (e.g. of multiprocessing) of the main process, so the shared memory is
+    tracked, and removed, by the main process alone
+
+    after attach(), the attributes elevationData, pyramid and overviews are
+    read-only arrays (or lists of them) to be used with getTarget.resolveTarget
+    along with xParams and yParams, see SharedDEM.resolveTarget
+
+Parameters
+----------
+elevationData: 2D array
+    elevation data of the DEM. If read lazily from GeoTIFF file(s) (see
+    lazyDEM.py and demCatalog.py), workers open the same files, otherwise it
+    is copied a band of rows at a time. Raises ValueError if it is read lazily
+    from anything else, and larger than config.dem_in_memory_limit
+xParams, yParams: tuple
+    see getTarget.resolveTarget
+pyramid: list of 2D array
+    optional, max-elevation pyramid of elevationData, see parseGeoTIFF.buildMaxPyramid
+overviews: list of 2D array
+    optional, overviews of elevationData, see parseGeoTIFF.buildOverviews
+path: string
+    optional, filename of a memory-mapped file to publish the arrays in,
+    instead of shared memory (e.g. where /dev/shm is small)
+"""
+class SharedDEM(object):
+
+    def __init__(self, elevationData, xParams, yParams, pyramid=None, overviews=None, path=None):
+        self.xParams, self.yParams = tuple(xParams), tuple(yParams)
+        self.segmentName = None
+        self.path = path
+        self.segment = None
+        self.owner = True
+        self.elevationData = self.pyramid = self.overviews = None
+
+        arrays = [("elevation", elevationData)]
+        arrays += [(f'pyramid-{i}', level) for i, level in enumerate(pyramid or [])]
+        arrays += [(f'overview-{i}', level) for i, level in enumerate(overviews or []) if i > 0]
+
+        # (kind, filename, offset, shape, dtype) of each array, kind is "file", "shared",
+        #     or "lazy" (filename is then that of lazySource)
+        self.blocks = {}
+        copies = []
+        size = 0
+        for name, array in arrays:
+            shape, dtype = tuple(array.shape), np.dtype(array.dtype).str
+            if isMappedFile(array):
+                self.blocks[name] = ("file", os.path.abspath(array.filename), array.offset, shape, dtype)
+            elif lazySource(array) is not None:
+                self.blocks[name] = ("lazy", lazySource(array), 0, shape, dtype)
+            elif not isinstance(array, np.ndarray) and array.nbytes > config.dem_in_memory_limit:
+                raise ValueError(f'{name} is read lazily, but not from GeoTIFF files, and is too large to copy '
+                                 f'({array.nbytes} bytes, config.dem_in_memory_limit is {config.dem_in_memory_limit})')
+            else:
+                offset = -(-size // ALIGNMENT) * ALIGNMENT
+                size = offset + int(np.prod(shape)) * np.dtype(dtype).itemsize
+                self.blocks[name] = ("shared", None, offset, shape, dtype)
+                copies.append((name, array))
+        if not copies:
+            return
+
+        if path is None:
+            self.segment = shared_memory.SharedMemory(create=True, size=size)
+            self.segmentName = self.segment.name
+            buffer = self.segment.buf
+        else:
+            self.path = os.path.abspath(path)
+            buffer = np.memmap(self.path, dtype=np.uint8, mode='w+', shape=(size,))
+        for name, array in copies:
+            kind, filename, offset, shape, dtype = self.blocks[name]
+            target = np.ndarray(shape, dtype, buffer=buffer, offset=offset)
+            nrows, ncols = shape
+            bandRows = max(1, (1 << 24) // max(ncols, 1))
+            for r0 in range(0, nrows, bandRows):
+                target[r0:r0 + bandRows] = array[r0:r0 + bandRows]
+            del target
+        if path is not None:
+            buffer.flush()
+            del buffer
+            for name, block in self.blocks.items():
+                if block[0] == "shared":
+                    self.blocks[name] = ("file",) + (self.path,) + block[2:]
+
+    """publish a GeoTIFF DEM file or directory of DEM tiles
+        (or its sidecar, see prepare_dem.py) with its max-elevation pyramid
+        for kernel unless config.engine is "decimal", and its overviews if
+        config.engine is "overview"
+
+    Parameters
+    ----------
+    geofilename: string
+        filename of the GeoTIFF DEM, or directory of DEM tiles
+    kernel: string
+        optional, interpolation kernel of the pyramid, defaults to config.kernel
+    path: string
+        optional, see SharedDEM
+    """
+    @classmethod
+    def fromGeoFile(cls, geofilename, kernel=None, path=None):
+        elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseGeoTIFF.getGeoFileFromString(geofilename)
+        nrows, ncols = elevationData.shape
+        xParams = (x0, x0 + dx * ncols, dx, ncols)
+        yParams = (y0, y0 + dy * nrows, dy, nrows)
+        pyramid = parseGeoTIFF.buildMaxPyramid(elevationData, kernel) if config.engine != "decimal" else None
+        overviews = parseGeoTIFF.buildOverviews(elevationData) if config.engine == "overview" else None
+        return cls(elevationData, xParams, yParams, pyramid, overviews, path)
+
+    # only the description of the arrays is pickled, never the arrays themselves
+    def __getstate__(self):
+        return {"xParams": self.xParams, "yParams": self.yParams, "blocks": self.blocks,
+                "segmentName": self.segmentName, "path": self.path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.segment = None
+        self.owner = False
+        self.elevationData = self.pyramid = self.overviews = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # unlinked through the segment still open, rather than a new mapping of it
+        if self.owner:
+            self.unlink()
+        self.close()
+
+    """map the arrays of the DEM, without copying them, returns self"""
+    def attach(self):
+        if self.elevationData is not None:
+            return self
+        if self.segment is None and self.segmentName is not None:
+            self.segment = shared_memory.SharedMemory(name=self.segmentName)
+        arrays = {}
+        for name, (kind, filename, offset, shape, dtype) in self.blocks.items():
+            if kind == "lazy":
+                arrays[name] = openLazySource(filename)
+                continue
+            if kind == "shared":
+                array = np.ndarray(shape, dtype, buffer=self.segment.buf, offset=offset)
+            else:
+                array = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+            array.flags.writeable = False
+            arrays[name] = array
+        self.elevationData = arrays["elevation"]
+        if "pyramid-0" in arrays:
+            self.pyramid = [arrays[f'pyramid-{i}'] for i in range(len(arrays)) if f'pyramid-{i}' in arrays]
+        if "overview-1" in arrays:
+            self.overviews = [self.elevationData] + [arrays[f'overview-{i}'] for i in range(1, len(arrays)) if f'overview-{i}' in arrays]
+        return self
+
+    """getTarget.resolveTarget against the shared DEM, attached if it isn't yet
+
+    Parameters
+    ----------
+    y, x, z, azimuth, theta: float
+        see getTarget.resolveTarget
+    engine, kernel: string
+        optional, see getTarget.resolveTarget, the kernel must be that of the pyramid
+    """
+    def resolveTarget(self, y, x, z, azimuth, theta, engine=None, kernel=None):
+        self.attach()
+        return getTarget.resolveTarget(y, x, z, azimuth, theta, self.elevationData, self.xParams, self.yParams,
+                                       engine=engine, pyramid=self.pyramid, kernel=kernel, overviews=self.overviews)
+
+    """unmap the arrays of the DEM in this process
+        any of them still referenced elsewhere keep the shared memory mapped,
+        until the process exits
+    """
+    def close(self):
+        self.elevationData = self.pyramid = self.overviews = None
+        if self.segment is not None:
+            try:
+                self.segment.close()
+            except BufferError:
+                pass
+            self.segment = None
+
+    """remove the published arrays, once no process needs them any more
+        only the shared memory or file created by this SharedDEM is removed,
+        never the files of a sidecar
+    """
+    def unlink(self):
+        if self.segmentName is not None:
+            try:
+                if self.segment is not None:
+                    self.segment.unlink()
+                else:
+                    # mapped only to be unlinked
+                    segment = shared_memory.SharedMemory(name=self.segmentName)
+                    segment.unlink()
+                    segment.close()
+            except FileNotFoundError:
+                pass
+            self.segmentName = None
+        elif self.path is not None and any(filename == self.path for kind, filename, *rest in self.blocks.values()):
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                print(f'WARNING: could not remove shared DEM file \'{self.path}\': {e}', file=sys.stderr)
+            self.path = None
+
+"""a DEM used by worker processes forked from the main process, which inherit
+    its arrays without a copy (pages are only copied on write, and the arrays are
+    never written), with the interface of a SharedDEM. Must not be pickled
+
+Parameters
+----------
+elevationData, xParams, yParams, pyramid, overviews:
+    see SharedDEM
+"""
+class InheritedDEM(object):
+
+    def __init__(self, elevationData, xParams, yParams, pyramid=None, overviews=None):
+        self.elevationData = elevationData
+        self.xParams, self.yParams = tuple(xParams), tuple(yParams)
+        self.pyramid, self.overviews = pyramid, overviews
+
+    def __getstate__(self):
+        raise TypeError("an InheritedDEM is only inherited by forked processes, see forWorkers")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def attach(self):
+        return self
+
+    def resolveTarget(self, y, x, z, azimuth, theta, engine=None, kernel=None):
+        return getTarget.resolveTarget(y, x, z, azimuth, theta, self.elevationData, self.xParams, self.yParams,
+                                       engine=engine, pyramid=self.pyramid, kernel=kernel, overviews=self.overviews)
+
+    def close(self):
+        pass
+
+    def unlink(self):
+        pass
+
+"""the DEM for the worker processes of a multiprocessing.Pool (of the default context)
+    an InheritedDEM if the workers are forked, so nothing is copied, otherwise a SharedDEM
+    which is published once for all of them. Either is attached by each worker
+
+Parameters
+----------
+elevationData, xParams, yParams, pyramid, overviews:
+    see SharedDEM
+"""
+def forWorkers(elevationData, xParams, yParams, pyramid=None, overviews=None):
+    if multiprocessing.get_start_method() == "fork":
+        return InheritedDEM(elevationData, xParams, yParams, pyramid, overviews)
+    return SharedDEM(elevationData, xParams, yParams, pyramid, overviews)
+
+"""the GeoTIFF file(s) a DEM is read lazily from, which other processes can
+    open lazily too, instead of a copy. A filename for a lazyDEM.LazyDEM, a list
+    of filenames for a demCatalog.DEMCatalog, or None for any other array
+"""
+def lazySource(array):
+    if isinstance(array, demCatalog.DEMCatalog):
+        return [os.path.abspath(filename) for filename, elevationData, xParams, yParams in array.tiles]
+    if isinstance(array, lazyDEM.LazyDEM) and array.filename is not None:
+        return os.path.abspath(array.filename)
+    return None
+
+"""open a DEM lazily from its lazySource"""
+def openLazySource(source):
+    if isinstance(source, list):
+        return demCatalog.DEMCatalog(source)
+    return lazyDEM.openLazyDEM(GeoTiff(source), source)
+
+"""whether an array is a whole np.memmap of a file, which other processes
+    can map from the same file instead of a copy
+"""
+def isMappedFile(array):
+    return (isinstance(array, np.memmap) and isinstance(array.base, mmap.mmap)
+            and getattr(array, "filename", None) is not None and array.flags.c_contiguous)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+targetPipeline.py
+
+This file resolves the targets of new drone images in the background, for find_me_mode.py
+
+New images (see imageWatcher.py) are resolved by a pool of worker processes
+    while the operator is looking at the current target, so the next target is
+    ready as soon as it is asked for. Images waiting for a worker are taken
+    newest capture time first, the order in which find_me_mode shows them.
+    The DEM is shared by all workers without a copy, see sharedDEM.forWorkers
+"""
+import datetime
+import heapq
+import multiprocessing
+import os
+import queue
+import threading
+from collections import namedtuple
+
+import imageWatcher
+import jpegMetadata
+import parseImage
+import sharedDEM
+
+"""an image resolved by a TargetPipeline
+
+captureKey: float
+    sort key of the image, newest first, see captureKey
+path: string
+    path of the image
+result: resultCache.Result
+    the result of the image (its target may be None), or None if it was skipped
+out, err: string
+    what was printed while resolving the image, to stdout and stderr
+"""
+Resolved = namedtuple("Resolved", ["captureKey", "path", "result", "out", "err"])
+
+"""resolves the targets of the new images of a directory in the background
+
+    start() takes in the images already in the directory, then each new image
+    once it is fully written. Each is resolved once, and reported by results()
+
+Parameters
+----------
+directory: string
+    path of the directory of drone images, with its subdirectories
+elevationData, xParams, yParams, pyramid, overviews:
+    see getTarget.resolveTarget
+cache: resultCache.ResultCache
+    optional, images unchanged since they were last resolved are answered from
+    it without a worker, and new results are kept in it
+jobs: int
+    optional, number of worker processes
+inotify: bool
+    optional, see imageWatcher.ImageWatcher
+"""
+class TargetPipeline(object):
+
+    def __init__(self, directory, elevationData, xParams, yParams, pyramid=None, overviews=None,
+                 cache=None, jobs=1, inotify=True):
+        self.watcher = imageWatcher.ImageWatcher(directory, inotify=inotify)
+        self.dem = sharedDEM.forWorkers(elevationData, xParams, yParams, pyramid, overviews)
+        self.cache = cache
+        self.jobs = jobs
+        self.pool = None
+        self.thread = None
+        self.stopping = threading.Event()
+        # heap of (captureKey, path, fileKey) of the images waiting for a worker
+        self.pending = []
+        # images taken from the watcher but not yet pending, and images with a worker
+        self.intaking = 0
+        self.inFlight = 0
+        self.lock = threading.Lock()
+        self.done = queue.Queue()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    """start the workers, and take in the images of the directory, returns self"""
+    def start(self):
+        # workers are started before any thread, so none is forked along with them
+        self.pool = multiprocessing.Pool(self.jobs, initializer=parseImage.attachWorkerDEM, initargs=(self.dem,))
+        self.watcher.start()
+        self.thread = threading.Thread(target=self.run, name="TargetPipeline", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.watcher.stop()
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        self.dem.close()
+        self.dem.unlink()
+
+    """whether every image taken in so far has been reported by results()"""
+    def idle(self):
+        with self.lock:
+            return (self.intaking == 0 and not self.pending and self.inFlight == 0
+                    and self.done.empty() and self.watcher.ready.empty())
+
+    """the Resolved images since last called, [] if none
+
+    Parameters
+    ----------
+    wait: bool
+        optional, if there are none yet, wait for the next one,
+        unless every image taken in so far has been reported
+    """
+    def results(self, wait=False):
+        resolved = []
+        while True:
+            try:
+                while True:
+                    resolved.append(self.done.get_nowait())
+            except queue.Empty:
+                pass
+            if resolved or not wait or self.idle():
+                return resolved
+            try:
+                resolved.append(self.done.get(timeout=0.1))
+            except queue.Empty:
+                pass
+
+    def run(self):
+        while not self.stopping.is_set():
+            with self.lock:
+                images = self.watcher.newImages()
+                self.intaking += len(images)
+            for path in images:
+                self.intake(path)
+            self.dispatch()
+            if not images:
+                self.stopping.wait(0.02)
+
+    # answer an image from the cache, or queue it for a worker by its capture time
+    def intake(self, path):
+        key = None
+        if self.cache is not None:
+            key = self.cache.fileKey(path)
+            result = self.cache.lookup(key)
+            if result is not None:
+                parseImage.sendCachedTarget(result)
+                self.done.put(Resolved(captureKey(result.dateTime, path), path, result, "", ""))
+                with self.lock:
+                    self.intaking -= 1
+                return
+        # only the capture time, the rest of the metadata is read by the worker
+        try:
+            exifData, xmp_str = jpegMetadata.readJPEGMetadata(path)
+        except (OSError, ValueError):
+            exifData = None
+        dateTime = exifData.get("DateTime") if exifData is not None else None
+        with self.lock:
+            heapq.heappush(self.pending, (captureKey(dateTime, path), path, key))
+            self.intaking -= 1
+
+    # hand the newest pending images to the idle workers
+    def dispatch(self):
+        with self.lock:
+            while self.pending and self.inFlight < self.jobs:
+                sortKey, path, key = heapq.heappop(self.pending)
+                self.inFlight += 1
+                self.pool.apply_async(parseImage.resolveImageWorker, (path,),
+                                      callback=lambda resolved, sortKey=sortKey, path=path, key=key: self.finish(sortKey, path, key, *resolved),
+                                      error_callback=lambda e, sortKey=sortKey, path=path: self.finish(sortKey, path, None, None, "", f'ERROR with filename {path}: {e}, skipping...\n'))
+
+    # a worker is done with an image, called on a thread of the pool
+    def finish(self, sortKey, path, key, result, out, err):
+        if result is not None and self.cache is not None:
+            self.cache.store(key, result)
+        self.done.put(Resolved(sortKey, path, result, out, err))
+        with self.lock:
+            self.inFlight -= 1
+
+"""sort key of an image, newest first
+    by its EXIF DateTime, or by its modification time if it has none
+
+Parameters
+----------
+dateTime: string
+    EXIF DateTime of the image, e.g. "2022:06:01 12:00:00", or None
+filename: string
+    filename of the image
+"""
+def captureKey(dateTime, filename):
+    try:
+        timestamp = datetime.datetime.strptime(str(dateTime).strip(), "%Y:%m:%d %H:%M:%S").timestamp()
+    except ValueError:
+        try:
+            timestamp = os.path.getmtime(filename)
+        except OSError:
+            timestamp = 0.0
+    return -timestamp
@@ -0,0 +1,937 @@
+import os
+import io
+import contextlib
+import json
+import math
+import multiprocessing
+import pickle
+import decimal
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from unittest import mock
+import numpy as np
+import tifffile
+from geotiff import GeoTiff
+
+import config
+import demCatalog
+import demSidecar
+import geoid
+import lazyDEM
+import parseGeoTIFF
+import sharedDEM
+import getTarget
+
+DEM = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Rome-30m-DEM.tif')
+
+class TestResolveTargetEngines(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseGeoTIFF.getGeoFileFromString(DEM)
+        nrows, ncols = cls.elevationData.shape
+        cls.xParams = (x0, x0 + dx * ncols, dx, ncols)
+        cls.yParams = (y0, y0 + dy * nrows, dy, nrows)
+        # (lat, lon, alt, azimuth, theta)
+        cls.poses = [(41.801, 12.6483, 500, 315.0, 20.0),
+                     (41.9, 12.5, 600, 45.0, 35.0),
+                     (41.85, 12.45, 400, 200.0, 60.0),
+                     (41.93, 12.58, 300, 100.0, 12.0)]
+
+    def resolve(self, pose, engine):
+        return getTarget.resolveTarget(*pose, self.elevationData, self.xParams, self.yParams, engine=engine)
+
+    def test_float_engine_matches_decimal(self):
+        for pose in self.poses:
+            expected = self.resolve(pose, "decimal")
+            actual = self.resolve(pose, "float")
+            self.assertIsNotNone(expected)
+            self.assertIsNotNone(actual)
+            finalDist, tarY, tarX, tarZ, terrainAlt = actual
+            self.assertAlmostEqual(finalDist, float(expected[0]), delta=0.01)
+            self.assertAlmostEqual(tarZ, float(expected[3]), delta=0.01)
+            self.assertAlmostEqual(terrainAlt, float(expected[4]), delta=0.01)
+            offset = getTarget.haversine_float(float(expected[2]), float(expected[1]), tarX, tarY, 0)
+            self.assertLess(offset, 0.01)
+
+    def test_adaptive_engine_finds_crossing(self):
+        for pose in self.poses:
+            y, x, z, azimuth, theta = pose
+            fixed = self.resolve(pose, "float")
+            actual = self.resolve(pose, "adaptive")
+            self.assertIsNotNone(actual)
+            finalDist, tarY, tarX, tarZ, terrainAlt = actual
+            # returned point is on the terrain crossing, not above it
+            self.assertAlmostEqual(tarZ, terrainAlt, delta=0.5)
+            # ...which can't be before the decimal engine's stop, the first step within
+            #     post_spacing/8 of the terrain (one step beyond is returned)
+            self.assertGreater(finalDist, fixed[0] - 1.0)
+            # ...and is still near it
+            post_spacing = abs(getTarget.haversine_float(0, y, self.xParams[2], y, z))
+            self.assertLess(finalDist - fixed[0], post_spacing / math.sin(math.radians(theta)))
+
+    def test_dda_engine_matches_dense_bilinear_sampling(self):
+        x0, x1, dx, ncols = self.xParams
+        y0, y1, dy, nrows = self.yParams
+        elevation = self.elevationData.astype(np.float64)
+        for pose in self.poses:
+            y, x, z, azimuth, theta = pose
+            actual = self.resolve(pose, "dda")
+            self.assertIsNotNone(actual)
+            finalDist, tarY, tarX, tarZ, terrainAlt = actual
+            self.assertAlmostEqual(tarZ, terrainAlt, delta=0.001)
+
+            # first crossing of the line and the bilinear surface, sampled every 5cm
+            dist = np.arange(0.0, 4000.0, 0.05)
+            lat, lon = getTarget.rayLatLon(y, x, z, math.radians(azimuth), math.radians(theta), dist)
+            u, v = (lon - x0) / dx, (lat - y0) / dy
+            col, row = np.floor(u).astype(int), np.floor(v).astype(int)
+            fu, fv = u - col, v - row
+            colR, rowB = np.minimum(col + 1, ncols - 1), np.minimum(row + 1, nrows - 1)
+            surface = (elevation[row, col] * (1 - fu) * (1 - fv) + elevation[row, colR] * fu * (1 - fv)
+                       + elevation[rowB, col] * (1 - fu) * fv + elevation[rowB, colR] * fu * fv)
+            crossing = dist[np.flatnonzero(z - dist * math.tan(math.radians(theta)) <= surface)[0]]
+
+            expected = crossing / math.cos(math.radians(theta))
+            self.assertAlmostEqual(finalDist, expected, delta=0.25)
+
+    def test_dda_engine_does_not_step_over_thin_ridge(self):
+        # flat terrain at 0m, with a single 100m spike, just off a 1 arc-second grid post
+        elevationData = np.zeros((200, 200), dtype=np.float32)
+        elevationData[100, 120] = 100.0
+        dx = 1 / 3600
+        xParams = (12.0, 12.0 + 200 * dx, dx, 200)
+        yParams = (42.0, 42.0 - 200 * dx, -dx, 200)
+        # fly due east along row 100 at 90m, looking down very shallowly
+        y, x = 42.0 - 100 * dx, 12.0 + 10 * dx
+        target = getTarget.resolveTarget(y, x, 90.0, 90.0, 0.5, elevationData, xParams, yParams, engine="dda")
+        self.assertIsNotNone(target)
+        finalDist, tarY, tarX, tarZ, terrainAlt = target
+        self.assertGreater(tarX, 12.0 + 119 * dx)
+        self.assertLess(tarX, 12.0 + 120 * dx)
+        self.assertGreater(terrainAlt, 50.0)
+
+    def test_ray_patch_intersection(self):
+        # flat patch at 0m, line descends from 10m to -10m
+        self.assertAlmostEqual(getTarget.rayPatchIntersection(0.0, 0.0, 1.0, 1.0, 10.0, -10.0, 0, 0, 0, 0), 0.5)
+        # line stays above the patch
+        self.assertIsNone(getTarget.rayPatchIntersection(0.0, 0.0, 1.0, 1.0, 10.0, 5.0, 0, 0, 0, 0))
+        # saddle patch, the returned fraction is on the patch
+        pu, pv, qu, qv, altIn, altOut = 0.1, 0.9, 0.8, -0.7, 12.0, 2.0
+        h00, h01, h10, h11 = 0.0, 10.0, 10.0, 0.0
+        t = getTarget.rayPatchIntersection(pu, pv, qu, qv, altIn, altOut, h00, h01, h10, h11)
+        fu, fv = pu + t * qu, pv + t * qv
+        patch = h00 * (1 - fu) * (1 - fv) + h01 * fu * (1 - fv) + h10 * (1 - fu) * fv + h11 * fu * fv
+        self.assertAlmostEqual(altIn + t * (altOut - altIn), patch, places=9)
+
+    def test_float_engine_out_of_bounds(self):
+        # level-ish shot towards the edge of the DEM never hits the ground
+        pose = (41.9, 12.5, 3000, 270.0, 1.0)
+        self.assertIsNone(self.resolve(pose, "float"))
+        self.assertIsNone(self.resolve(pose, "adaptive"))
+        self.assertIsNone(self.resolve(pose, "dda"))
+
+    def test_float_engine_underground(self):
+        pose = (41.9, 12.5, -100, 0.0, 30.0)
+        self.assertIsNone(self.resolve(pose, "float"))
+
+    def test_unknown_engine(self):
+        self.assertIsNone(self.resolve(self.poses[0], "nope"))
+
+    def test_ray_lat_lon_matches_inverse_haversine(self):
+        y, x, z = 41.9, 12.5, 500.0
+        azimuth, theta = math.radians(30.0), math.radians(10.0)
+        curY, curX = y, x
+        curZ = z
+        step = math.cos(theta)
+        for i in range(2000):
+            avgAlt = curZ - math.sin(theta) / 2
+            curZ -= math.sin(theta)
+            curY, curX = getTarget.inverse_haversine((curY, curX), step, azimuth, decimal.Decimal(avgAlt))
+        lat, lon = getTarget.rayLatLon(y, x, z, azimuth, theta, 2000 * step)
+        self.assertLess(getTarget.haversine_float(curX, curY, float(lon), float(lat), 0), 0.01)
+
+class TestResolveTargetBatch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseGeoTIFF.getGeoFileFromString(DEM)
+        nrows, ncols = cls.elevationData.shape
+        cls.xParams = (x0, x0 + dx * ncols, dx, ncols)
+        cls.yParams = (y0, y0 + dy * nrows, dy, nrows)
+        # (lat, lon, alt, azimuth, theta)
+        cls.poses = np.array([(41.801, 12.6483, 500, 315.0, 20.0),
+                              (41.9, 12.5, 600, 45.0, 35.0),
+                              (41.85, 12.45, 400, 200.0, 60.0),
+                              (41.93, 12.58, 300, 100.0, 12.0),
+                              (41.9, 12.5, 600, -30.0, 150.0), # facing backwards
+                              (41.9, 12.5, 3000, 270.0, 1.0), # out of bounds
+                              (41.9, 12.5, -100, 0.0, 30.0), # underground
+                              (45.0, 12.5, 600, 0.0, 30.0), # aircraft out of bounds
+                              (np.nan, 12.5, 600, 0.0, 30.0),
+                              (41.9, 12.5, 600, 0.0, 90.0)]) # straight down
+
+    def batch(self, engine, poses=None):
+        if poses is None:
+            poses = self.poses
+        return getTarget.resolveTargetBatch(*poses.T, self.elevationData, self.xParams, self.yParams, engine=engine)
+
+    def test_matches_resolve_target(self):
+        for engine in ("float", "adaptive", "dda"):
+            targets = self.batch(engine)
+            self.assertEqual(targets.dtype, getTarget.TARGET_DTYPE)
+            for pose, target in zip(self.poses, targets):
+                expected = getTarget.resolveTarget(*pose, self.elevationData, self.xParams, self.yParams, engine=engine)
+                if expected is None:
+                    self.assertNotEqual(target["status"], getTarget.STATUS_OK)
+                    self.assertTrue(np.isnan(target["finalDist"]))
+                    continue
+                self.assertEqual(target["status"], getTarget.STATUS_OK)
+                for actual, value in zip(target.tolist()[1:], expected):
+                    if value is None:
+                        self.assertTrue(math.isnan(actual))
+                    else:
+                        self.assertAlmostEqual(actual, value, delta=1e-6)
+
+    def test_status_codes(self):
+        status = self.batch("float")["status"]
+        self.assertEqual(list(status), [getTarget.STATUS_OK] * 5 +
+                                       [getTarget.STATUS_OUT_OF_BOUNDS, getTarget.STATUS_UNDERGROUND,
+                                        getTarget.STATUS_OUT_OF_BOUNDS, getTarget.STATUS_INVALID,
+                                        getTarget.STATUS_OK])
+
+    def test_shape(self):
+        targets = self.batch("float", self.poses[:4].reshape(2, 2, 5))
+        self.assertEqual(targets.shape, (2, 2))
+        self.assertEqual(self.batch("float", self.poses[:1]).shape, (1,))
+
+    def test_unknown_engine(self):
+        self.assertIsNone(self.batch("nope"))
+
+class TestMaxPyramid(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseGeoTIFF.getGeoFileFromString(DEM)
+        nrows, ncols = cls.elevationData.shape
+        cls.xParams = (x0, x0 + dx * ncols, dx, ncols)
+        cls.yParams = (y0, y0 + dy * nrows, dy, nrows)
+        cls.pyramid = parseGeoTIFF.buildMaxPyramid(cls.elevationData)
+
+    def test_levels(self):
+        self.assertEqual(self.pyramid[0].shape, self.elevationData.shape)
+        self.assertEqual(self.pyramid[-1].shape, (1, 1))
+        self.assertEqual(self.pyramid[-1][0][0], self.elevationData.max())
+        for fine, coarse in zip(self.pyramid, self.pyramid[1:]):
+            self.assertEqual(coarse.shape, ((fine.shape[0] + 1) // 2, (fine.shape[1] + 1) // 2))
+            self.assertTrue((np.repeat(np.repeat(coarse, 2, axis=0), 2, axis=1)[:fine.shape[0], :fine.shape[1]] >= fine).all())
+
+    def test_bounds_interpolated_terrain(self):
+        x0, x1, dx, ncols = self.xParams
+        y0, y1, dy, nrows = self.yParams
+        rng = np.random.default_rng(0)
+        u = rng.uniform(0, ncols - 1, 20000)
+        v = rng.uniform(0, nrows - 1, 20000)
+        alt = parseGeoTIFF.getAltFromLatLonArray(y0 + v * dy, x0 + u * dx, self.xParams, self.yParams, self.elevationData)
+        bound = self.pyramid[0][np.floor(v).astype(int), np.floor(u).astype(int)].astype(np.float64)
+        self.assertTrue((alt <= bound + 1e-6).all())
+
+    def test_engines_unchanged_by_pyramid(self):
+        poses = [(41.801, 12.6483, 500, 315.0, 20.0),
+                 (41.9, 12.5, 1200, 45.0, 5.0),
+                 (41.85, 12.45, 400, 200.0, 60.0),
+                 (41.93, 12.58, 300, 100.0, 3.0)]
+        for engine in ("float", "dda"):
+            for pose in poses:
+                expected = getTarget.resolveTarget(*pose, self.elevationData, self.xParams, self.yParams, engine=engine)
+                actual = getTarget.resolveTarget(*pose, self.elevationData, self.xParams, self.yParams, engine=engine, pyramid=self.pyramid)
+                self.assertIsNotNone(actual)
+                self.assertEqual(actual, expected)
+
+    def test_adaptive_engine_with_pyramid_finds_crossing(self):
+        pose = (41.9, 12.5, 1200, 45.0, 5.0)
+        actual = getTarget.resolveTarget(*pose, self.elevationData, self.xParams, self.yParams, engine="adaptive", pyramid=self.pyramid)
+        finalDist, tarY, tarX, tarZ, terrainAlt = actual
+        self.assertAlmostEqual(tarZ, terrainAlt, delta=0.5)
+
+    def test_skip_above_terrain(self):
+        y, x, z, azimuth, theta = 41.9, 12.5, 1200, 45.0, 5.0
+        azimuth, theta = math.radians(azimuth), math.radians(theta)
+        skipDist = getTarget.skipAboveTerrain(y, x, z, azimuth, theta, self.xParams, self.yParams, self.pyramid)
+        self.assertGreater(skipDist, 0.0)
+        # every point of the line up to skipDist is above the terrain
+        dist = np.linspace(0.0, skipDist, 2000)
+        lat, lon = getTarget.rayLatLon(y, x, z, azimuth, theta, dist)
+        alt = parseGeoTIFF.getAltFromLatLonArray(lat, lon, self.xParams, self.yParams, self.elevationData)
+        self.assertTrue((z - dist * math.tan(theta) > alt).all())
+        # level-ish shot towards the edge of the DEM never meets the terrain
+        skipDist = getTarget.skipAboveTerrain(41.9, 12.5, 3000, math.radians(270.0), math.radians(1.0), self.xParams, self.yParams, self.pyramid)
+        self.assertIsNone(skipDist)
+
+class TestOverviews(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseGeoTIFF.getGeoFileFromString(DEM)
+        nrows, ncols = cls.elevationData.shape
+        cls.xParams = (x0, x0 + dx * ncols, dx, ncols)
+        cls.yParams = (y0, y0 + dy * nrows, dy, nrows)
+        cls.overviews = parseGeoTIFF.buildOverviews(cls.elevationData)
+
+    def test_levels(self):
+        self.assertIs(self.overviews[0], self.elevationData)
+        self.assertEqual(self.overviews[-1].shape, (1, 1))
+        for fine, coarse in zip(self.overviews, self.overviews[1:]):
+            self.assertEqual(coarse.shape, ((fine.shape[0] + 1) // 2, (fine.shape[1] + 1) // 2))
+        fine = self.elevationData[:4, :4].astype(np.float64)
+        np.testing.assert_allclose(self.overviews[1][:2, :2], fine.reshape(2, 2, 2, 2).mean(axis=(1, 3)), rtol=1e-6)
+        # read in bands, the same
+        for expected, actual in zip(self.overviews, parseGeoTIFF.buildOverviews(self.elevationData, bandRows=99)):
+            np.testing.assert_array_equal(actual, expected)
+
+    def test_no_data_is_ignored(self):
+        elevation = np.array([[1.0, np.nan, 5.0],
+                              [3.0, np.nan, np.nan],
+                              [np.nan, np.nan, 7.0]])
+        overviews = parseGeoTIFF.buildOverviews(elevation)
+        np.testing.assert_array_equal(overviews[1], [[2.0, 5.0], [np.nan, 7.0]])
+        np.testing.assert_allclose(overviews[2], [[14.0 / 3.0]], rtol=1e-6)
+
+    def test_overview_params(self):
+        xParams, yParams = parseGeoTIFF.overviewParams(self.xParams, self.yParams, 0)
+        self.assertEqual((xParams, yParams), (self.xParams, self.yParams))
+        xParams, yParams = parseGeoTIFF.overviewParams(self.xParams, self.yParams, 2)
+        self.assertEqual((yParams[3], xParams[3]), self.overviews[2].shape)
+        # datapoint (0, 0) of level 2 is at the center of datapoints (0..3, 0..3)
+        self.assertAlmostEqual(xParams[0], self.xParams[0] + 1.5 * self.xParams[2])
+        self.assertAlmostEqual(yParams[0], self.yParams[0] + 1.5 * self.yParams[2])
+        self.assertAlmostEqual(xParams[2], 4 * self.xParams[2])
+
+    def test_overview_level_for(self):
+        self.assertEqual(parseGeoTIFF.overviewLevelFor(self.overviews, 720, 1080), 0)
+        self.assertEqual(parseGeoTIFF.overviewLevelFor(self.overviews, 480, 640), 1)
+        self.assertEqual(parseGeoTIFF.overviewLevelFor(self.overviews, 300, 500), 2)
+        self.assertEqual(parseGeoTIFF.overviewLevelFor(self.overviews, 0, 0), len(self.overviews) - 1)
+
+    def test_overview_engine_matches_dda(self):
+        pyramid = parseGeoTIFF.buildMaxPyramid(self.elevationData)
+        poses = [(41.801, 12.6483, 500, 315.0, 20.0),
+                 (41.9, 12.5, 1200, 45.0, 5.0),
+                 (41.85, 12.45, 400, 200.0, 60.0),
+                 (41.93, 12.58, 300, 100.0, 3.0)]
+        for pose in poses:
+            expected = getTarget.resolveTarget(*pose, self.elevationData, self.xParams, self.yParams, engine="dda")
+            for overviewPyramid in (None, pyramid):
+                actual = getTarget.resolveTarget(*pose, self.elevationData, self.xParams, self.yParams, engine="overview",
+                                                 pyramid=overviewPyramid, overviews=self.overviews)
+                self.assertIsNotNone(actual)
+                np.testing.assert_allclose(actual[:3], expected[:3], rtol=1e-9)
+        # level-ish shot towards the edge of the DEM never meets the terrain
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertIsNone(getTarget.resolveTarget(41.9, 12.5, 3000, 270.0, 1.0, self.elevationData, self.xParams, self.yParams,
+                                                      engine="overview", pyramid=pyramid, overviews=self.overviews))
+
+    def test_batch(self):
+        y, x = np.array([41.801, 41.9]), np.array([12.6483, 12.5])
+        z, azimuth, theta = np.array([500.0, 1200.0]), np.array([315.0, 45.0]), np.array([20.0, 5.0])
+        expected = getTarget.resolveTargetBatch(y, x, z, azimuth, theta, self.elevationData, self.xParams, self.yParams, engine="dda")
+        actual = getTarget.resolveTargetBatch(y, x, z, azimuth, theta, self.elevationData, self.xParams, self.yParams, engine="overview")
+        np.testing.assert_array_equal(actual["status"], expected["status"])
+        np.testing.assert_allclose(actual["finalDist"], expected["finalDist"], rtol=1e-9)
+
+class TestAltFromLatLonArray(unittest.TestCase):
+
+    def test_matches_decimal_lookup(self):
+        elevationData = np.array([[10, 20, 30, 40],
+                                  [15, 25, 35, 45],
+                                  [20, 30, 40, 50],
+                                  [25, 35, 45, 55]], dtype=np.int16)
+        xParams = (12.0, 12.004, 0.001, 4)
+        yParams = (42.0, 41.996, -0.001, 4)
+        lats = [41.9985, 41.9972, 41.9977, 41.998]
+        lons = [12.0012, 12.0027, 12.002, 12.0005]
+        actual = parseGeoTIFF.getAltFromLatLonArray(lats, lons, xParams, yParams, elevationData)
+        for i in range(len(lats)):
+            expected = parseGeoTIFF.getAltFromLatLon(lats[i], lons[i], xParams, yParams, elevationData)
+            self.assertAlmostEqual(actual[i], float(expected), places=6)
+
+    def test_datapoints_are_exact(self):
+        elevationData = np.array([[10.5, 20, 30, 40],
+                                  [15, 25, 35, 45],
+                                  [20, 30, 40, 50],
+                                  [25, 35, 45, 55.25]], dtype=np.float32)
+        xParams = (12.0, 12.004, 0.001, 4)
+        yParams = (42.0, 41.996, -0.001, 4)
+        for row in range(4):
+            for col in range(4):
+                lat, lon = 42.0 - row * 0.001, 12.0 + col * 0.001
+                u, v = parseGeoTIFF.latLonToIndex(lat, lon, xParams, yParams)
+                self.assertAlmostEqual(u, col)
+                self.assertAlmostEqual(v, row)
+                expected = float(elevationData[row][col])
+                self.assertEqual(parseGeoTIFF.getAltFromLatLon(lat, lon, xParams, yParams, elevationData), expected)
+                self.assertEqual(parseGeoTIFF.getAltFromLatLonArray(lat, lon, xParams, yParams, elevationData), expected)
+        # past the last row and column, up to the edge of the DEM
+        self.assertEqual(parseGeoTIFF.getAltFromLatLon(41.996, 12.004, xParams, yParams, elevationData), 55.25)
+
+    def test_uses_enclosing_cell(self):
+        elevationData = np.arange(16, dtype=np.int16).reshape(4, 4) * 10
+        xParams = (12.0, 12.004, 0.001, 4)
+        yParams = (42.0, 41.996, -0.001, 4)
+        # three quarters of the way from row 1 to row 2, between columns 1 and 2
+        lat, lon = 42.0 - 1.75 * 0.001, 12.0 + 1.5 * 0.001
+        for alt in (parseGeoTIFF.getAltFromLatLon(lat, lon, xParams, yParams, elevationData),
+                    parseGeoTIFF.getAltFromLatLonArray(lat, lon, xParams, yParams, elevationData)):
+            self.assertGreater(alt, 75)
+            self.assertLess(alt, 100)
+
+    def test_out_of_bounds_is_nan(self):
+        elevationData = np.zeros((4, 4), dtype=np.int16)
+        xParams = (12.0, 12.004, 0.001, 4)
+        yParams = (42.0, 41.996, -0.001, 4)
+        actual = parseGeoTIFF.getAltFromLatLonArray([42.5, 41.998], [12.002, 13.0], xParams, yParams, elevationData)
+        self.assertTrue(np.isnan(actual).all())
+
+class TestInterpolationKernels(unittest.TestCase):
+
+    def setUp(self):
+        # a plane, except for the spike at row 3, col 3
+        self.elevationData = np.array([[10, 20, 30, 40],
+                                       [15, 25, 35, 45],
+                                       [20, 30, 40, 50],
+                                       [25, 35, 45, 155]], dtype=np.int16)
+        self.xParams = (12.0, 12.003, 0.001, 4)
+        self.yParams = (42.0, 41.997, -0.001, 4)
+
+    def altAt(self, col, row, kernel):
+        lat, lon = 42.0 - np.asarray(row) * 0.001, 12.0 + np.asarray(col) * 0.001
+        return parseGeoTIFF.getAltFromLatLonArray(lat, lon, self.xParams, self.yParams, self.elevationData, kernel)
+
+    def test_datapoints_are_exact(self):
+        rows, cols = np.meshgrid(np.arange(4), np.arange(4), indexing='ij')
+        for kernel in parseGeoTIFF.KERNELS:
+            actual = self.altAt(cols.ravel(), rows.ravel(), kernel)
+            np.testing.assert_allclose(actual, self.elevationData.ravel(), atol=1e-9)
+            alt = parseGeoTIFF.getAltFromLatLon(42.0 - 0.002, 12.0 + 0.001, self.xParams, self.yParams, self.elevationData, kernel)
+            self.assertAlmostEqual(alt, 30.0)
+
+    def test_nearest(self):
+        self.assertEqual(self.altAt(1.4, 0.4, "nearest"), 20.0)
+        self.assertEqual(self.altAt(2.6, 2.6, "nearest"), 155.0)
+
+    def test_bilinear(self):
+        fu, fv = 0.3, 0.8
+        expected = (40 * (1 - fu) * (1 - fv) + 50 * fu * (1 - fv) + 45 * (1 - fu) * fv + 155 * fu * fv)
+        self.assertAlmostEqual(float(self.altAt(2 + fu, 2 + fv, "bilinear")), expected)
+
+    def test_plane_is_reproduced(self):
+        # away from the spike, bilinear is exact for the plane
+        col, row = np.array([1.25, 1.5, 1.75]), np.array([0.5, 1.25, 1.0])
+        np.testing.assert_allclose(self.altAt(col, row, "bilinear"), 10 + 10 * col + 5 * row)
+        # ...and so is bicubic, where all 16 datapoints are in the interior of the DEM
+        elevationData = np.add.outer(5.0 * np.arange(6), 10.0 * np.arange(6)) + 10
+        xParams, yParams = (12.0, 12.005, 0.001, 6), (42.0, 41.995, -0.001, 6)
+        col, row = np.array([2.25, 2.5, 1.75]), np.array([1.5, 2.25, 2.75])
+        actual = parseGeoTIFF.getAltFromLatLonArray(42.0 - row * 0.001, 12.0 + col * 0.001, xParams, yParams, elevationData, "bicubic")
+        np.testing.assert_allclose(actual, 10 + 10 * col + 5 * row)
+
+    def test_bicubic_pyramid_bounds_overshoot(self):
+        pyramid = parseGeoTIFF.buildMaxPyramid(self.elevationData, "bicubic")
+        u, v = np.meshgrid(np.linspace(0, 3, 61), np.linspace(0, 3, 61))
+        alt = self.altAt(u.ravel(), v.ravel(), "bicubic")
+        bound = pyramid[0][np.minimum(np.floor(v.ravel()).astype(int), 3), np.minimum(np.floor(u.ravel()).astype(int), 3)]
+        self.assertTrue((alt <= bound.astype(np.float64) + 1e-6).all())
+        # the bound of the default kernel is not enough, bicubic overshoots the spike's cell corners
+        corners = parseGeoTIFF.buildMaxPyramid(self.elevationData, "bilinear")
+        self.assertTrue((self.altAt(u.ravel(), v.ravel(), "bicubic") > corners[0][np.minimum(np.floor(v.ravel()).astype(int), 3), np.minimum(np.floor(u.ravel()).astype(int), 3)] + 1e-6).any())
+
+    def test_unknown_kernel(self):
+        self.assertIsNone(self.altAt(1.0, 1.0, "spline"))
+
+    def test_engines_share_bilinear_surface(self):
+        elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseGeoTIFF.getGeoFileFromString(DEM)
+        nrows, ncols = elevationData.shape
+        xParams = (x0, x0 + dx * ncols, dx, ncols)
+        yParams = (y0, y0 + dy * nrows, dy, nrows)
+        pose = (41.9, 12.5, 600, 45.0, 35.0)
+        adaptive = getTarget.resolveTarget(*pose, elevationData, xParams, yParams, engine="adaptive", kernel="bilinear")
+        dda = getTarget.resolveTarget(*pose, elevationData, xParams, yParams, engine="dda", kernel="bilinear")
+        self.assertAlmostEqual(adaptive[0], dda[0], delta=0.2)
+        for kernel in parseGeoTIFF.KERNELS:
+            pyramid = parseGeoTIFF.buildMaxPyramid(elevationData, kernel)
+            expected = getTarget.resolveTarget(*pose, elevationData, xParams, yParams, engine="float", kernel=kernel)
+            batch = getTarget.resolveTargetBatch(*pose, elevationData, xParams, yParams, engine="float", pyramid=pyramid, kernel=kernel)
+            self.assertAlmostEqual(float(batch["finalDist"]), expected[0], delta=1e-6)
+        self.assertIsNone(getTarget.resolveTarget(*pose, elevationData, xParams, yParams, kernel="spline"))
+
+class TestLazyDEM(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseGeoTIFF.getGeoFileFromString(DEM)
+        nrows, ncols = cls.elevationData.shape
+        cls.xParams = (x0, x0 + dx * ncols, dx, ncols)
+        cls.yParams = (y0, y0 + dy * nrows, dy, nrows)
+
+    def setUp(self):
+        # room for 3 of the 256x256 int16 tiles of the Rome DEM
+        self.cacheBytes = 3 * 256 * 256 * 2
+        self.lazy = lazyDEM.LazyDEM(GeoTiff(DEM).read(), cacheBytes=self.cacheBytes)
+
+    def test_indexing_matches_array(self):
+        self.assertEqual(self.lazy.shape, self.elevationData.shape)
+        self.assertEqual(self.lazy[700, 1070], self.elevationData[700, 1070])
+        self.assertEqual(self.lazy[-1, -1], self.elevationData[-1, -1])
+        np.testing.assert_array_equal(self.lazy[5], self.elevationData[5])
+        np.testing.assert_array_equal(self.lazy[:, 7], self.elevationData[:, 7])
+        np.testing.assert_array_equal(self.lazy[100:600:3, 1079:200:-7], self.elevationData[100:600:3, 1079:200:-7])
+        rng = np.random.default_rng(0)
+        rows, cols = rng.integers(0, 720, (50, 40)), rng.integers(0, 1080, (50, 40))
+        np.testing.assert_array_equal(self.lazy[rows, cols], self.elevationData[rows, cols])
+        np.testing.assert_array_equal(np.asarray(self.lazy), self.elevationData)
+        with self.assertRaises(IndexError):
+            self.lazy[720, 0]
+
+    def test_cache_stays_within_budget(self):
+        rng = np.random.default_rng(0)
+        for i in range(20):
+            self.lazy[rng.integers(0, 720, 100), rng.integers(0, 1080, 100)]
+            self.lazy[int(rng.integers(0, 720)), int(rng.integers(0, 1080))]
+            self.assertLessEqual(self.lazy.cache.cachedBytes, self.cacheBytes)
+        self.assertEqual(self.lazy.cache.cachedBytes, sum(tile.nbytes for tile in self.lazy.cache.tiles.values()))
+
+    def test_lookups_and_engines_match_array(self):
+        rng = np.random.default_rng(0)
+        lat = rng.uniform(self.yParams[1], self.yParams[0], 2000)
+        lon = rng.uniform(self.xParams[0], self.xParams[1], 2000)
+        for kernel in parseGeoTIFF.KERNELS:
+            np.testing.assert_array_equal(parseGeoTIFF.getAltFromLatLonArray(lat, lon, self.xParams, self.yParams, self.lazy, kernel),
+                                          parseGeoTIFF.getAltFromLatLonArray(lat, lon, self.xParams, self.yParams, self.elevationData, kernel))
+        pyramid = parseGeoTIFF.buildMaxPyramid(self.lazy, bandRows=100)
+        for expected, actual in zip(parseGeoTIFF.buildMaxPyramid(self.elevationData), pyramid):
+            np.testing.assert_array_equal(actual, expected)
+        pose = (41.9, 12.5, 600, 45.0, 35.0)
+        for engine in getTarget.ENGINES:
+            expected = getTarget.resolveTarget(*pose, self.elevationData, self.xParams, self.yParams, engine=engine, pyramid=pyramid)
+            actual = getTarget.resolveTarget(*pose, self.lazy, self.xParams, self.yParams, engine=engine, pyramid=pyramid)
+            self.assertEqual(actual, expected)
+
+    def test_large_dem_is_read_lazily(self):
+        limit = config.dem_in_memory_limit
+        try:
+            config.dem_in_memory_limit = 0
+            elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(DEM)
+        finally:
+            config.dem_in_memory_limit = limit
+        self.assertIsInstance(elevationData, lazyDEM.LazyDEM)
+        np.testing.assert_array_equal(elevationData[300:310, 400:410], self.elevationData[300:310, 400:410])
+
+    def test_pyramid_of_lazy_dem_is_not_in_memory(self):
+        with mock.patch.object(config, 'dem_in_memory_limit', 0), \
+             mock.patch.object(config, 'dem_cache_bytes', self.cacheBytes):
+            elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(DEM)
+        self.assertIsInstance(elevationData, lazyDEM.LazyDEM)
+        levelBytes = elevationData.size * np.dtype(np.float32).itemsize
+        # (as if the DEM were many times larger than a band)
+        with mock.patch.object(parseGeoTIFF, 'BAND_DATAPOINTS', 1 << 14):
+            tracemalloc.start()
+            try:
+                pyramid = parseGeoTIFF.buildMaxPyramid(elevationData)
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        self.assertLess(peak, levelBytes // 2)
+        self.assertIsInstance(pyramid[0], np.memmap)
+        for level in pyramid:
+            self.assertTrue(isinstance(level, np.memmap) or level.size <= 1 << 14)
+        for expected, actual in zip(parseGeoTIFF.buildMaxPyramid(self.elevationData), pyramid):
+            np.testing.assert_array_equal(actual, expected)
+
+    def test_uncompressed_dem_is_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'uncompressed.tif')
+            tifffile.imwrite(filename, self.elevationData)
+            elevationData = lazyDEM.openLazyDEM(None, filename)
+            self.assertIsInstance(elevationData, np.memmap)
+            np.testing.assert_array_equal(elevationData, self.elevationData)
+            del elevationData
+
+class TestDEMCatalog(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseGeoTIFF.getGeoFileFromString(DEM)
+        nrows, ncols = cls.elevationData.shape
+        cls.xParams = (x0, x0 + dx * ncols, dx, ncols)
+        cls.yParams = (y0, y0 + dy * nrows, dy, nrows)
+        cls.pyramid = parseGeoTIFF.buildMaxPyramid(cls.elevationData)
+        with tifffile.TiffFile(DEM) as tif:
+            geoKeys = [(tag.code, tag.dtype, tag.count, tag.value) for tag in tif.pages[0].tags.values()
+                       if tag.code in (34735, 34736, 34737)]
+        # the Rome DEM, cut into four GeoTIFF tiles (alternately compressed and not)
+        cls.directory = tempfile.TemporaryDirectory()
+        for i, (r0, r1, c0, c1) in enumerate([(0, 400, 0, 500), (0, 400, 500, 1080), (400, 720, 0, 500), (400, 720, 500, 1080)]):
+            geoTags = [(33550, 12, 3, (dx, -dy, 0.0)), (33922, 12, 6, (0.0, 0.0, 0.0, x0 + c0 * dx, y0 + r0 * dy, 0.0))]
+            tifffile.imwrite(os.path.join(cls.directory.name, f'tile{i}.tif'), cls.elevationData[r0:r1, c0:c1],
+                             extratags=geoTags + geoKeys,
+                             tile=(128, 128) if i % 2 == 0 else None, compression='zlib' if i % 2 == 0 else None)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_mosaic_matches_dem(self):
+        catalog, (x0, dx, dxdy, y0, dydx, dy) = parseGeoTIFF.getGeoFileFromString(self.directory.name)
+        self.assertIsInstance(catalog, demCatalog.DEMCatalog)
+        self.assertEqual(catalog.shape, self.elevationData.shape)
+        self.assertAlmostEqual(x0, self.xParams[0])
+        self.assertAlmostEqual(y0, self.yParams[0])
+        np.testing.assert_array_equal(np.asarray(catalog), self.elevationData)
+        rng = np.random.default_rng(0)
+        rows, cols = rng.integers(0, 720, 1000), rng.integers(0, 1080, 1000)
+        np.testing.assert_array_equal(catalog[rows, cols], self.elevationData[rows, cols])
+        self.assertEqual(catalog[399, 500], self.elevationData[399, 500])
+
+    def test_tile_selection(self):
+        catalog = demCatalog.DEMCatalog.fromDirectory(self.directory.name)
+        self.assertEqual(os.path.basename(catalog.tileAt(41.95, 12.4)), 'tile0.tif')
+        self.assertEqual(os.path.basename(catalog.tileAt(41.85, 12.6)), 'tile3.tif')
+        self.assertIsNone(catalog.tileAt(40.0, 12.0))
+        self.assertEqual(catalog.tilesIn(41.85, 12.4, 41.95, 12.6), [0, 1, 2, 3])
+        self.assertEqual(catalog.tilesIn(41.95, 12.6, 41.96, 12.61), [1])
+
+    def test_engines_cross_tile_seams(self):
+        catalog = demCatalog.DEMCatalog.fromDirectory(self.directory.name)
+        pyramid = parseGeoTIFF.buildMaxPyramid(catalog)
+        for expected, actual in zip(self.pyramid, pyramid):
+            np.testing.assert_array_equal(actual, expected)
+        # lines of sight starting in one tile, ending in another
+        poses = [(41.9, 12.5, 600, 45.0, 35.0), (41.801, 12.6483, 500, 315.0, 20.0), (41.93, 12.58, 300, 100.0, 12.0)]
+        for engine in ("float", "adaptive", "dda"):
+            for pose in poses:
+                expected = getTarget.resolveTarget(*pose, self.elevationData, self.xParams, self.yParams, engine=engine, pyramid=self.pyramid)
+                actual = getTarget.resolveTarget(*pose, catalog, catalog.xParams, catalog.yParams, engine=engine, pyramid=pyramid)
+                self.assertEqual(actual, expected)
+
+    def test_voids(self):
+        x0, x1, dx, ncols = self.xParams
+        y0, y1, dy, nrows = self.yParams
+        with tifffile.TiffFile(DEM) as tif:
+            geoKeys = [(tag.code, tag.dtype, tag.count, tag.value) for tag in tif.pages[0].tags.values()
+                       if tag.code in (34735, 34736, 34737)]
+        geoTags = [(33550, 12, 3, (dx, -dy, 0.0)), (33922, 12, 6, (0.0, 0.0, 0.0, x0, y0, 0.0))]
+        # a tile with two voids, only the first of which another tile covers
+        withVoids = np.array(self.elevationData[0:400], dtype=np.float32)
+        withVoids[100:110, 200:210] = -32768
+        withVoids[300:305, 700:710] = -32768
+        with tempfile.TemporaryDirectory() as directory:
+            tifffile.imwrite(os.path.join(directory, 'a.tif'), withVoids,
+                             extratags=geoTags + geoKeys + [(42113, 's', 0, '-32768')])
+            tifffile.imwrite(os.path.join(directory, 'b.tif'), self.elevationData[0:400, 0:500],
+                             extratags=geoTags + geoKeys)
+            catalog = demCatalog.DEMCatalog.fromDirectory(directory)
+            expected = np.array(self.elevationData[0:400], dtype=np.float32)
+            expected[300:305, 700:710] = np.nan
+            np.testing.assert_array_equal(np.asarray(catalog), expected)
+            np.testing.assert_array_equal(catalog[95:115, 195:215], expected[95:115, 195:215])
+            rows, cols = np.meshgrid(np.arange(295, 310), np.arange(695, 715), indexing='ij')
+            np.testing.assert_array_equal(catalog[rows, cols], expected[rows, cols])
+            self.assertEqual(catalog[105, 205], expected[105, 205])
+            self.assertTrue(np.isnan(catalog[302, 705]))
+
+    def test_shared_without_copy(self):
+        catalog = demCatalog.DEMCatalog.fromDirectory(self.directory.name)
+        with sharedDEM.SharedDEM(catalog, catalog.xParams, catalog.yParams) as shared:
+            self.assertEqual(shared.blocks["elevation"][0], "lazy")
+            self.assertIsNone(shared.segmentName)
+            worker = pickle.loads(pickle.dumps(shared)).attach()
+            self.assertIsInstance(worker.elevationData, demCatalog.DEMCatalog)
+            np.testing.assert_array_equal(np.asarray(worker.elevationData), self.elevationData)
+            worker.close()
+
+    def test_missing_tile_is_out_of_bounds(self):
+        filenames = [os.path.join(self.directory.name, f'tile{i}.tif') for i in range(3)]
+        catalog = demCatalog.DEMCatalog(filenames)
+        self.assertEqual(catalog.shape, self.elevationData.shape)
+        self.assertIsNone(parseGeoTIFF.getAltFromLatLon(41.85, 12.6, catalog.xParams, catalog.yParams, catalog))
+        alt = parseGeoTIFF.getAltFromLatLonArray([41.85, 41.95], [12.6, 12.4], catalog.xParams, catalog.yParams, catalog)
+        self.assertTrue(np.isnan(alt[0]))
+        self.assertAlmostEqual(alt[1], parseGeoTIFF.getAltFromLatLon(41.95, 12.4, self.xParams, self.yParams, self.elevationData))
+        # the line of sight runs from tile0 into the missing tile3
+        for engine in getTarget.ENGINES:
+            self.assertIsNone(getTarget.resolveTarget(41.9, 12.48, 2000, 135.0, 3.0, catalog, catalog.xParams, catalog.yParams, engine=engine))
+
+class TestDEMSidecar(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.geofilename = os.path.join(self.directory.name, 'Rome-30m-DEM.tif')
+        shutil.copy(DEM, self.geofilename)
+        self.elevationData, self.geoTransform = parseGeoTIFF.getGeoFileFromString(DEM)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def prepare(self):
+        pyramids = {"idw": parseGeoTIFF.buildMaxPyramid(self.elevationData, "idw")}
+        return demSidecar.writeSidecar(self.geofilename, self.elevationData, self.geoTransform, pyramids, bandRows=100)
+
+    def test_sidecar_is_loaded(self):
+        path = self.prepare()
+        self.assertTrue(os.path.isdir(path))
+        elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(self.geofilename)
+        self.assertIsInstance(elevationData, np.memmap)
+        np.testing.assert_array_equal(elevationData, self.elevationData)
+        np.testing.assert_allclose(geoTransform, self.geoTransform)
+        self.assertEqual(demSidecar.readHeader(self.geofilename)["nodata"], -32768.0)
+        # sidecar=False reads the GeoTIFF itself
+        elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(self.geofilename, sidecar=False)
+        self.assertNotIsInstance(elevationData, np.memmap)
+
+    def test_pyramid_is_loaded(self):
+        self.prepare()
+        elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(self.geofilename)
+        pyramid = parseGeoTIFF.buildMaxPyramid(elevationData, "bilinear")
+        self.assertIsInstance(pyramid[0], np.memmap)
+        for expected, actual in zip(parseGeoTIFF.buildMaxPyramid(self.elevationData), pyramid):
+            np.testing.assert_array_equal(actual, expected)
+        # not in the sidecar, built as usual
+        self.assertNotIsInstance(parseGeoTIFF.buildMaxPyramid(elevationData, "bicubic")[0], np.memmap)
+
+    def test_overviews_are_loaded(self):
+        overviews = parseGeoTIFF.buildOverviews(self.elevationData)
+        demSidecar.writeSidecar(self.geofilename, self.elevationData, self.geoTransform, overviews=overviews)
+        elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(self.geofilename)
+        loaded = parseGeoTIFF.buildOverviews(elevationData)
+        self.assertIs(loaded[0], elevationData)
+        self.assertIsInstance(loaded[1], np.memmap)
+        self.assertEqual(len(loaded), len(overviews))
+        for expected, actual in zip(overviews, loaded):
+            np.testing.assert_array_equal(actual, expected)
+
+    def test_stale_sidecar_is_ignored(self):
+        self.prepare()
+        stat = os.stat(self.geofilename)
+        os.utime(self.geofilename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(self.geofilename)
+        self.assertNotIsInstance(elevationData, np.memmap)
+        self.assertIn("out of date", stderr.getvalue())
+
+    def test_vertical_datum(self):
+        # geoid height (cm) linear in latitude and longitude
+        grid = os.path.join(self.directory.name, 'WW15MGH.DAC')
+        lat = 90.0 - 0.25 * np.arange(geoid.DAC_SHAPE[0])
+        lon = 0.25 * np.arange(geoid.DAC_SHAPE[1])
+        (lat[:, np.newaxis] * 100 + lon[np.newaxis, :] * 4).astype('>i2').tofile(grid)
+        x0, dx, dxdy, y0, dydx, dy = self.geoTransform
+        with mock.patch.multiple(config, geoid_grid=grid, dem_vertical_datum="EGM96", vertical_datum="WGS84"):
+            self.assertAlmostEqual(geoid.getGrid().undulation(np.array([41.8]), np.array([12.6]))[0], 41.8 + 12.6 * 0.04, places=9)
+            converted, geoTransform = parseGeoTIFF.getGeoFileFromString(self.geofilename)
+            for row, col in [(0, 0), (100, 700), (719, 1079)]:
+                expected = self.elevationData[row, col] + (y0 + row * dy) + (x0 + col * dx) * 0.04
+                self.assertAlmostEqual(float(converted[row, col]), expected, places=3)
+            # converted once, into the sidecar
+            demSidecar.writeSidecar(self.geofilename, converted, geoTransform)
+            self.assertEqual(demSidecar.readHeader(self.geofilename)["verticalDatum"], "WGS84")
+            elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(self.geofilename)
+            self.assertIsInstance(elevationData, np.memmap)
+            np.testing.assert_array_equal(elevationData, converted)
+            # a sidecar converted from another DEM datum is ignored
+            with mock.patch.object(config, 'dem_vertical_datum', "WGS84"), \
+                 contextlib.redirect_stderr(io.StringIO()) as stderr:
+                self.assertIsNone(demSidecar.readHeader(self.geofilename))
+            self.assertIn("dem_vertical_datum EGM96", stderr.getvalue())
+            # the same datums, unconverted
+            with mock.patch.object(config, 'dem_vertical_datum', "WGS84"):
+                elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(self.geofilename, sidecar=False)
+                np.testing.assert_array_equal(elevationData, self.elevationData)
+        # a sidecar of another vertical datum is ignored
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(self.geofilename)
+        self.assertNotIsInstance(elevationData, np.memmap)
+        np.testing.assert_array_equal(elevationData, self.elevationData)
+        self.assertIn("vertical_datum WGS84", stderr.getvalue())
+
+    def test_vertical_datum_of_lazy_dem(self):
+        limit = config.dem_in_memory_limit
+        try:
+            config.dem_in_memory_limit = 0
+            with mock.patch.multiple(config, dem_vertical_datum="WGS84", vertical_datum="EGM96"):
+                elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(DEM)
+        finally:
+            config.dem_in_memory_limit = limit
+        # converted into a temporary file, rather than into memory
+        self.assertIsInstance(elevationData, np.memmap)
+        self.assertEqual(elevationData.shape, self.elevationData.shape)
+
+# run in a worker process of TestSharedDEM
+def resolveWithSharedDEM(handle, pose):
+    return handle.resolveTarget(*pose, engine="dda")
+
+class TestSharedDEM(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseGeoTIFF.getGeoFileFromString(DEM)
+        nrows, ncols = cls.elevationData.shape
+        cls.xParams = (x0, x0 + dx * ncols, dx, ncols)
+        cls.yParams = (y0, y0 + dy * nrows, dy, nrows)
+        cls.pyramid = parseGeoTIFF.buildMaxPyramid(cls.elevationData)
+        cls.poses = [(41.801, 12.6483, 500, 315.0, 20.0),
+                     (41.9, 12.5, 1200, 45.0, 5.0)]
+
+    def expected(self, pose):
+        return getTarget.resolveTarget(*pose, self.elevationData, self.xParams, self.yParams, engine="dda", pyramid=self.pyramid)
+
+    def test_handle_is_attached_without_copy(self):
+        with sharedDEM.SharedDEM(self.elevationData, self.xParams, self.yParams, self.pyramid) as shared:
+            pickled = pickle.dumps(shared)
+            # only the description of the arrays
+            self.assertLess(len(pickled), 4096)
+            worker = pickle.loads(pickled).attach()
+            np.testing.assert_array_equal(worker.elevationData, self.elevationData)
+            self.assertFalse(worker.elevationData.flags.writeable)
+            self.assertEqual(len(worker.pyramid), len(self.pyramid))
+            for expected, actual in zip(self.pyramid, worker.pyramid):
+                np.testing.assert_array_equal(actual, expected)
+            for pose in self.poses:
+                self.assertEqual(worker.resolveTarget(*pose, engine="dda"), self.expected(pose))
+            worker.close()
+
+    def test_workers(self):
+        with sharedDEM.SharedDEM(self.elevationData, self.xParams, self.yParams, self.pyramid) as shared:
+            with multiprocessing.get_context("fork").Pool(2) as pool:
+                targets = pool.starmap(resolveWithSharedDEM, [(shared, pose) for pose in self.poses])
+        self.assertEqual(targets, [self.expected(pose) for pose in self.poses])
+
+    def test_unlink_without_new_mapping(self):
+        SharedMemory = sharedDEM.shared_memory.SharedMemory
+        segments = []
+        def opened(*args, **kwargs):
+            segments.append(SharedMemory(*args, **kwargs))
+            return segments[-1]
+        with mock.patch.object(sharedDEM.shared_memory, 'SharedMemory', side_effect=opened):
+            with sharedDEM.SharedDEM(self.elevationData, self.xParams, self.yParams):
+                pass
+            # unlinked through the segment created
+            self.assertEqual(len(segments), 1)
+            # closed before being unlinked, the segment is mapped again only to be unlinked
+            shared = sharedDEM.SharedDEM(self.elevationData, self.xParams, self.yParams)
+            shared.close()
+            shared.unlink()
+        self.assertEqual(len(segments), 3)
+        self.assertIsNone(segments[2].buf)
+        for segment in segments:
+            with self.assertRaises(FileNotFoundError):
+                SharedMemory(name=segment.name)
+
+    def test_from_geo_file(self):
+        # the "decimal" engine never uses the pyramid, so it isn't built
+        with mock.patch.object(config, 'engine', "decimal"), \
+             mock.patch.object(parseGeoTIFF, 'buildMaxPyramid', side_effect=AssertionError):
+            with sharedDEM.SharedDEM.fromGeoFile(DEM) as shared:
+                self.assertIsNone(shared.attach().pyramid)
+        with mock.patch.object(config, 'engine', "dda"):
+            with sharedDEM.SharedDEM.fromGeoFile(DEM) as shared:
+                self.assertEqual(len(shared.attach().pyramid), len(self.pyramid))
+                for pose in self.poses:
+                    self.assertEqual(shared.resolveTarget(*pose), self.expected(pose))
+
+    def test_lazy_dem_is_not_copied(self):
+        with mock.patch.object(config, 'dem_in_memory_limit', 0):
+            elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(DEM)
+            self.assertIsInstance(elevationData, lazyDEM.LazyDEM)
+            with mock.patch.object(parseGeoTIFF, 'BAND_DATAPOINTS', 1 << 14):
+                pyramid = parseGeoTIFF.buildMaxPyramid(elevationData)
+            with sharedDEM.SharedDEM(elevationData, self.xParams, self.yParams, pyramid) as shared:
+                self.assertEqual(shared.blocks["elevation"][:2], ("lazy", os.path.abspath(DEM)))
+                # the pyramid levels too large for memory are shared by their files
+                self.assertEqual(shared.blocks["pyramid-0"][:2], ("file", pyramid[0].filename))
+                worker = pickle.loads(pickle.dumps(shared)).attach()
+                self.assertIsInstance(worker.elevationData, lazyDEM.LazyDEM)
+                for pose in self.poses:
+                    self.assertEqual(worker.resolveTarget(*pose, engine="dda"), self.expected(pose))
+                worker.close()
+            # read lazily from something other processes can't open, and too large to copy
+            with self.assertRaises(ValueError):
+                sharedDEM.SharedDEM(lazyDEM.LazyDEM(GeoTiff(DEM).read()), self.xParams, self.yParams)
+
+    def test_for_workers(self):
+        with mock.patch.object(sharedDEM.multiprocessing, 'get_start_method', return_value="fork"):
+            dem = sharedDEM.forWorkers(self.elevationData, self.xParams, self.yParams, self.pyramid)
+        self.assertIsInstance(dem, sharedDEM.InheritedDEM)
+        self.assertIs(dem.attach().elevationData, self.elevationData)
+        with self.assertRaises(TypeError):
+            pickle.dumps(dem)
+        with mock.patch.object(sharedDEM.multiprocessing, 'get_start_method', return_value="spawn"):
+            with sharedDEM.forWorkers(self.elevationData, self.xParams, self.yParams, self.pyramid) as dem:
+                self.assertIsInstance(dem, sharedDEM.SharedDEM)
+                worker = pickle.loads(pickle.dumps(dem)).attach()
+                for pose in self.poses:
+                    self.assertEqual(worker.resolveTarget(*pose, engine="dda"), self.expected(pose))
+                worker.close()
+
+    def test_file_backed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'dem.shared')
+            with sharedDEM.SharedDEM(self.elevationData, self.xParams, self.yParams, path=path) as shared:
+                self.assertIsNone(shared.segmentName)
+                worker = pickle.loads(pickle.dumps(shared)).attach()
+                np.testing.assert_array_equal(worker.elevationData, self.elevationData)
+                self.assertIsNone(worker.pyramid)
+                worker.close()
+            self.assertFalse(os.path.exists(path))
+
+    def test_memory_mapped_file_is_not_copied(self):
+        with tempfile.TemporaryDirectory() as directory:
+            geofilename = os.path.join(directory, 'Rome-30m-DEM.tif')
+            shutil.copy(DEM, geofilename)
+            demSidecar.writeSidecar(geofilename, self.elevationData, (self.xParams[0], self.xParams[2], 0, self.yParams[0], 0, self.yParams[2]))
+            elevationData, geoTransform = parseGeoTIFF.getGeoFileFromString(geofilename)
+            with sharedDEM.SharedDEM(elevationData, self.xParams, self.yParams) as shared:
+                self.assertIsNone(shared.segmentName)
+                self.assertEqual(shared.blocks["elevation"][:2], ("file", os.path.abspath(elevationData.filename)))
+                worker = pickle.loads(pickle.dumps(shared)).attach()
+                np.testing.assert_array_equal(worker.elevationData, self.elevationData)
+                worker.close()
+            # the sidecar is left alone
+            self.assertTrue(os.path.exists(elevationData.filename))
+            del elevationData
+
+class TestStreamElevations(unittest.TestCase):
+
+    def setUp(self):
+        self.elevationData = np.array([[10, 20, 30, 40],
+                                       [15, 25, 35, 45],
+                                       [20, 30, 40, 50],
+                                       [25, 35, 45, 55]], dtype=np.int16)
+        self.xParams = (12.0, 12.004, 0.001, 4)
+        self.yParams = (42.0, 41.996, -0.001, 4)
+
+    def stream(self, text, fmt, chunkSize=2):
+        outfile = io.StringIO()
+        parseGeoTIFF.streamElevations(io.StringIO(text), outfile, fmt, self.xParams, self.yParams,
+                                      self.elevationData, chunkSize=chunkSize)
+        return outfile.getvalue().splitlines()
+
+    def test_csv_with_header(self):
+        lines = self.stream("id,lon,lat\na,12.001,41.999\nb,12.5,41.999\nc,12.002,oops\nd,12.003,41.997\n", "csv")
+        self.assertEqual(lines, ["id,lon,lat,elevation", "a,12.001,41.999,25.000", "b,12.5,41.999,",
+                                 "c,12.002,oops,", "d,12.003,41.997,55.000"])
+
+    def test_csv_without_header(self):
+        lines = self.stream("41.999,12.001\n41.997,12.003\n", "csv")
+        self.assertEqual(lines, ["41.999,12.001,25.000", "41.997,12.003,55.000"])
+
+    def test_ndjson(self):
+        text = '{"lat": 41.999, "lon": 12.001, "name": "a"}\n\n{"latitude": 41.997, "longitude": 12.003}\n{"lat": 50, "lon": 1}\n'
+        points = [json.loads(line) for line in self.stream(text, "ndjson")]
+        self.assertEqual(points, [{"lat": 41.999, "lon": 12.001, "name": "a", "elevation": 25.0},
+                                  {"latitude": 41.997, "longitude": 12.003, "elevation": 55.0},
+                                  {"lat": 50, "lon": 1, "elevation": None}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,774 @@
+import os
+import io
+import math
+import multiprocessing
+import contextlib
+import decimal
+import struct
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+from PIL import Image
+from PIL import ExifTags
+
+import numpy as np
+
+import config
+import dronePose
+import geoid
+import getTarget
+import imageWatcher
+import jpegMetadata
+import mgrsEncoder
+import parseImage
+import resultCache
+import sharedDEM
+import targetPipeline
+from WGS84_SK42_Translator import Translator
+from SK42_Gauss_Kruger import Projector
+
+DEM = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Rome-30m-DEM.tif')
+
+XMP_TEMPLATE = ('<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+                '<rdf:Description rdf:about="" xmlns:drone-dji="http://www.dji.com/drone-dji/1.0/"\n'
+                ' drone-dji:AbsoluteAltitude="{alt}"\n drone-dji:GpsLatitude="{lat}"\n drone-dji:GpsLongitude="{lon}"\n'
+                ' drone-dji:GimbalRollDegree="+0.00"\n drone-dji:GimbalYawDegree="{yaw}"\n drone-dji:GimbalPitchDegree="{pitch}"\n'
+                ' drone-dji:FlightRollDegree="+0.00"\n drone-dji:FlightYawDegree="{yaw}"\n drone-dji:FlightPitchDegree="+0.00"/>'
+                '</rdf:RDF></x:xmpmeta>')
+
+"""write a JPEG with the EXIF and XMP metadata of a DJI drone
+    and any other APP1 segment payloads given, just after the start of image marker
+"""
+def writeDJIImage(filename, lat, lon, alt, yaw, pitch, segments=(), size=16, dateTime="2022:06:01 12:00:00"):
+    exif = Image.Exif()
+    exif[0x010f] = "DJI" # Make
+    exif[0x0110] = "FC3170" # Model
+    exif[0x0132] = dateTime # DateTime
+    exif.get_ifd(0x8825)[2] = (41.0, 48.0, 3.6) # GPSLatitude
+    buffer = io.BytesIO()
+    Image.effect_noise((size, size), 64).convert("RGB").save(buffer, "JPEG", exif=exif.tobytes())
+    jpeg = buffer.getvalue()
+    xmp = b'http://ns.adobe.com/xap/1.0/\x00' + XMP_TEMPLATE.format(lat=lat, lon=lon, alt=alt, yaw=yaw, pitch=pitch).encode()
+    app1 = b''.join(b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload for payload in (xmp,) + tuple(segments))
+    with open(filename, 'wb') as f:
+        f.write(jpeg[:2] + app1 + jpeg[2:])
+
+# EXIF GPS tags of 41°48'3.6" N 12°38'53.88" E, 500 m
+GPS_EXIF = {"GPSInfo": {1: "N", 2: (41.0, 48.0, 3.6), 3: "E", 4: (12.0, 38.0, 53.88), 5: 0, 6: 500.0}}
+
+class TestDronePose(unittest.TestCase):
+
+    def parse(self, make, model, xmp_str, exifData=GPS_EXIF):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return dronePose.parsePose(dronePose.schemasFor(make, model), xmp_str, exifData)
+
+    def test_dji(self):
+        xmp_str = XMP_TEMPLATE.format(lat="41.80123456789", lon="+12.64834567", alt="+500.25", yaw="-45.5", pitch="-20.1")
+        pose = self.parse("DJI", "FC3170", xmp_str)
+        # values longer than 10 characters are read whole
+        self.assertEqual(pose, (41.80123456789, 12.64834567, 500.25, -45.5, 20.1, "EGM96"))
+        self.assertEqual(pose.datum, "EGM96")
+        pose = self.parse("DJI", "M3E", xmp_str.replace('/>', ' drone-dji:RtkFlag="50"/>'))
+        self.assertEqual(pose.datum, "WGS84")
+        self.assertIsNone(self.parse("DJI", "FC3170", xmp_str.replace('drone-dji:GpsLatitude', 'drone-dji:Latitude')))
+        self.assertIsNone(self.parse("DJI", "FC3170", XMP_TEMPLATE.format(lat=41.8, lon=12.6, alt=500, yaw=0.0, pitch=0.0)))
+
+    def test_skydio(self):
+        # orientation in several frames of reference with the same children, NED is used
+        xmp_str = ('<x:xmpmeta><rdf:RDF><rdf:Description rdf:about="" drone-skydio:AbsoluteAltitude="180.5">\n'
+                   '<drone-skydio:CameraOrientationFLU rdf:parseType="Resource">\n'
+                   '<drone-skydio:Pitch>5.0</drone-skydio:Pitch>\n<drone-skydio:Yaw>90.0</drone-skydio:Yaw>\n'
+                   '</drone-skydio:CameraOrientationFLU>\n'
+                   '<drone-skydio:CameraOrientationNED rdf:parseType="Resource">\n'
+                   '<drone-skydio:Pitch>-30.5</drone-skydio:Pitch>\n<drone-skydio:Roll>0.0</drone-skydio:Roll>\n'
+                   '<drone-skydio:Yaw>123.4</drone-skydio:Yaw>\n</drone-skydio:CameraOrientationNED>\n'
+                   '<drone-skydio:Latitude>41.8</drone-skydio:Latitude>\n'
+                   '<drone-skydio:Longitude>12.6</drone-skydio:Longitude>\n'
+                   '</rdf:Description></rdf:RDF></x:xmpmeta>')
+        self.assertEqual(self.parse("SKYDIO", "X2", xmp_str), (41.8, 12.6, 180.5, 123.4, 30.5, "EGM96"))
+        # older format, orientation as attributes
+        xmp_str = ('<rdf:Description drone-skydio:Latitude="41.8" drone-skydio:Longitude="12.6" drone-skydio:AbsoluteAltitude="180.5">'
+                   '<drone-skydio:CameraOrientationFLU drone-skydio:Pitch="5.0" drone-skydio:Roll="0.0" drone-skydio:Yaw="90.0"/>'
+                   '<drone-skydio:CameraOrientationNED drone-skydio:Pitch="-30.5" drone-skydio:Roll="0.0" drone-skydio:Yaw="123.4"/>'
+                   '</rdf:Description>')
+        self.assertEqual(self.parse("SKYDIO", "X2", xmp_str), (41.8, 12.6, 180.5, 123.4, 30.5, "EGM96"))
+
+    def test_autel(self):
+        # newer firmware, DJI-like tags with a typo
+        xmp_str = ('<rdf:Description rdf:about="DJI Meta Data" drone:AbsoluteAltitude="500.0" drone:GpsLatitude="41.8"'
+                   ' drone:GpsLongtitude="12.6" drone:GimbalYawDegree="10.0" drone:GimbalPitchDegree="-45.0"/>')
+        self.assertEqual(self.parse("AUTEL ROBOTICS", "XT705", xmp_str), (41.8, 12.6, 500.0, 10.0, 45.0, "WGS84"))
+        self.assertEqual(self.parse("AUTEL ROBOTICS", "XT705", xmp_str.replace("Longtitude", "Longitude"))[1], 12.6)
+        # older firmware, position from EXIF and camera pitch 0 is down
+        xmp_str = '<rdf:Description rdf:about="Autel Robotics Meta Data" Camera:Pitch="60.0" Camera:Yaw="200.0"/>'
+        pose = self.parse("AUTEL ROBOTICS", "XT701", xmp_str)
+        self.assertAlmostEqual(pose.y, 41.801)
+        self.assertAlmostEqual(pose.x, 12.6483)
+        self.assertEqual(pose[2:], (500.0, 200.0, 30.0, "EGM96"))
+        xmp_str = '<rdf:Description rdf:about="Autel Robotics Meta Data"><Camera:Pitch>60.0</Camera:Pitch><Camera:Yaw>200.0</Camera:Yaw></rdf:Description>'
+        self.assertEqual(self.parse("AUTEL ROBOTICS", "XT701", xmp_str)[2:], (500.0, 200.0, 30.0, "EGM96"))
+        self.assertIsNone(self.parse("AUTEL ROBOTICS", "XT701", '<rdf:Description rdf:about="Something Else" Camera:Pitch="60.0"/>'))
+
+    def test_parrot(self):
+        xmp_str = ('<rdf:Description rdf:about="" xmlns:drone-parrot="http://www.parrot.com/drone-parrot/1.0/">'
+                   '<drone-parrot:CameraPitchDegree>-25.0</drone-parrot:CameraPitchDegree>'
+                   '<drone-parrot:CameraYawDegree>-170.0</drone-parrot:CameraYawDegree></rdf:Description>')
+        pose = self.parse("PARROT", "ANAFI", xmp_str)
+        self.assertEqual(pose[2:], (500.0, -170.0, 25.0, "EGM96"))
+        pose = self.parse("PARROT", "ANAFI", xmp_str.replace('rdf:about=""', 'rdf:about="" drone-parrot:ModelId="anafiai"'))
+        self.assertEqual(pose.datum, "WGS84")
+        self.assertEqual(dronePose.schemasFor("PARROT", "DISCO"), [])
+        self.assertEqual(dronePose.schemasFor("ACME", "ANAFI"), [])
+
+    def test_unsupported(self):
+        xmp_str = XMP_TEMPLATE.format(lat=41.8, lon=12.6, alt=500, yaw=10.0, pitch=-20.0)
+        for make, model, message in (("ACME", "X1", "make ACME not compatible"), ("PARROT", "DISCO", "PARROT DISCO is not supported")):
+            err = io.StringIO()
+            with contextlib.redirect_stderr(err):
+                self.assertIsNone(parseImage.readPose("image.JPG", make, model, xmp_str, GPS_EXIF))
+            self.assertIn(message, err.getvalue())
+
+class TestJPEGMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'DJI_0001.JPG')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_matches_pil(self):
+        writeDJIImage(self.filename, 41.801, 12.6483, 500, 315.0, -20.0, size=256)
+        exifData, xmp_str = jpegMetadata.readJPEGMetadata(self.filename)
+        expected = {ExifTags.TAGS.get(tag, tag): value for tag, value in Image.open(self.filename)._getexif().items()}
+        self.assertEqual(exifData, expected)
+        self.assertEqual(exifData["Make"], "DJI")
+        self.assertEqual(exifData["GPSInfo"][2], (41.0, 48.0, 3.6))
+        self.assertTrue(xmp_str.startswith('<x:xmpmeta') and xmp_str.endswith('</x:xmpmeta>'))
+        self.assertEqual(dronePose.parsePose(dronePose.schemasFor("DJI", "FC3170"), xmp_str, exifData)[3:5], (315.0, 20.0))
+
+    def test_stops_at_start_of_scan(self):
+        writeDJIImage(self.filename, 41.801, 12.6483, 500, 315.0, -20.0, size=256)
+        with open(self.filename, 'rb') as f:
+            jpeg = f.read()
+        # cut the file just after the start of scan marker, the image data is never needed
+        with open(self.filename, 'wb') as f:
+            f.write(jpeg[:jpeg.find(b'\xff\xda') + 2])
+        exifData, xmp_str = jpegMetadata.readJPEGMetadata(self.filename)
+        self.assertEqual(exifData["Model"], "FC3170")
+        self.assertIn('drone-dji:GpsLatitude="41.801"', xmp_str)
+
+    def test_extended_xmp(self):
+        guid = b'0123456789ABCDEF0123456789ABCDEF'
+        extended = ('<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF><rdf:Description '
+                    'drone-example:Extended="' + 'x' * 1000 + '"/></rdf:RDF></x:xmpmeta>').encode()
+        header = b'http://ns.adobe.com/xmp/extension/\x00' + guid
+        chunks = [header + struct.pack('>II', len(extended), offset) + extended[offset:offset + 400] for offset in (800, 0, 400)]
+        writeDJIImage(self.filename, 41.801, 12.6483, 500, 315.0, -20.0, segments=chunks)
+        exifData, xmp_str = jpegMetadata.readJPEGMetadata(self.filename)
+        self.assertIn('drone-dji:GpsLatitude="41.801"', xmp_str)
+        self.assertTrue(xmp_str.endswith(extended.decode()))
+        # a missing chunk, the Extended XMP is left out
+        writeDJIImage(self.filename, 41.801, 12.6483, 500, 315.0, -20.0, segments=chunks[:2])
+        exifData, xmp_str = jpegMetadata.readJPEGMetadata(self.filename)
+        self.assertNotIn('drone-example:Extended', xmp_str)
+
+    def test_not_a_jpeg(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'not a JPEG')
+        with self.assertRaises(ValueError):
+            jpegMetadata.readJPEGMetadata(self.filename)
+        Image.new("RGB", (16, 16)).save(self.filename, "JPEG")
+        self.assertEqual(jpegMetadata.readJPEGMetadata(self.filename), (None, ""))
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.image = os.path.join(self.directory.name, 'DJI_0001.JPG')
+        writeDJIImage(self.image, 41.801, 12.6483, 500, 315.0, -20.0)
+        self.path = os.path.join(self.directory.name, 'cache', 'results.sqlite3')
+        patcher = mock.patch.object(config, 'result_cache', self.path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = resultCache.ResultCache.fromConfig(DEM)
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_store_and_lookup(self):
+        pose = dronePose.Pose(41.801, 12.6483, 550.5, 315.0, 20.0, "WGS84")
+        key = self.cache.fileKey(self.image)
+        self.assertIsNone(self.cache.lookup(key))
+        for engine, target in (("dda", (1234.5, 41.8, 12.6, 60.25, 59.5)),
+                               ("decimal", (decimal.Decimal('1234.56789012345678901234'), decimal.Decimal('41.8'),
+                                            decimal.Decimal('12.6'), None, decimal.Decimal('59.5')))):
+            with mock.patch.object(config, 'engine', engine):
+                result = resultCache.Result(pose, "DJI", "FC3170", "2022:06:01 12:00:00", target)
+                self.cache.store(key, result)
+                self.assertEqual(self.cache.lookup(key), result)
+                self.assertEqual([str(value) for value in self.cache.lookup(key).target], [str(value) for value in target])
+        # a result without a target
+        self.cache.store(key, result._replace(target=None))
+        self.assertIsNone(self.cache.lookup(key).target)
+
+        # results are kept apart by DEM and settings
+        with mock.patch.object(config, 'engine', 'overview'):
+            other = resultCache.ResultCache(self.path, resultCache.demFingerprint(DEM))
+        self.assertNotEqual(other.dem, self.cache.dem)
+        self.assertIsNone(other.lookup(key))
+        other.close()
+
+        # a changed image is processed again
+        with open(self.image, 'ab') as f:
+            f.write(b'\x00')
+        self.assertIsNone(self.cache.lookup(self.cache.fileKey(self.image)))
+        self.assertIsNone(self.cache.fileKey(self.image + '.missing'))
+
+    def test_headless_answered_from_cache(self):
+        elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseImage.getGeoFileFromString(DEM)
+        nrows, ncols = elevationData.shape
+        xParams = (x0, x0 + dx * ncols, dx, ncols)
+        yParams = (y0, y0 + dy * nrows, dy, nrows)
+        with mock.patch.object(config, 'engine', 'dda'):
+            cache = resultCache.ResultCache.fromConfig(DEM)
+            self.assertTrue(parseImage.headlessImage(self.image, elevationData, xParams, yParams, cache=cache))
+            with open(self.image + ".ATHENA") as f:
+                expected = f.read()
+            os.remove(self.image + ".ATHENA")
+            # the image is neither read nor resolved again
+            with mock.patch.object(jpegMetadata, 'readJPEGMetadata', side_effect=AssertionError), \
+                 mock.patch.object(parseImage, 'resolveTarget', side_effect=AssertionError):
+                self.assertTrue(parseImage.headlessImage(self.image, elevationData, xParams, yParams, cache=cache))
+            cache.close()
+        with open(self.image + ".ATHENA") as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_cot_sent_from_cache(self):
+        elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseImage.getGeoFileFromString(DEM)
+        nrows, ncols = elevationData.shape
+        xParams = (x0, x0 + dx * ncols, dx, ncols)
+        yParams = (y0, y0 + dy * nrows, dy, nrows)
+        with mock.patch.object(config, 'engine', 'dda'), \
+             mock.patch.object(getTarget, 'create_and_send_cot') as sendCoT:
+            cache = resultCache.ResultCache.fromConfig(DEM)
+            self.assertTrue(parseImage.headlessImage(self.image, elevationData, xParams, yParams, cache=cache))
+            self.assertEqual(sendCoT.call_count, 1)
+            # answered from the cache, and sent again
+            self.assertTrue(parseImage.headlessImage(self.image, elevationData, xParams, yParams, cache=cache))
+            cache.close()
+        self.assertEqual(sendCoT.call_count, 2)
+        self.assertEqual(sendCoT.call_args_list[1], sendCoT.call_args_list[0])
+
+    def test_shared_by_workers(self):
+        elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseImage.getGeoFileFromString(DEM)
+        nrows, ncols = elevationData.shape
+        xParams = (x0, x0 + dx * ncols, dx, ncols)
+        yParams = (y0, y0 + dy * nrows, dy, nrows)
+        images = [self.image]
+        for i in range(1, 3):
+            images.append(os.path.join(self.directory.name, f'DJI_{i + 1:04d}.JPG'))
+            writeDJIImage(images[-1], 41.801 + i / 100, 12.6483, 500, 315.0, -20.0)
+        with mock.patch.object(config, 'engine', 'dda'):
+            cache = resultCache.ResultCache.fromConfig(DEM)
+            written = parseImage.parseImagesHeadless(images, elevationData, xParams, yParams, None, None, 2, cache)
+            self.assertEqual(written, [True, True, True])
+            for image in images:
+                result = cache.lookup(cache.fileKey(image))
+                self.assertEqual((result.make, result.model, result.dateTime), ("DJI", "FC3170", "2022:06:01 12:00:00"))
+                self.assertIsNotNone(result.target)
+            cache.close()
+
+    def test_disabled(self):
+        with mock.patch.object(config, 'result_cache', None):
+            self.assertIsNone(resultCache.ResultCache.fromConfig(DEM))
+
+class TestImageWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.existing = os.path.join(self.directory.name, 'DJI_0001.JPG')
+        writeDJIImage(self.existing, 41.801, 12.6483, 500, 315.0, -20.0)
+        with open(os.path.join(self.directory.name, 'notes.txt'), 'w') as f:
+            f.write('not an image')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # the images reported within a few seconds, until expected are all reported
+    def waitForImages(self, watcher, expected):
+        images = []
+        deadline = time.time() + 5.0
+        while set(images) != set(expected) and time.time() < deadline:
+            images += watcher.newImages(timeout=0.1)
+        return images
+
+    def check_watcher(self, inotify):
+        with imageWatcher.ImageWatcher(self.directory.name, inotify=inotify, pollInterval=0.05) as watcher:
+            self.assertEqual(watcher.usesInotify, inotify)
+            # images already in the directory are reported by start()
+            self.assertEqual(watcher.newImages(), [self.existing])
+
+            # an image written in two parts is reported once it is whole
+            writeDJIImage(os.path.join(self.directory.name, 'whole.JPG'), 41.9, 12.5, 1200, 45.0, -5.0)
+            with open(os.path.join(self.directory.name, 'whole.JPG'), 'rb') as f:
+                jpeg = f.read()
+            partial = os.path.join(self.directory.name, 'DJI_0002.JPG')
+            with open(partial, 'wb') as f:
+                f.write(jpeg[:len(jpeg) // 2])
+            os.remove(os.path.join(self.directory.name, 'whole.JPG'))
+            time.sleep(0.3)
+            self.assertNotIn(partial, watcher.newImages())
+            with open(partial, 'ab') as f:
+                f.write(jpeg[len(jpeg) // 2:])
+
+            # and images in a new subdirectory, each reported once
+            os.mkdir(os.path.join(self.directory.name, 'sortie'))
+            nested = os.path.join(self.directory.name, 'sortie', 'DJI_0003.JPG')
+            writeDJIImage(nested, 41.85, 12.45, 400, 200.0, -60.0)
+            images = self.waitForImages(watcher, [partial, nested])
+            self.assertEqual(sorted(images), sorted([partial, nested]))
+            time.sleep(0.3)
+            self.assertEqual(watcher.newImages(), [])
+
+    def test_inotify(self):
+        if imageWatcher.openInotify() is None:
+            self.skipTest('inotify is not available')
+        self.check_watcher(inotify=True)
+
+    def test_polling(self):
+        self.check_watcher(inotify=False)
+
+    def test_inotify_completed_without_event(self):
+        if imageWatcher.openInotify() is None:
+            self.skipTest('inotify is not available')
+        with open(self.existing, 'rb') as f:
+            jpeg = f.read()
+        path = os.path.join(self.directory.name, 'DJI_0002.JPG')
+        with imageWatcher.ImageWatcher(self.directory.name, inotify=True, pollInterval=0.05) as watcher:
+            watcher.newImages()
+            writer = os.open(path, os.O_WRONLY | os.O_CREAT)
+            try:
+                os.write(writer, jpeg[:len(jpeg) // 2])
+                # closed while incomplete (the last event of the image), then completed by the first writer
+                os.close(os.open(path, os.O_WRONLY))
+                time.sleep(0.3)
+                self.assertEqual(watcher.newImages(), [])
+                os.write(writer, jpeg[len(jpeg) // 2:])
+                self.assertEqual(self.waitForImages(watcher, [path]), [path])
+            finally:
+                os.close(writer)
+
+    def test_complete_jpeg(self):
+        with open(self.existing, 'rb') as f:
+            jpeg = f.read()
+        self.assertTrue(jpegMetadata.isCompleteJPEG(self.existing))
+        with open(self.existing, 'wb') as f:
+            f.write(jpeg + b'\x00' * 100)
+        self.assertTrue(jpegMetadata.isCompleteJPEG(self.existing))
+        with open(self.existing, 'wb') as f:
+            f.write(jpeg[:-10])
+        self.assertFalse(jpegMetadata.isCompleteJPEG(self.existing))
+        self.assertFalse(jpegMetadata.isCompleteJPEG(os.path.join(self.directory.name, 'notes.txt')))
+
+    def test_capture_order(self):
+        keys = [targetPipeline.captureKey("2022:06:01 12:00:00", self.existing),
+                targetPipeline.captureKey("2022:06:01 12:00:01", self.existing),
+                targetPipeline.captureKey("2021:12:31 23:59:59", self.existing)]
+        # newest first
+        self.assertEqual(sorted(range(3), key=keys.__getitem__), [1, 0, 2])
+        os.utime(self.existing, (1000000000, 1000000000))
+        self.assertEqual(targetPipeline.captureKey(None, self.existing), -1000000000)
+
+class TestTargetPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.images = []
+        # written oldest first
+        for i, dateTime in enumerate(["2022:06:01 12:00:00", "2022:06:01 12:00:05", "2022:06:01 12:00:10"]):
+            self.images.append(os.path.join(self.directory.name, f'DJI_{i:04d}.JPG'))
+            writeDJIImage(self.images[-1], 41.801 + i / 100, 12.6483, 500, 315.0, -20.0, dateTime=dateTime)
+        self.broken = os.path.join(self.directory.name, 'broken.JPG')
+        Image.new("RGB", (16, 16)).save(self.broken, "JPEG")
+        elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseImage.getGeoFileFromString(DEM)
+        nrows, ncols = elevationData.shape
+        self.dem = (elevationData, (x0, x0 + dx * ncols, dx, ncols), (y0, y0 + dy * nrows, dy, nrows))
+        patcher = mock.patch.object(config, 'engine', 'dda')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # every image resolved by a pipeline, in the order resolved
+    def resolveAll(self, cache=None):
+        resolved = []
+        with targetPipeline.TargetPipeline(self.directory.name, *self.dem, cache=cache, jobs=1) as pipeline:
+            while True:
+                results = pipeline.results(wait=True)
+                if not results:
+                    break
+                resolved += results
+        return resolved
+
+    def test_newest_first(self):
+        resolved = self.resolveAll()
+        self.assertEqual(sorted(r.path for r in resolved), sorted(self.images + [self.broken]))
+        targets = [r for r in resolved if r.result is not None]
+        # one worker, so resolved in the order the images were taken from the queue
+        self.assertEqual([r.path for r in targets], self.images[::-1])
+        self.assertEqual([r.captureKey for r in targets], sorted(r.captureKey for r in targets))
+        for r in targets:
+            self.assertIsNotNone(r.result.target)
+            expected = parseImage.resolveTarget(*r.result.pose[:5], *self.dem)
+            self.assertEqual(r.result.target, expected)
+        broken = [r for r in resolved if r.path == self.broken][0]
+        self.assertIsNone(broken.result)
+        self.assertIn(f'ERROR with {self.broken}', broken.err)
+
+    def test_dem_not_copied(self):
+        if multiprocessing.get_start_method() != "fork":
+            self.skipTest('workers are not forked')
+        # forked workers inherit the DEM of this process, nothing is published
+        with mock.patch.object(sharedDEM, 'SharedDEM', side_effect=AssertionError):
+            resolved = self.resolveAll()
+        targets = [r for r in resolved if r.result is not None]
+        self.assertEqual(sorted(r.path for r in targets), sorted(self.images))
+        for r in targets:
+            self.assertEqual(r.result.target, parseImage.resolveTarget(*r.result.pose[:5], *self.dem))
+
+    def test_new_images(self):
+        with targetPipeline.TargetPipeline(self.directory.name, *self.dem, jobs=1) as pipeline:
+            resolved = []
+            while len(resolved) < 4:
+                resolved += pipeline.results(wait=True)
+            newest = os.path.join(self.directory.name, 'DJI_0010.JPG')
+            writeDJIImage(newest, 41.85, 12.45, 400, 200.0, -60.0, dateTime="2022:06:01 12:01:00")
+            deadline = time.time() + 10.0
+            while not resolved[4:] and time.time() < deadline:
+                resolved += pipeline.results()
+                time.sleep(0.05)
+            self.assertEqual([r.path for r in resolved[4:]], [newest])
+            self.assertIsNotNone(resolved[4].result.target)
+
+    def test_answered_from_cache(self):
+        with mock.patch.object(config, 'result_cache', os.path.join(self.directory.name, 'results.sqlite3')):
+            cache = resultCache.ResultCache.fromConfig(DEM)
+        first = {r.path: r.result for r in self.resolveAll(cache)}
+        with mock.patch.object(jpegMetadata, 'readJPEGMetadata', wraps=jpegMetadata.readJPEGMetadata) as reader, \
+             mock.patch.object(getTarget, 'create_and_send_cot') as sendCoT:
+            second = {r.path: r.result for r in self.resolveAll(cache)}
+        cache.close()
+        # the images with a result are neither read nor resolved again
+        self.assertEqual(reader.call_count, 1)
+        # but their targets are still sent as Cursor on Target
+        self.assertEqual(sendCoT.call_count, sum(1 for result in first.values()
+                                                 if result is not None and result.target is not None))
+        for image in self.images:
+            self.assertEqual(second[image], first[image])
+
+class TestGeoid(unittest.TestCase):
+
+    def test_transformer_cached(self):
+        transformer = geoid.getTransformer(geoid.EPSG_WGS84, geoid.EPSG_EGM96)
+        self.assertIs(geoid.getTransformer(geoid.EPSG_WGS84, geoid.EPSG_EGM96), transformer)
+        self.assertIsNot(geoid.getTransformer(geoid.EPSG_EGM96, geoid.EPSG_WGS84), transformer)
+
+    def test_scalar(self):
+        height = geoid.wgsToEGM(41.801, 12.6483, 500.0)
+        self.assertIsInstance(height, float)
+        self.assertEqual(geoid.wgsToEGM(decimal.Decimal("41.801"), decimal.Decimal("12.6483"), decimal.Decimal(500)), height)
+        self.assertAlmostEqual(geoid.egmToWGS(41.801, 12.6483, height), 500.0, places=6)
+
+    def test_batch_matches_scalar(self):
+        lats = [41.801, -33.9, 64.1, 0.0]
+        lons = [12.6483, 151.2, -21.9, 0.0]
+        heights = [500.0, 20.0, math.nan, -3.5]
+        batch = geoid.wgsToEGM(lats, lons, heights)
+        self.assertEqual(batch.shape, (4,))
+        for i in range(4):
+            expected = geoid.wgsToEGM(lats[i], lons[i], heights[i])
+            if math.isnan(expected):
+                self.assertTrue(math.isnan(batch[i]))
+            else:
+                self.assertEqual(batch[i], expected)
+        # the arguments are left as they were
+        self.assertEqual(heights[0], 500.0)
+
+    def test_broadcast(self):
+        heights = np.array([[0.0, 100.0], [200.0, 300.0]])
+        self.assertEqual(geoid.egmToWGS(41.801, 12.6483, heights).shape, (2, 2))
+        self.assertEqual(heights[1, 1], 300.0)
+
+class TestGeoidGrid(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # geoid height (cm) linear in latitude and longitude, interpolated exactly
+        lat = 90.0 - 0.25 * np.arange(721)
+        lon = 0.25 * np.arange(1440)
+        self.dac = os.path.join(self.directory.name, 'WW15MGH.DAC')
+        (lat[:, np.newaxis] * 100 + lon[np.newaxis, :] * 4).astype('>i2').tofile(self.dac)
+        patcher = mock.patch.object(config, 'geoid_grid', self.dac)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_bilinear(self):
+        self.assertAlmostEqual(geoid.wgsToEGM(41.801, 12.6483, 500.0), 500.0 - (41.801 + 12.6483 * 0.04), places=9)
+        heights = geoid.egmToWGS([41.801, -60.1, np.nan], [12.6483, 200.3, 10.0], 0.0)
+        np.testing.assert_allclose(heights[:2], [41.801 + 12.6483 * 0.04, -60.1 + 200.3 * 0.04])
+        self.assertTrue(np.isnan(heights[2]))
+        # west longitudes, and the poles
+        self.assertAlmostEqual(geoid.egmToWGS(10.0, -10.0, 0.0), 10.0 + 350.0 * 0.04, places=9)
+        self.assertAlmostEqual(geoid.egmToWGS(90.0, 20.0, 0.0), 90.0 + 20.0 * 0.04, places=9)
+        self.assertAlmostEqual(geoid.egmToWGS(-90.0, 20.0, 0.0), -90.0 + 20.0 * 0.04, places=9)
+
+    def test_gtx(self):
+        # 1 degree grid, rows south to north, with the 180 degree column repeated
+        gtx = os.path.join(self.directory.name, 'egm96.gtx')
+        lat = -90.0 + np.arange(181)
+        lon = -180.0 + np.arange(361)
+        header = np.array([(-90.0, -180.0, 1.0, 1.0, 181, 361)], dtype=geoid.GTX_HEADER)
+        with open(gtx, 'wb') as f:
+            f.write(header.tobytes())
+            f.write((lat[:, np.newaxis] + np.cos(np.radians(lon))[np.newaxis, :]).astype('>f4').tobytes())
+        with mock.patch.object(config, 'geoid_grid', gtx):
+            self.assertAlmostEqual(geoid.egmToWGS(41.5, 12.0, 0.0), 41.5 + math.cos(math.radians(12.0)), places=5)
+            # across the antimeridian
+            self.assertAlmostEqual(geoid.egmToWGS(0.0, 179.5, 0.0), geoid.egmToWGS(0.0, -180.5, 0.0), places=9)
+
+    def test_dem(self):
+        elevationData = np.array([[100.0, 200.0, np.nan], [300.0, 400.0, 500.0]], dtype=np.float32)
+        xParams = (12.0, 12.02, 0.01, 3)
+        yParams = (42.0, 41.98, -0.01, 2)
+        converted = geoid.demToWGS(elevationData, xParams, yParams, bandRows=1)
+        for row in range(2):
+            for col in range(3):
+                expected = geoid.egmToWGS(42.0 - 0.01 * row, 12.0 + 0.01 * col, float(elevationData[row, col]))
+                if math.isnan(expected):
+                    self.assertTrue(np.isnan(converted[row, col]))
+                else:
+                    self.assertAlmostEqual(float(converted[row, col]), expected, places=3)
+        np.testing.assert_allclose(geoid.demToEGM(converted, xParams, yParams), elevationData, rtol=1e-6)
+
+    def test_default_without_grid(self):
+        # nothing installed, converted by PROJ without a warning
+        with mock.patch.object(config, 'geoid_grid', None), \
+             mock.patch.object(geoid, 'GRID_DIRECTORY', self.directory.name), \
+             mock.patch.dict(geoid.grids, clear=True), \
+             contextlib.redirect_stderr(io.StringIO()) as stderr:
+            os.remove(self.dac)
+            self.assertIsNone(geoid.getGrid())
+        self.assertEqual(stderr.getvalue(), "")
+
+    def test_install(self):
+        import prepare_geoid
+        installed = tempfile.TemporaryDirectory()
+        self.addCleanup(installed.cleanup)
+        with mock.patch.object(config, 'geoid_grid', None), \
+             mock.patch.object(geoid, 'GRID_DIRECTORY', installed.name), \
+             mock.patch.dict(geoid.grids, clear=True):
+            # not EGM96
+            with self.assertRaises(ValueError):
+                prepare_geoid.installGrid(self.dac)
+            # truncated
+            truncated = os.path.join(self.directory.name, 'truncated.DAC')
+            with open(self.dac, 'rb') as f, open(truncated, 'wb') as g:
+                g.write(f.read(1000))
+            with self.assertRaises(ValueError):
+                prepare_geoid.installGrid(truncated)
+            self.assertEqual(os.listdir(installed.name), [])
+            # test points of the synthetic grid
+            points = tuple((lat, lon, lat + lon * 0.04) for lat, lon in ((41.8, 12.6), (-60.1, 200.3), (10.0, 350.0)))
+            with mock.patch.object(geoid, 'TEST_POINTS', points):
+                path = prepare_geoid.installGrid(self.dac)
+            self.assertEqual(path, os.path.join(installed.name, 'WW15MGH.DAC'))
+            self.assertAlmostEqual(geoid.egmToWGS(41.801, 12.6483, 0.0), 41.801 + 12.6483 * 0.04, places=9)
+
+    def test_vertical_datum(self):
+        xmp_str = XMP_TEMPLATE.format(lat=41.8, lon=12.6, alt=500, yaw=10.0, pitch=-20.0)
+        undulation = 41.8 + 12.6 * 0.04
+        # by default aircraft altitudes are WGS84, and the DEM is taken as is
+        pose = parseImage.readPose("image.JPG", "DJI", "FC3170", xmp_str, GPS_EXIF)
+        self.assertEqual(pose.datum, "WGS84")
+        self.assertAlmostEqual(pose.z, 500.0 + undulation, places=9)
+        egmAlt, egmTerrainAlt = parseImage.egmAltitudes(41.8, 12.6, pose.z, 450.0)
+        self.assertAlmostEqual(egmAlt, 500.0, places=9)
+        self.assertEqual(egmTerrainAlt, 450.0)
+        with mock.patch.object(config, 'vertical_datum', "EGM96"):
+            # nothing to convert, all EGM96
+            pose = parseImage.readPose("image.JPG", "DJI", "FC3170", xmp_str, GPS_EXIF)
+            self.assertEqual((pose.z, pose.datum), (500.0, "EGM96"))
+            self.assertEqual(parseImage.egmAltitudes(41.8, 12.6, 500.0, None)[0], 500.0)
+            self.assertTrue(math.isnan(parseImage.egmAltitudes(41.8, 12.6, 500.0, None)[1]))
+        with mock.patch.object(config, 'vertical_datum', "WGS84"):
+            egmAlt, egmTerrainAlt = parseImage.egmAltitudes(np.array([41.8]), np.array([12.6]), np.array([600.0]), np.array([550.0]))
+            np.testing.assert_allclose(egmAlt, [600.0 - undulation])
+            np.testing.assert_allclose(egmTerrainAlt, [550.0 - undulation])
+        with self.assertRaises(ValueError):
+            geoid.changeDatum(41.8, 12.6, 500.0, "EGM96", "NAVD88")
+
+    def test_missing_grid(self):
+        with mock.patch.object(config, 'geoid_grid', os.path.join(self.directory.name, 'missing.DAC')), \
+             contextlib.redirect_stderr(io.StringIO()) as stderr:
+            self.assertIsNone(geoid.getGrid())
+            self.assertIsNone(geoid.getGrid())
+        self.assertEqual(stderr.getvalue().count('WARNING: geoid grid'), 1)
+
+class TestSK42Translator(unittest.TestCase):
+
+    def test_matches_scalar(self):
+        rng = np.random.default_rng(0)
+        lat, lon, alt = rng.uniform(-80, 80, 200), rng.uniform(-180, 180, 200), rng.uniform(-100, 5000, 200)
+        sk42Lat, sk42Lon, sk42Alt = Translator.WGS84_SK42(lat, lon, alt)
+        self.assertEqual(sk42Lat.shape, (200,))
+        for i in range(200):
+            expectedLat = Translator.WGS84_SK42_Lat(lat[i], lon[i], alt[i])
+            expectedLon = Translator.WGS84_SK42_Long(lat[i], lon[i], alt[i])
+            self.assertAlmostEqual(sk42Lat[i], expectedLat, places=12)
+            self.assertAlmostEqual(sk42Lon[i], expectedLon, places=12)
+            # dH at the WGS84 point, rather than the SK42 point
+            self.assertAlmostEqual(sk42Alt[i], alt[i] - Translator.SK42_WGS84_Alt(expectedLat, expectedLon, 0.0), places=2)
+
+    def test_scalar(self):
+        sk42 = Translator.WGS84_SK42(41.801, 12.6483, 150.0)
+        self.assertTrue(all(isinstance(value, float) for value in sk42))
+        self.assertEqual(sk42, tuple(float(value[0]) for value in Translator.WGS84_SK42([41.801], [12.6483], 150.0)))
+
+class TestGaussKruger(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.lat, self.lon = rng.uniform(-80, 80, 500), rng.uniform(-180, 180, 500)
+
+    def test_matches_scalar(self):
+        zone, northing, easting = Projector.SK42_Gauss_Kruger_Array(self.lat, self.lon)
+        self.assertEqual(zone.shape, (500,))
+        for i in range(500):
+            expected = Projector.SK42_Gauss_Kruger(self.lat[i], self.lon[i])
+            self.assertEqual(zone[i], expected[0])
+            self.assertAlmostEqual(northing[i], expected[1], places=6)
+            self.assertAlmostEqual(easting[i], expected[2], places=6)
+        zone, northing, easting = Projector.SK42_Gauss_Kruger_Array(41.8, 12.6)
+        self.assertIsInstance(zone, int)
+        self.assertEqual((zone, northing, easting), Projector.SK42_Gauss_Kruger(41.8, 12.6))
+
+    def test_inverse(self):
+        lat, lon = Projector.Gauss_Kruger_SK42(*Projector.SK42_Gauss_Kruger_Array(self.lat, self.lon))
+        # within a millimeter
+        np.testing.assert_allclose(lat, self.lat, rtol=0, atol=1e-8)
+        np.testing.assert_allclose(lon, self.lon, rtol=0, atol=1e-8)
+        lat, lon = Projector.Gauss_Kruger_SK42(*Projector.SK42_Gauss_Kruger(-33.9, -70.6))
+        self.assertAlmostEqual(lat, -33.9, places=8)
+        self.assertAlmostEqual(lon, -70.6, places=8)
+
+class TestMGRSEncoder(unittest.TestCase):
+
+    def test_matches_mgrs(self):
+        rng = np.random.default_rng(0)
+        lat, lon = rng.uniform(-89.9, 89.9, 300), rng.uniform(-180, 180, 300)
+        m = mgrsEncoder.mgrs.MGRS()
+        for i, reference in enumerate(mgrsEncoder.encode(lat, lon)):
+            self.assertEqual(reference.mgrs, m.toMGRS(lat[i], lon[i]))
+            self.assertEqual(reference.mgrs10m, m.toMGRS(lat[i], lon[i], MGRSPrecision=4))
+            self.assertEqual(reference.mgrs100m, m.toMGRS(lat[i], lon[i], MGRSPrecision=3))
+            self.assertEqual(reference.gridZone + reference.square + reference.digits, reference.mgrs)
+
+    def test_split(self):
+        reference = mgrsEncoder.encodeOne(decimal.Decimal("41.807133"), 12.640073)
+        self.assertEqual(reference.mgrs, "33TUG0396131054")
+        self.assertEqual((reference.gridZone, reference.square, reference.digits), ("33T", "UG", "0396131054"))
+        self.assertEqual((reference.mgrs10m, reference.mgrs100m), ("33TUG03963105", "33TUG039310"))
+        # polar regions have no zone number
+        reference = mgrsEncoder.encodeOne(85.0, 10.0)
+        self.assertEqual((reference.gridZone, reference.square), ("Z", "AB"))
+        self.assertEqual(mgrsEncoder.truncate(reference.mgrs, 1), "ZAB95")
+
+    def test_invalid(self):
+        self.assertEqual(mgrsEncoder.encode([91.0, 41.8, math.nan], [0.0, 12.6, 0.0])[::2], [None, None])
+        with self.assertRaises(mgrsEncoder.mgrs.core.MGRSError):
+            mgrsEncoder.encodeOne(91.0, 0.0)
+
+class TestHeadlessParallel(unittest.TestCase):
+
+    def setUp(self):
+        # every image is processed, none answered from a result cache
+        patcher = mock.patch.object(config, 'result_cache', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = tempfile.TemporaryDirectory()
+        self.images = []
+        poses = [(41.801, 12.6483, 500, 315.0, -20.0),
+                 (41.9, 12.5, 1200, 45.0, -5.0),
+                 (41.85, 12.45, 400, 200.0, -60.0)]
+        for i, (lat, lon, alt, yaw, pitch) in enumerate(poses):
+            filename = os.path.join(self.directory.name, f'DJI_{i:04d}.JPG')
+            writeDJIImage(filename, lat, lon, alt, yaw, pitch)
+            self.images.append(filename)
+        # not an image at all
+        self.broken = os.path.join(self.directory.name, 'broken.JPG')
+        with open(self.broken, 'wb') as f:
+            f.write(b'not a JPEG')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_parseImage(self, *args):
+        with mock.patch.object(sys, 'argv', ['parseImage.py', DEM, *args]), \
+             contextlib.redirect_stdout(io.StringIO()) as stdout, contextlib.redirect_stderr(io.StringIO()) as stderr:
+            parseImage.parseImage()
+        return stdout.getvalue(), stderr.getvalue()
+
+    def athenaFiles(self):
+        results = {}
+        for image in self.images:
+            with open(image + ".ATHENA") as f:
+                results[image] = f.read()
+            os.remove(image + ".ATHENA")
+        return results
+
+    def test_matches_serial(self):
+        self.run_parseImage(*self.images)
+        expected = self.athenaFiles()
+        self.run_parseImage(*self.images, "--jobs", "2")
+        self.assertEqual(self.athenaFiles(), expected)
+
+    def test_errors_do_not_stop_batch(self):
+        images = [self.images[0], self.broken, self.images[1]]
+        stdout, stderr = self.run_parseImage(*images, "--jobs", "2")
+        self.assertIn(f'ERROR with filename {self.broken}', stderr)
+        self.assertTrue(os.path.exists(self.images[0] + ".ATHENA"))
+        self.assertTrue(os.path.exists(self.images[1] + ".ATHENA"))
+        self.assertFalse(os.path.exists(self.broken + ".ATHENA"))
+
+    def test_results_in_input_order(self):
+        elevationData, (x0, dx, dxdy, y0, dydx, dy) = parseImage.getGeoFileFromString(DEM)
+        nrows, ncols = elevationData.shape
+        xParams = (x0, x0 + dx * ncols, dx, ncols)
+        yParams = (y0, y0 + dy * nrows, dy, nrows)
+        images = [self.broken] + self.images
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            written = parseImage.parseImagesHeadless(images, elevationData, xParams, yParams, None, None, 3)
+        self.assertEqual(written, [False, True, True, True])
+        self.assertTrue(stderr.getvalue().startswith(f'ERROR with filename {self.broken}'))
+
+    def test_serial_errors_do_not_stop_batch(self):
+        stdout, stderr = self.run_parseImage(self.images[0], self.broken, self.images[1])
+        self.assertIn(f'ERROR with filename {self.broken}', stderr)
+        self.assertTrue(os.path.exists(self.images[0] + ".ATHENA"))
+        self.assertTrue(os.path.exists(self.images[1] + ".ATHENA"))
+        self.assertFalse(os.path.exists(self.broken + ".ATHENA"))
+
+    def test_bad_jobs(self):
+        with self.assertRaises(SystemExit):
+            self.run_parseImage(*self.images, "--jobs", "0")
+
+if __name__ == '__main__':
+    unittest.main()